@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# knob/button to instrument latency benchmark
+# drives scope.py's encoder banks and button_press with synthetic input
+# through panel_sim.py's emulated expanders, with scope_sim.py standing in for the scope,
+# and times each action from the input edge to its SCPI line reaching
+# the simulator
+#
+# usage: python3 bench_latency.py [--edges 400] [--rate 400] [--latency 0.002]
+#        --rate 0 feeds edges as fast as the handlers take them
+
+from argparse import ArgumentParser
+from time import monotonic
+from time import sleep
+
+import scope
+from hal import Simulated
+from panel_sim import PanelSimulator
+from scope_sim import ScopeSimulator
+
+
+def percentile(values, p):
+    if (not values):
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+class Bench:
+
+    def __init__(self, scope, sim, panel, edges, rate):
+        self.scope = scope
+        self.sim = sim
+        self.panel = panel
+        self.edges = edges
+        self.rate = rate
+        self.edge_time = 0
+        self.sent = False
+        self.events = []   # (edge time, handler return time, command sent) per action fired
+
+        # note which actions hand a command to the transport, a knob at
+        # its limit sends nothing and has no line to wait for
+        transport = scope.App.Transport
+        for name in ("send", "send_latest", "query"):
+            setattr(transport, name, self.watch(getattr(transport, name)))
+
+    def watch(self, func):
+        def watched(cmd):
+            self.sent = True
+            return func(cmd)
+        return watched
+
+    def record(self, func):
+        def recorded(*args):
+            self.sent = False
+            func(*args)
+            self.events.append((self.edge_time, monotonic(), self.sent))
+        return recorded
+
+    def run_encoder(self, name, bank, index, header):
+        encoder = bank.encoders[index]
+        # sample the way service_inputs does
+        update = bank.update_encoders
+        if (self.scope.BURST_ENCODER_READS):
+            for device in (self.scope.App.EncoderDevice0, self.scope.App.EncoderDevice1):
+                if (bank in (device.bank_a, device.bank_b)):
+                    update = device.update_encoders
+
+        encoder.cw_action = self.record(encoder.cw_action)
+        encoder.ccw_action = self.record(encoder.ccw_action)
+        self.events = []
+
+        log_start = len(self.sim.log)
+        period = 1 / self.rate if self.rate > 0 else 0
+        start = monotonic()
+        next_edge = start
+
+        for i in range(self.edges):
+            # sweep back and forth so scale/level knobs do not sit at a limit
+            block = (i // 32) % 2
+            if (period):
+                next_edge += period
+                while (monotonic() < next_edge):
+                    pass
+
+            self.edge_time = monotonic()
+            self.panel.rotate_encoder(bank, encoder, 1 if block == 0 else -1, 0)
+            update()
+            self.scope.App.Inputs.dispatch()
+
+        elapsed = monotonic() - start
+        self.report(name, header, log_start, elapsed)
+
+    def run_button(self, name, row, col, header, presses):
+        self.events = []
+        log_start = len(self.sim.log)
+        start = monotonic()
+        press = self.record(lambda: self.scope.button_press(row, col))
+        for i in range(presses):
+            self.edge_time = monotonic()
+            press()
+            sleep(0.005)
+        self.report(name, header, log_start, monotonic() - start)
+
+    def report(self, name, header, log_start, elapsed):
+        sleep(0.2)   # let held-back and in-flight commands land
+        lines = [t for t, line in self.sim.log[log_start:]
+                 if header is not None and line.split(b' ')[0].lstrip(b':').upper().startswith(header)]
+
+        handler = [(done - edge) * 1000 for edge, done, sent in self.events]
+        wire = []
+        j = 0
+        for edge, done, sent in self.events:
+            if (not sent):
+                continue
+            while (j < len(lines) and lines[j] < edge):
+                j += 1
+            if (j < len(lines)):
+                wire.append((lines[j] - edge) * 1000)
+
+        rate = len(self.events) / elapsed if elapsed > 0 else 0
+        print("{:14} {:6} {:6} {:9.1f} {:8.3f} {:8.3f} {:8.3f} {:8.3f} {:8.3f}".format(
+            name, len(self.events), len(lines), rate,
+            percentile(handler, 50), percentile(wire, 50), percentile(wire, 90),
+            percentile(wire, 99), max(wire) if wire else float("nan")))
+
+
+def main():
+    parser = ArgumentParser(description="knob/button to SCPI latency benchmark")
+    parser.add_argument("--edges", type=int, default=400, help="quadrature edges per knob")
+    parser.add_argument("--rate", type=float, default=400, help="edges per second, 0 for as fast as possible")
+    parser.add_argument("--presses", type=int, default=20, help="presses per button")
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated scope reply latency")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--stats", action="store_true", help="print the per header SCPI statistics at the end")
+    args = parser.parse_args()
+
+    sim = ScopeSimulator(port=0, latency=args.latency, jitter=args.jitter, autoscale_time=0.05).start()
+    panel = PanelSimulator()
+    scope.setup(Simulated(panel, sim))
+    scope.start_panel()
+
+    for channel in scope.App.Scope.channels:
+        channel.enable()
+    scope.App.Scope.Cursor.set_mode_manual()
+    scope.button_press(scope.R3, scope.C3)   # open the measure menu for the select knob
+
+    bench = Bench(scope, sim, panel, args.edges, args.rate)
+
+    print("{:14} {:>6} {:>6} {:>9} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        "control", "events", "lines", "events/s", "hdl p50", "wire p50", "p90", "p99", "max"))
+    print("{:14} {:>6} {:>6} {:>9} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        "", "", "", "", "ms", "ms", "ms", "ms", "ms"))
+
+    knobs = [
+        ("ch1 scale", scope.App.EncoderBank0A, 0, b'CHAN1:SCAL'),
+        ("ch1 offset", scope.App.EncoderBank0A, 1, b'CHAN1:OFFS'),
+        ("ch2 scale", scope.App.EncoderBank0A, 2, b'CHAN2:SCAL'),
+        ("ch2 offset", scope.App.EncoderBank0A, 3, b'CHAN2:OFFS'),
+        ("ch3 scale", scope.App.EncoderBank0B, 0, b'CHAN3:SCAL'),
+        ("ch3 offset", scope.App.EncoderBank0B, 1, b'CHAN3:OFFS'),
+        ("ch4 scale", scope.App.EncoderBank0B, 2, b'CHAN4:SCAL'),
+        ("ch4 offset", scope.App.EncoderBank0B, 3, b'CHAN4:OFFS'),
+        ("timebase", scope.App.EncoderBank1A, 0, b'TIM:SCAL'),
+        ("delay", scope.App.EncoderBank1A, 1, b'TIM:POS'),
+        ("select", scope.App.EncoderBank1A, 2, None),
+        ("cursor", scope.App.EncoderBank1B, 2, b'MARK:X1P'),
+        ("trigger", scope.App.EncoderBank1B, 3, b'TRIG:EDGE:LEV'),
+    ]
+    for name, bank, index, header in knobs:
+        bench.run_encoder(name, bank, index, header)
+
+    buttons = [
+        ("run/stop", scope.R1, scope.C5, b'OPER:COND'),
+        ("zero ch1 offs", scope.R6, scope.C3, b'CHAN1:OFFS'),
+        ("zero delay", scope.R1, scope.C4, b'TIM:POS'),
+        ("autoscale", scope.R2, scope.C4, b'AUTOSCALE'),
+    ]
+    for name, row, col, header in buttons:
+        bench.run_button(name, row, col, header, args.presses if name != "autoscale" else 3)
+
+    if (args.stats):
+        print()
+        print(scope.App.Stats.format())
+
+    scope.App.Transport.close()
+    sim.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# LCD redraw benchmark
+# scrolls the Measure menu to the bottom and back, drawing straight to an
+# emulated CharLCD, through lcd_frame.FrameBuffer, from the menus' cached
+# pages, and through the writer thread, and reports the commands sent, the time the handlers were held
+# up per step and, for the thread, the time until the display caught up
+#
+# usage: python3 bench_lcd.py [--char-time 0.0001] [--clear-time 0.002] [--step-time 0.005]
+
+from argparse import ArgumentParser
+from time import perf_counter
+from time import sleep
+
+import scope
+from hal import Backend
+from lcd_frame import FrameBuffer
+from panel_sim import LCD
+
+
+def scroll(menu, flush, step_time):
+    # returns the steps taken and the time spent in the handlers
+    menu.enable()
+    menu.display_menu()
+    flush()
+    steps = 0
+    busy = 0
+    for action in [menu.increment_cursor] * menu.max_index + [menu.decrement_cursor] * menu.max_index:
+        start = perf_counter()
+        action()
+        flush()
+        busy += perf_counter() - start
+        steps += 1
+        sleep(step_time)   # the knob's detent interval
+    return steps, busy
+
+
+def run(name, char_time, clear_time, step_time, buffered, cached, threaded):
+    scope.MENU_CACHE = cached
+    display = LCD(char_time=char_time, clear_time=clear_time)
+    frame = FrameBuffer(display) if buffered else None
+    scope.App.lcd = frame if buffered else display
+    menu = scope.Measure().Menu
+    writes = display.writes
+    if (threaded):
+        frame.start()
+    start = perf_counter()
+    steps, busy = scroll(menu, frame.flush if buffered else lambda: None, step_time)
+    if (threaded):
+        frame.drain()
+    shown = perf_counter() - start
+    print("{:12} {:6} {:9} {:8} {:8} {:9.3f} {:9.3f}".format(
+        name, steps, display.writes - writes, display.clears, frame.dropped if buffered else 0,
+        busy * 1000 / steps, shown * 1000))
+    return display.lines()
+
+
+def main():
+    parser = ArgumentParser(description="Measure menu scrolling, direct vs framebuffer")
+    parser.add_argument("--char-time", type=float, default=0.0001, help="seconds per character or cursor move")
+    parser.add_argument("--clear-time", type=float, default=0.002, help="seconds per clear")
+    parser.add_argument("--step-time", type=float, default=0.005, help="seconds between knob steps")
+    args = parser.parse_args()
+    scope.App = scope.FrontPanel(Backend())   # the menus alone, no panel or scope
+
+    print("{:12} {:>6} {:>9} {:>8} {:>8} {:>9} {:>9}".format(
+        "lcd", "steps", "commands", "clears", "dropped", "ms/step", "shown ms"))
+    direct = run("direct", args.char_time, args.clear_time, args.step_time, False, False, False)
+    for name, cached, threaded in (("framebuffer", False, False), ("cached pages", True, False),
+                                   ("lcd thread", True, True)):
+        screen = run(name, args.char_time, args.clear_time, args.step_time, True, cached, threaded)
+        if (screen != direct):
+            print("final screen differs from direct:")
+            print("\n".join(screen))
+
+if __name__ == "__main__":
+    main()
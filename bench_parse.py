@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# micro-benchmark of reply parsing, the reverse/slice/ascii_to_num idiom
+# scope.py used before scpi_parse against the scpi_parse functions
+#
+# usage: python3 bench_parse.py [repeats]
+
+from math import floor
+from sys import argv
+from timeit import timeit
+
+from scpi_parse import format_number
+from scpi_parse import parse_number
+from scpi_parse import reply_fields
+from scpi_parse import split_exponent
+
+SINGLE = b':CHAN1:OFFS?\r\n-1.25000E-03\r\n> '
+COMPOUND = (b':CHAN1:DISP?;:CHAN1:SCAL?;:CHAN1:OFFS?;:CHAN1:COUP?;:CHAN1:IMP?;:CHAN1:BWL?;:CHAN1:INV?\r\n'
+            b'1;+5.00000E-01;-1.25000E-03;DC;ONEM;0;0\r\n> ')
+
+
+# the previous implementation, kept here as the baseline
+def ascii_to_num(txt):
+    sign = 1 if txt[0] == 43 else -1
+
+    try:
+        decimal = txt.index(b'.')
+        mult = 10 ** max(0,decimal - 2)
+
+    except ValueError:
+        mult = 10 ** (len(txt)-2)
+        pass
+
+    num = 0
+    for x in txt:
+        if (x == 43 or x == 45 or x == 46):
+            continue
+        else:
+            num += mult * (x-48)
+            mult = mult / 10
+    return num * sign
+
+def num_to_ascii(num, is_integer):
+    sign = b'+' if num >= 0 else b'-'
+    if is_integer:
+        return sign + str(abs(floor(num))).encode()
+    else:
+        return sign + str(num).encode()
+
+def legacy_value(reply):
+    reply = reply[::-1]
+    reply = reply[4:]
+    start = reply.index(b'\n')
+    reply = reply[:start]
+    reply = reply[::-1]
+    return reply
+
+def legacy_single(reply):
+    reply = legacy_value(reply)
+    base_end = reply.index(b'E')
+    base = ascii_to_num(reply[:base_end])
+    exp = ascii_to_num(reply[base_end+1:])
+    return base * 10 ** exp
+
+def legacy_compound(reply):
+    # one query per value, as Channel.get_state used to do
+    values = legacy_value(reply).split(b';')
+    scale = values[1]
+    num_end = scale.index(b'E')
+    scale = ascii_to_num(scale[:num_end]) * 10 ** ascii_to_num(scale[num_end+1:])
+    offset = values[2]
+    num_end = offset.index(b'E')
+    offset = ascii_to_num(offset[:num_end]) * 10 ** ascii_to_num(offset[num_end+1:])
+    return [values[0][0:1] == b'1', scale, offset, values[3], values[4],
+            values[5][0:1] == b'1', values[6][0:1] == b'1']
+
+def new_single(reply):
+    return parse_number(reply_fields(reply)[0])
+
+def new_compound(reply):
+    fields = reply_fields(reply)
+    return [fields[0][0:1] == b'1', parse_number(fields[1]), parse_number(fields[2]),
+            bytes(fields[3]), bytes(fields[4]), fields[5][0:1] == b'1', fields[6][0:1] == b'1']
+
+def legacy_format():
+    return num_to_ascii(5.0, False) + b'E' + num_to_ascii(-3, True)
+
+def new_format():
+    return format_number(5.0, False) + b'E' + format_number(-3, True)
+
+
+def drift():
+    # values that cannot be represented exactly show where the digit loop drifts
+    samples = [b'+2.50000E-03', b'-1.25000E-03', b'+1.00000E-09', b'+3.33333E+00', b'+7.00000E-01']
+    for txt in samples:
+        base, exp = split_exponent(memoryview(txt))
+        legacy = ascii_to_num(bytes(base)) * 10 ** ascii_to_num(bytes(exp))
+        print("  {:14} literal {!r:24} legacy {!r:24} new {!r}".format(
+            txt.decode(), float(txt), legacy, parse_number(txt)))
+
+def main():
+    repeats = int(argv[1]) if len(argv) > 1 else 100000
+
+    cases = [
+        ("single NR3 reply", lambda: legacy_single(SINGLE), lambda: new_single(SINGLE)),
+        ("7 field compound", lambda: legacy_compound(COMPOUND), lambda: new_compound(COMPOUND)),
+        ("format scale", legacy_format, new_format),
+    ]
+
+    print("{:20} {:>12} {:>12} {:>8}".format("case", "legacy us", "new us", "speedup"))
+    for name, legacy, new in cases:
+        legacy_us = timeit(legacy, number=repeats) / repeats * 1e6
+        new_us = timeit(new, number=repeats) / repeats * 1e6
+        print("{:20} {:12.3f} {:12.3f} {:7.2f}x".format(name, legacy_us, new_us, legacy_us / new_us))
+
+    print("drift:")
+    drift()
+
+if __name__ == "__main__":
+    main()
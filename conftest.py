@@ -0,0 +1,52 @@
+# Fixtures for the tests
+# the application is built once on panel_sim.py's expanders and a local
+# scope_sim.py, with a clock the tests move on by hand so debouncing and
+# queue ages do not depend on how fast the machine is
+
+import pytest
+
+import scope
+from hal import Simulated
+from panel_sim import PanelSimulator
+from scope_sim import ScopeSimulator
+
+
+class StepClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture(scope="session")
+def clock():
+    return StepClock()
+
+
+@pytest.fixture(scope="session")
+def panel(clock):
+    sim = ScopeSimulator(port=0, latency=0).start()
+    panel = PanelSimulator()
+    backend = Simulated(panel, sim)
+    backend.clock = clock
+    scope.setup(backend)
+    scope.start_panel()
+    yield panel
+    scope.App.Transport.close()
+    sim.stop()
+
+
+def take_inputs():
+    # what the input path queued for the main thread, without running it
+    inputs = scope.App.Inputs
+    taken = []
+    while (inputs.tail != inputs.head):
+        stamp, control, a, b = inputs.slots[inputs.tail % inputs.size]
+        inputs.tail += 1
+        taken.append((control, a, b))
+    return taken
@@ -0,0 +1,120 @@
+# Hardware backends for scope.py
+# setup() in scope.py asks its backend for every pin, the SPI handles, the
+# LCD and the connection to the scope, so importing scope.py touches none
+# of them; Hardware is the panel on the Pi, Simulated runs the same code
+# against panel_sim.py and scope_sim.py on any machine
+#
+# SCOPE_BACKEND=hardware|simulated picks one when scope.py is run directly,
+# SCOPE_TRACE=<file> wraps it in scope_trace.Recording
+
+from os import environ
+from time import monotonic
+
+
+class Backend:
+    # what every backend shares; on its own it gives the clock and sampler
+    # for building menus and the model without a panel
+    recorder = None   # scope_trace.TraceRecorder handed every SPI transfer, or None
+
+    def clock(self):
+        # every time read on the input path goes through this
+        return monotonic()
+
+    def sampled(self, func):
+        # wraps the function that samples the panel
+        return func
+
+    def connect(self, remote_ip, port):
+        # scpi brings in asyncio, so it is only imported once there is a scope to talk to
+        from scpi import open_socket
+        return open_socket(remote_ip, port)
+
+    def transport(self, sock, queue_size, coalesce_interval, stats):
+        from scpi import ScpiTransport
+        return ScpiTransport(sock, queue_size, coalesce_interval, stats, self.recorder)
+
+    def cleanup(self):
+        return
+
+
+class Hardware(Backend):
+
+    def __init__(self):
+        # these only import on the Pi
+        import gpiozero
+        import spidev
+        import RPi.GPIO as GPIO
+        from RPLCD.gpio import CharLCD
+
+        self.gpiozero = gpiozero
+        self.spidev = spidev
+        self.GPIO = GPIO
+        self.CharLCD = CharLCD
+
+    def input(self, pin, pull_up=False):
+        return self.gpiozero.DigitalInputDevice(pin, pull_up=pull_up)
+
+    def output(self, pin, active_high=True):
+        return self.gpiozero.DigitalOutputDevice(pin, active_high=active_high)
+
+    def pwm(self, pin):
+        return self.gpiozero.PWMOutputDevice(pin)
+
+    def lcd(self, **kwargs):
+        return self.CharLCD(numbering_mode=self.GPIO.BCM, **kwargs)
+
+    def spi(self):
+        return self.spidev.SpiDev()
+
+    def address(self):
+        # SCOPE_IP/SCOPE_PORT can point this at scope_sim.py instead
+        return environ.get("SCOPE_IP", "169.254.254.254"), int(environ.get("SCOPE_PORT", 5024))
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+
+class Simulated(Backend):
+    # an emulated panel, and a local scope_sim.py unless one is passed in
+
+    def __init__(self, panel=None, sim=None):
+        from panel_sim import PanelSimulator
+        from scope_sim import ScopeSimulator
+
+        self.panel = panel if panel is not None else PanelSimulator()
+        self.sim = sim if sim is not None else ScopeSimulator(port=0).start()
+
+    def input(self, pin, pull_up=False):
+        return self.panel.input_pin(pin)
+
+    def output(self, pin, active_high=True):
+        return self.panel.output_pin(pin)
+
+    def pwm(self, pin):
+        return self.panel.output_pin(pin)
+
+    def lcd(self, **kwargs):
+        return self.panel.new_lcd(**kwargs)
+
+    def spi(self):
+        return self.panel.new_spidev()
+
+    def address(self):
+        return self.sim.host, self.sim.port
+
+
+BACKENDS = {"hardware": Hardware, "simulated": Simulated}
+
+
+def open_backend(name=None):
+    if (name is None):
+        name = environ.get("SCOPE_BACKEND", "hardware")
+    return traced(BACKENDS[name]())
+
+
+def traced(backend):
+    # SCOPE_TRACE=<file> records the session for scope_trace.py to replay
+    if (environ.get("SCOPE_TRACE")):
+        from scope_trace import Recording
+        return Recording(backend, environ["SCOPE_TRACE"])
+    return backend
@@ -0,0 +1,163 @@
+# Shadow framebuffer for the 20x4 character LCD
+# menus draw into it with the same calls they would make on a CharLCD,
+# and flush() sends only the cells that differ from what the display
+# already shows; every HD44780 command is a slow 4-bit GPIO transfer and
+# clear() alone takes milliseconds, so a redraw that changes one column
+# costs a few commands instead of a clear and 80 characters
+#
+# once start() is called the display is written from its own thread:
+# flush() only hands over a copy of the frame, and a frame still waiting
+# when a newer one arrives is dropped, so drawing never holds up the
+# input handlers and the display catches up to the latest state
+
+from threading import Condition
+from threading import Thread
+
+GAP = 1   # unchanged cells written through rather than moving the cursor past them
+
+
+class FrameBuffer:
+
+    def __init__(self, lcd, cols=20, rows=4):
+        self.lcd = lcd
+        self.cols = cols
+        self.rows = rows
+        self.cells = [[' '] * cols for row in range(rows)]   # what the menus drew
+        self.shown = [[' '] * cols for row in range(rows)]   # what the display holds
+        self.published = [[' '] * cols for row in range(rows)]   # last frame flushed
+        self.row = 0
+        self.col = 0
+        self.commands = 0   # cursor moves and characters sent to the display
+        self.frames = 0     # frames drawn
+        self.dropped = 0    # frames replaced before they were drawn
+        self.pending = None # latest frame for the writer thread
+        self.drawing = False
+        self.changed = Condition()
+        self.writer = None
+        lcd.clear()
+
+    @property
+    def cursor_pos(self):
+        return (self.row, self.col)
+
+    @cursor_pos.setter
+    def cursor_pos(self, pos):
+        self.row, self.col = pos
+
+    def put(self, char):
+        if (self.row < self.rows and self.col < self.cols):
+            self.cells[self.row][self.col] = char
+        self.col += 1
+
+    def clear(self):
+        for row in self.cells:
+            row[:] = [' '] * self.cols
+        self.row = 0
+        self.col = 0
+
+    def blit(self, page):
+        # replaces the frame with a pre-rendered one, rows of cells as
+        # clear() and then drawing them would leave it
+        for row, cells in zip(self.cells, page):
+            row[:] = cells
+        self.row = 0
+        self.col = 0
+
+    def write_string(self, value):
+        # newlines as CharLCD handles them with auto_linebreaks off
+        for char in value:
+            if (char == '\r'):
+                self.col = 0
+            elif (char == '\n'):
+                self.row += 1
+            else:
+                self.put(char)
+
+    def write(self, value):
+        # a character code, e.g. one of the custom characters
+        self.put(value)
+
+    def crlf(self):
+        self.row += 1
+        self.col = 0
+
+    def create_char(self, location, bitmap):
+        self.lcd.create_char(location, bitmap)
+
+    def changes(self, frame, row):
+        # (start, end) runs of changed cells, close runs merged
+        runs = []
+        if (frame[row] == self.shown[row]):
+            return runs
+        for col in range(self.cols):
+            if (frame[row][col] != self.shown[row][col]):
+                if (runs and col - runs[-1][1] <= GAP):
+                    runs[-1][1] = col + 1
+                else:
+                    runs.append([col, col + 1])
+        return runs
+
+    def draw(self, frame):
+        # the display's address counter advances after each character but
+        # the rows are not contiguous, so each run starts with a cursor move
+        # unless it carries on from the last one
+        position = None
+        for row in range(self.rows):
+            for start, end in self.changes(frame, row):
+                if (position != (row, start)):
+                    self.lcd.cursor_pos = (row, start)
+                    self.commands += 1
+                for col in range(start, end):
+                    char = frame[row][col]
+                    if (isinstance(char, int)):
+                        self.lcd.write(char)
+                    else:
+                        self.lcd.write_string(char)
+                    self.shown[row][col] = char
+                self.commands += end - start
+                position = (row, end)
+        self.frames += 1
+
+    def flush(self):
+        if (self.cells == self.published):
+            return
+        frame = [row[:] for row in self.cells]
+        self.published = frame
+        if (self.writer is None):
+            self.draw(frame)
+            return
+
+        with self.changed:
+            if (self.pending is not None):
+                self.dropped += 1
+            self.pending = frame
+            self.changed.notify_all()
+
+    def start(self):
+        self.writer = Thread(target=self.run, name="lcd", daemon=True)
+        self.writer.start()
+
+    def run(self):
+        while (True):
+            with self.changed:
+                while (self.pending is None):
+                    self.changed.wait()
+                frame = self.pending
+                self.pending = None
+                self.drawing = True
+
+            self.draw(frame)
+
+            with self.changed:
+                self.drawing = False
+                self.changed.notify_all()
+
+    def drain(self):
+        # waits until the last frame flushed is on the display
+        with self.changed:
+            while (self.pending is not None or self.drawing):
+                self.changed.wait()
+
+    def report(self):
+        return ("lcd: " + str(self.frames) + " frames drawn, " + str(self.dropped) + " dropped, "
+                + str(self.commands) + " commands\n")
@@ -0,0 +1,67 @@
+# SPI access to the MCP23S17 I/O expanders on the front panel
+# each chip select gets one spidev handle, opened and configured once,
+# instead of open/configure/close around every transfer
+
+WRITE = 0x40   # opcodes with the hardware address pins at 0
+READ = 0x41
+
+SELECTED = 0x80   # added to the chip select in traces for chips with their own select line
+
+
+class SpiBus:
+
+    def __init__(self, bus, mode, speed, new_device, recorder=None):
+        self.bus = bus
+        self.mode = mode
+        self.speed = speed
+        self.new_device = new_device   # spidev.SpiDev or a stand-in from the backend
+        self.handles = {}
+        self.recorder = recorder       # TraceRecorder from scope_trace.py, given every transfer
+
+    def device(self, cs):
+        handle = self.handles.get(cs)
+        if (handle is None):
+            handle = self.new_device()
+            handle.open(self.bus, cs)
+            handle.mode = self.mode
+            handle.max_speed_hz = self.speed
+            self.handles[cs] = handle
+        return handle
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+
+class MCP23S17:
+
+    def __init__(self, bus, device, select=None):
+        self.bus = bus
+        self.device = device
+        self.select = select   # output driven around transfers when the chip has its own select line
+
+    def transfer(self, data):
+        spi = self.bus.device(self.device)
+        if (self.select is None):
+            reply = spi.xfer2(data)
+        else:
+            self.select.on()
+            try:
+                reply = spi.xfer2(data)
+            finally:
+                self.select.off()
+
+        if (self.bus.recorder is not None):
+            self.bus.recorder.spi(self.device | (SELECTED if self.select is not None else 0), data, reply)
+        return reply
+
+    def write(self, reg, value):
+        self.transfer([WRITE, reg, value & 0xFF])
+
+    def read(self, reg):
+        return self.transfer([READ, reg, 0x00])[2]
+
+    def read_burst(self, reg, count):
+        # consecutive registers in one transfer, see IOCON.BANK/SEQOP for the order
+        return self.transfer([READ, reg] + [0x00] * count)[2:]
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+# Stand-in for the front panel hardware for tests and benchmarks
+# emulates the three MCP23S17 expanders set up in init_spi(), the button
+# matrix and encoders wired to them, and the Pi pins scope.py uses
+# (spidev, cs2, spi_reset, interrupt1-6, LCD), so the input path runs
+# on any machine; hal.Simulated hands these to scope.setup()
+#
+# usage: python3 panel_sim.py [--transitions 400] [--rate 400]
+#        runs scope.py against the panel and scope_sim.py with a scripted session
+
+from argparse import ArgumentParser
+from threading import Lock
+from threading import Thread
+from time import monotonic
+from time import sleep
+
+# register index within a port, the address depends on IOCON.BANK
+IODIR   = 0
+IPOL    = 1
+GPINTEN = 2
+DEFVAL  = 3
+INTCON  = 4
+IOCON   = 5
+GPPU    = 6
+INTF    = 7
+INTCAP  = 8
+GPIO    = 9
+OLAT    = 10
+REGISTERS = 11
+
+IOCON_BANK   = 0x80
+IOCON_MIRROR = 0x40
+IOCON_SEQOP  = 0x20
+IOCON_INTPOL = 0x02
+
+OPCODE_WRITE = 0x40
+OPCODE_READ  = 0x41
+
+# BCM pins of the board
+INTERRUPT_PINS = {   # pin: (expander, port)
+    26: ("encoders0", 0),   # interrupt5
+    21: ("encoders0", 1),   # interrupt6
+    13: ("encoders1", 0),   # interrupt1
+    16: ("encoders1", 1),   # interrupt2
+    20: ("buttons", 1),     # interrupt4
+}
+CS2_PIN = 12
+RESET_PIN = 19
+
+# clockwise quadrature sequence of AB, A in the high bit
+CW_SEQUENCE = (0b00, 0b10, 0b11, 0b01)
+
+
+class Expander:
+    # one MCP23S17, registers kept per port and mapped to addresses by IOCON.BANK
+    # sequential reads/writes follow SEQOP: with BANK = 0 the pointer steps
+    # through the paired map (byte mode toggles between the A/B pair), with
+    # BANK = 1 it steps through a port and on to the other one
+
+    def __init__(self, name):
+        self.name = name
+        self.external = [0xFF, 0xFF]   # levels driven onto the pins from outside
+        self.on_outputs = None         # called when the output latches or directions change
+        self.reset()
+
+    def reset(self):
+        self.regs = [[0] * REGISTERS for port in range(2)]
+        for port in range(2):
+            self.regs[port][IODIR] = 0xFF
+        self.previous = [self.levels(0), self.levels(1)]
+
+    def iocon(self):
+        return self.regs[0][IOCON]
+
+    def locate(self, address):
+        if (self.iocon() & IOCON_BANK):
+            port, index = address >> 4, address & 0x0F
+            if (port > 1 or index >= REGISTERS):
+                return None
+        else:
+            port, index = address & 1, address >> 1
+            if (index >= REGISTERS):
+                return None
+        return port, index
+
+    def next_address(self, address):
+        bank = self.iocon() & IOCON_BANK
+        if (self.iocon() & IOCON_SEQOP): # byte mode
+            return address if bank else address ^ 1
+        if (bank):
+            if ((address & 0x0F) >= REGISTERS - 1):
+                return (address & 0x10) ^ 0x10
+            return address + 1
+        return (address + 1) % (REGISTERS * 2)
+
+    def levels(self, port):
+        regs = self.regs[port]
+        return (regs[OLAT] & ~regs[IODIR] | self.external[port] & regs[IODIR]) & 0xFF
+
+    def gpio(self, port):
+        regs = self.regs[port]
+        return self.levels(port) ^ (regs[IPOL] & regs[IODIR])
+
+    def read(self, address):
+        location = self.locate(address)
+        if (location is None):
+            return 0
+        port, index = location
+        if (index == GPIO):
+            value = self.gpio(port)
+            self.clear(port)
+            return value
+        if (index == INTCAP):
+            value = self.regs[port][INTCAP]
+            self.clear(port)
+            return value
+        return self.regs[port][index]
+
+    def write(self, address, value):
+        location = self.locate(address)
+        if (location is None):
+            return
+        port, index = location
+        if (index in (INTF, INTCAP)): # read only
+            return
+        if (index == IOCON):
+            self.regs[0][IOCON] = self.regs[1][IOCON] = value
+            return
+        if (index == GPIO):
+            index = OLAT
+        self.regs[port][index] = value
+        if (index in (OLAT, IODIR) and self.on_outputs is not None):
+            self.on_outputs(self)
+        self.check(port)
+
+    def set_external(self, port, value):
+        self.external[port] = value & 0xFF
+        self.check(port)
+
+    def check(self, port):
+        # interrupt on change, against DEFVAL or the previous pin level
+        regs = self.regs[port]
+        levels = self.levels(port)
+        compare = (regs[DEFVAL] & regs[INTCON]) | (self.previous[port] & ~regs[INTCON])
+        changed = (levels ^ compare) & regs[GPINTEN] & regs[IODIR]
+        self.previous[port] = levels
+        if (changed and not regs[INTF]):
+            # only the first change is captured until the interrupt is cleared
+            regs[INTF] = changed
+            regs[INTCAP] = self.gpio(port)
+
+    def clear(self, port):
+        self.regs[port][INTF] = 0
+        # a pin still differing from DEFVAL interrupts again straight away
+        regs = self.regs[port]
+        pending = (self.levels(port) ^ regs[DEFVAL]) & regs[INTCON] & regs[GPINTEN] & regs[IODIR]
+        if (pending):
+            regs[INTF] = pending
+            regs[INTCAP] = self.gpio(port)
+
+    def interrupt(self, port):
+        active = bool(self.regs[port][INTF])
+        if (self.iocon() & IOCON_MIRROR):
+            active = bool(self.regs[0][INTF] or self.regs[1][INTF])
+        if (self.iocon() & IOCON_INTPOL):
+            return active
+        return not active
+
+    def transfer(self, data):
+        if (len(data) < 2):
+            return [0] * len(data)
+        opcode, address = data[0], data[1]
+        reply = [0, 0]
+        for byte in data[2:]:
+            if (opcode == OPCODE_READ):
+                reply.append(self.read(address))
+            else:
+                self.write(address, byte)
+                reply.append(0)
+            address = self.next_address(address)
+        return reply
+
+
+class Pin:
+    # gpiozero device stand-in, value follows the emulated hardware
+
+    def __init__(self, pin=None, *args, **kwargs):
+        self.pin = pin
+        self.value = 0
+        self.when_activated = None
+        self.when_deactivated = None
+        self.when_held = None
+        self.on_change = None
+
+    def set(self, value):
+        value = int(bool(value))
+        if (value == self.value):
+            return
+        self.value = value
+        if (value and self.when_activated is not None):
+            self.when_activated()
+        elif (not value and self.when_deactivated is not None):
+            self.when_deactivated()
+
+    def on(self):
+        self.value = 1
+        if (self.on_change is not None):
+            self.on_change(1)
+
+    def off(self):
+        self.value = 0
+        if (self.on_change is not None):
+            self.on_change(0)
+
+    def close(self):
+        return
+
+
+class LCD:
+    # RPLCD CharLCD stand-in that keeps the 20x4 text and counts writes
+    # char_time adds the cost of a character or cursor move on the real
+    # display, clear_time that of a clear
+
+    def __init__(self, *args, cols=20, rows=4, char_time=0, clear_time=0, **kwargs):
+        self.cols = cols
+        self.rows = rows
+        self.char_time = char_time
+        self.clear_time = clear_time
+        self.position = (0, 0)
+        self.text = [[' '] * cols for row in range(rows)]
+        self.writes = 0      # characters and commands sent to the display
+        self.clears = 0
+
+    @property
+    def cursor_pos(self):
+        return self.position
+
+    @cursor_pos.setter
+    def cursor_pos(self, pos):
+        self.position = pos
+        self.writes += 1
+        if (self.char_time):
+            sleep(self.char_time)
+
+    def put(self, char):
+        row, col = self.position
+        if (row < self.rows and col < self.cols):
+            self.text[row][col] = char
+        self.position = (row, col + 1)
+        self.writes += 1
+        if (self.char_time):
+            sleep(self.char_time)
+
+    def clear(self):
+        self.text = [[' '] * self.cols for row in range(self.rows)]
+        self.position = (0, 0)
+        self.writes += 1
+        self.clears += 1
+        if (self.clear_time):
+            sleep(self.clear_time)
+
+    def write_string(self, value):
+        for char in value:
+            if (char == '\r'):
+                self.cursor_pos = (self.position[0], 0)
+            elif (char == '\n'):
+                self.cursor_pos = (self.position[0] + 1, self.position[1])
+            else:
+                self.put(char)
+
+    def write(self, value):
+        self.put(chr(value))
+
+    def crlf(self):
+        self.cursor_pos = (self.position[0] + 1, 0)
+
+    def create_char(self, location, bitmap):
+        self.writes += 1
+
+    def lines(self):
+        return ["".join(row) for row in self.text]
+
+
+class PanelSimulator:
+
+    def __init__(self, lcd_char_time=0):
+        self.lock = Lock()
+        self.buttons = Expander("buttons")
+        self.encoders0 = Expander("encoders0")
+        self.encoders1 = Expander("encoders1")
+        self.buttons.on_outputs = self.update_rows
+        self.keys = set()   # (row mask, column mask) of keys held down
+        self.lcd_char_time = lcd_char_time
+        self.lcd = None
+
+        self.pins = {}
+        self.cs2 = self.output_pin(CS2_PIN)
+        self.spi_reset = self.output_pin(RESET_PIN)
+        self.spi_reset.on_change = self.reset
+        self.transfers = 0
+
+    def expander(self, name):
+        return getattr(self, name)
+
+    def output_pin(self, pin):
+        device = self.pins.get(pin)
+        if (device is None):
+            device = self.pins[pin] = Pin(pin)
+        return device
+
+    def input_pin(self, pin):
+        return self.output_pin(pin)
+
+    def reset(self, asserted):
+        if (asserted):
+            with self.lock:
+                for expander in (self.buttons, self.encoders0, self.encoders1):
+                    expander.reset()
+                self.update_rows(self.buttons)
+                self.update_pins()
+
+    # SPI
+
+    def transfer(self, device, data):
+        with self.lock:
+            self.transfers += 1
+            if (device == 0):
+                # CE0 reaches encoder bank 0, cs2 selects the button expander instead
+                expander = self.buttons if self.cs2.value else self.encoders0
+            else:
+                expander = self.encoders1
+            reply = expander.transfer(list(data))
+            self.update_pins()
+        return reply
+
+    def update_pins(self):
+        # under the lock, so a pin never lags the register state it reflects
+        for pin, (name, port) in INTERRUPT_PINS.items():
+            self.input_pin(pin).set(self.expander(name).interrupt(port))
+
+    # button matrix, columns on GPA0-5 driven low by the scan, rows on GPB0-5 with pull-ups
+
+    def update_rows(self, expander):
+        regs = expander.regs[0]
+        driven_low = ~regs[OLAT] & ~regs[IODIR] & 0x3F
+        rows = 0xFF
+        for row, col in self.keys:
+            if (col & driven_low):
+                rows &= ~row
+        expander.external[1] = rows
+        expander.check(1)
+
+    def press(self, row, col):
+        with self.lock:
+            self.keys.add((row, col))
+            self.update_rows(self.buttons)
+            self.update_pins()
+
+    def release(self, row, col):
+        with self.lock:
+            self.keys.discard((row, col))
+            self.update_rows(self.buttons)
+            self.update_pins()
+
+    def press_together(self, keys):
+        # (row, col) keys closing at the same instant, a single change of the row pins
+        with self.lock:
+            self.keys.update(keys)
+            self.update_rows(self.buttons)
+            self.update_pins()
+
+    def release_together(self, keys):
+        with self.lock:
+            self.keys.difference_update(keys)
+            self.update_rows(self.buttons)
+            self.update_pins()
+
+    def tap(self, row, col, hold=0.1):
+        self.press(row, col)
+        sleep(hold)
+        self.release(row, col)
+
+    # encoders, A and B contacts on two bits of one port
+
+    def step_encoder(self, name, port, a_bit, b_bit, clockwise):
+        with self.lock:
+            expander = self.expander(name)
+            level = expander.external[port]
+            ab = ((level >> a_bit) & 1) << 1 | ((level >> b_bit) & 1)
+            i = CW_SEQUENCE.index(ab)
+            ab = CW_SEQUENCE[(i + (1 if clockwise else -1)) % 4]
+            level &= ~((1 << a_bit) | (1 << b_bit))
+            level |= (ab >> 1) << a_bit | (ab & 1) << b_bit
+            expander.set_external(port, level)
+            self.update_pins()
+
+    def rotate(self, name, port, a_bit, b_bit, transitions, rate):
+        # transitions > 0 for clockwise, at rate transitions per second
+        period = 1 / rate if rate > 0 else 0
+        deadline = monotonic()
+        for i in range(abs(transitions)):
+            if (period):
+                deadline += period
+                delay = deadline - monotonic()
+                if (delay > 0):
+                    sleep(delay)
+            self.step_encoder(name, port, a_bit, b_bit, transitions > 0)
+
+    def rotate_encoder(self, bank, encoder, transitions, rate):
+        # for scope.py's EncoderBank/Encoder, the bank's register gives the port
+        name = "encoders" + str(bank.expander.device)
+        self.rotate(name, bank.gpio_addr & 1, encoder.a_bit, encoder.b_bit, transitions, rate)
+
+    # module stand-ins
+
+    def new_lcd(self, *args, **kwargs):
+        self.lcd = LCD(*args, char_time=self.lcd_char_time, **kwargs)
+        return self.lcd
+
+    def new_spidev(self):
+        return SpiDev(self)
+
+
+class SpiDev:
+    # spidev.SpiDev stand-in routed to the emulated expanders
+
+    def __init__(self, panel):
+        self.panel = panel
+        self.device = None
+        self.mode = 0
+        self.max_speed_hz = 0
+
+    def open(self, bus, device):
+        self.device = device
+
+    def close(self):
+        self.device = None
+
+    def xfer2(self, data):
+        return self.panel.transfer(self.device, data)
+
+    xfer = xfer2
+
+    def writebytes(self, data):
+        self.panel.transfer(self.device, data)
+
+    def readbytes(self, n):
+        return [0] * n
+
+
+def main():
+    parser = ArgumentParser(description="run scope.py against the emulated panel and scope_sim.py")
+    parser.add_argument("--transitions", type=int, default=400, help="quadrature transitions per knob")
+    parser.add_argument("--rate", type=float, default=400, help="transitions per second")
+    args = parser.parse_args()
+
+    from hal import Simulated
+    from hal import traced
+    from scope_sim import ScopeSimulator
+    sim = ScopeSimulator(port=0, autoscale_time=0.05).start()
+
+    panel = PanelSimulator()
+    import scope
+    scope.setup(traced(Simulated(panel, sim)))
+    Thread(target=scope.main, name="scope-main", daemon=True).start()
+    sleep(0.5)
+
+    # turn on the channels and manual cursors from the panel, so a
+    # SCOPE_TRACE recording of the session holds everything that happened
+    for row, col in ((scope.R6, scope.C2), (scope.R5, scope.C5), (scope.R5, scope.C6), (scope.R3, scope.C5)):
+        panel.tap(row, col)
+        sleep(0.1)
+
+    start = monotonic()
+    transfers = panel.transfers
+    lines = len(sim.log)
+    for bank in (scope.App.EncoderBank0A, scope.App.EncoderBank0B, scope.App.EncoderBank1A, scope.App.EncoderBank1B):
+        for encoder in bank.encoders:
+            if (encoder.enabled):
+                panel.rotate_encoder(bank, encoder, args.transitions // 2, args.rate)
+                panel.rotate_encoder(bank, encoder, -args.transitions // 2, args.rate)
+
+    for row, col in ((scope.R1, scope.C5), (scope.R1, scope.C5), (scope.R3, scope.C3), (scope.R3, scope.C3)):
+        panel.tap(row, col)
+        sleep(0.1)
+    sleep(0.2)
+    elapsed = monotonic() - start
+
+    print("session {:.2f} s, {} SPI transfers, {} SCPI lines".format(
+        elapsed, panel.transfers - transfers, len(sim.log) - lines))
+    scope.App.lcd.drain()
+    print(scope.encoder_report() + scope.App.Inputs.report() + scope.App.lcd.report() + scope.keymap_report())
+    print("\n".join(panel.lcd.lines()))
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,32 @@
 #!/usr/bin/env python3
 from os import execv
+from os import environ
+from os import setpriority
+from os import PRIO_PROCESS
 from sys import argv
 from sys import exit  
-from sys import maxsize
 
-import socket
 from subprocess import check_call
+from signal import signal
+from signal import SIGUSR1
+from threading import Event
+from threading import Thread
+from threading import get_native_id
 from time import sleep
-from math import floor
-import struct
 
-import RPi.GPIO as GPIO
-from RPLCD.gpio import CharLCD
+from hal import open_backend
+from lcd_frame import FrameBuffer
+from mcp23s17 import SpiBus
+from mcp23s17 import MCP23S17
 
-import spidev
+from scpi_stats import ScpiStats
+from scpi_parse import reply_fields
+from scpi_parse import split_exponent
+from scpi_parse import parse_number
+from scpi_parse import parse_enum
+from scpi_parse import parse_bool
+from scpi_parse import format_number
 
-from gpiozero import Button
-from gpiozero import DigitalInputDevice
-from gpiozero import DigitalOutputDevice
-from gpiozero import PWMOutputDevice
 
 # for programming without the instrument connected
 # not extensively tested, mostly used when developing the menu system
@@ -58,14 +66,41 @@ INTCAPB  = 0x18
 GPIOB    = 0x19
 OLATB    = 0x1A
 
-SPI_WRITE = 0x40
-SPI_READ = 0x41
+# the encoder expanders run with IOCON.BANK = 0 so that GPIOA and GPIOB
+# are adjacent and both ports can be read in one transfer
+IOCON_ENCODERS = 0x22
+
+GPINTENA_PAIRED = 0x04
+GPINTENB_PAIRED = 0x05
+GPPUA_PAIRED    = 0x0C
+GPIOA_PAIRED    = 0x12
+GPIOB_PAIRED    = 0x13
+
 SPI_MODE = 0b00
 SPI_RATE = 10000000   # hertz
 
 DEBOUNCE = 0.035   # seconds
-CMD_WAIT = 0.01    # gives time for scope to update
-AUTOSCALE_WAIT = 1
+REPLY_TIMEOUT = 2         # seconds to wait for a query reply
+AUTOSCALE_TIMEOUT = 10    # seconds to wait for *RST/autoscale to complete
+COALESCE_INTERVAL = 0.02  # seconds between sends of the same knob setting
+BURST_ENCODER_READS = True # read both ports of an encoder expander together
+ACCEL_START = 0.5         # revolutions per second before a knob accelerates
+ACCEL_GAIN = 4            # extra steps per revolution per second above ACCEL_START
+ACCEL_MAX = 10            # most steps one knob action may move
+ACCEL_RESET = 0.25        # seconds without movement that end an acceleration
+IDLE_WAIT = 1             # seconds the main loop sleeps at most between input checks
+INPUT_THREAD = True       # sample the panel on its own thread, actions run on the main thread
+INPUT_QUEUE = 256         # input events that can wait for their actions
+INPUT_NICE = -10          # priority of the input thread, needs root to take effect
+LCD_THREAD = True         # write the LCD from its own thread, dropping frames it has not got to
+MENU_CACHE = True         # redraw menus from pages rendered once, needs lcd to be a FrameBuffer
+TRANSPORT_QUEUE = 64      # commands waiting to be sent before handlers block
+DASHBOARD_INTERVAL = 0.1  # seconds between redraws of the idle screen
+
+OPER_RUN = 1<<3   # :OPER:COND? bit set while the scope is acquiring
+
+SI_PREFIXES = ((1e3, "k"), (1, ""), (1e-3, "m"), (1e-6, "u"), (1e-9, "n"), (1e-12, "p"))
+RESOLUTION = 1e-12   # the scope takes no setting closer to 0, anything smaller is shown as 0
 
 # SPI device 2, port A
 # button matrix columns
@@ -138,148 +173,62 @@ B_TRIG = 7
 
 
 def disable_backlight():
-    bklt_en.off()
+    App.bklt_en.off()
     print("backlight disabled")
-    if(bklt_fault.value == True):
+    if(App.bklt_fault.value == True):
         cmd = b'SYST:DSP "An LCD backlight power fault has occurred"\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
     
 def pwm_backlight(f): # dimming possible but mostly unused
-    if (bklt_fault.value == False):
-        bklt_en.on()
-        bklt_en.value = f
+    if (App.bklt_fault.value == False):
+        App.bklt_en.on()
+        App.bklt_en.value = f
         print("backlight:", f)
     else:
         disable_backlight()
 
 def disable_power():
-    pwr_en.off()
+    App.pwr_en.off()
     print("power disabled")
     
-    if(pwr_fault.value == True):
+    if(App.pwr_fault.value == True):
         cmd = b'SYST:DSP "A fatal power fault has occurred"\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
     
 def enable_power():
-    if (pwr_fault.value == False):
-        pwr_en.on()
+    if (App.pwr_fault.value == False):
+        App.pwr_en.on()
         print("power enabled")
     else:
         disable_power()
 
 def init_spi():
-    spi_reset.on()
+    App.spi_reset.on()
     sleep(0.001)
-    spi_reset.off()
+    App.spi_reset.off()
     
     #buttons
-    spi.open(0, 0)
-    spi.mode = SPI_MODE
-    spi.max_speed_hz = SPI_RATE
-    
-    to_send = [SPI_WRITE, IOCON_INITIAL, 0xA3]   # set up IOCON resgister
-    cs2.on()
-    spi.xfer2(to_send)
-    cs2.off()
-    
-    to_send = [SPI_WRITE, IODIRA, 0xC0]   # configure columns as outputs
-    cs2.on()
-    spi.xfer2(to_send)
-    cs2.off()
-    
-    to_send = [SPI_WRITE, OLATA, 0x3F]   # set columns high
-    cs2.on()
-    spi.xfer2(to_send)
-    cs2.off()
-    
-    to_send = [SPI_WRITE, IPOLB, 0xFF]   # invert the logic level of the row inputs
-    cs2.on()
-    spi.xfer2(to_send)
-    cs2.off()
-    
-    to_send = [SPI_WRITE, GPINTENB, 0x3F]   # enable interrupts for rows
-    cs2.on()
-    spi.xfer2(to_send)
-    cs2.off()
-    
-    to_send = [SPI_WRITE, GPPUB, 0xFF]   # enable pullups for rows
-    cs2.on()
-    spi.xfer2(to_send)
-    cs2.off()
-    
-    spi.close()
-    
+    App.Buttons.write(IOCON_INITIAL, 0xA3)   # set up IOCON resgister
+    App.Buttons.write(IODIRA, 0xC0)          # configure columns as outputs
+    App.Buttons.write(OLATA, 0x3F)           # set columns high
+    App.Buttons.write(IPOLB, 0xFF)           # invert the logic level of the row inputs
+    App.Buttons.write(GPINTENB, 0x3F)        # enable interrupts for rows
+    App.Buttons.write(GPPUB, 0xFF)           # enable pullups for rows
     
     # encoder bank 0
-    spi.open(0, 0)
-    spi.mode = SPI_MODE
-    spi.max_speed_hz = SPI_RATE
-    
-    to_send = [SPI_WRITE, IOCON_INITIAL, 0xA2]
-    spi.xfer2(to_send)
-    
-    to_send = [SPI_WRITE, GPINTENA, 0xFF]
-    spi.xfer2(to_send)
-    
-    to_send = [SPI_WRITE, GPINTENB, 0xFF]
-    spi.xfer2(to_send)
-    
-    spi.close()
-    
+    App.Encoders0.write(IOCON_INITIAL, IOCON_ENCODERS)
+    App.Encoders0.write(GPINTENA_PAIRED, 0xFF)
+    App.Encoders0.write(GPINTENB_PAIRED, 0xFF)
     
     # encoder bank 1
-    spi.open(0, 1)
-    spi.mode = SPI_MODE
-    spi.max_speed_hz = SPI_RATE
-    
-    to_send = [SPI_WRITE, IOCON_INITIAL, 0xA2]
-    spi.xfer2(to_send)
-    
-    to_send = [SPI_WRITE, GPINTENA, 0xFC]
-    spi.xfer2(to_send)
-    
-    to_send = [SPI_WRITE, GPINTENB, 0xFF]
-    spi.xfer2(to_send)
-    
-    to_send = [SPI_WRITE, GPPUA, 0x03]
-    spi.xfer2(to_send)
-    
-    spi.close()
-    
-def ascii_to_num(txt):
-    sign = 1 if txt[0] == 43 else -1
-    
-    try:
-        decimal = txt.index(b'.')
-        mult = 10 ** max(0,decimal - 2)
-        
-    except ValueError:
-        mult = 10 ** (len(txt)-2)
-        pass
-    
-    num = 0
-    for x in txt:
-        if (x == 43 or x == 45 or x == 46):
-            continue
-        else:
-            num += mult * (x-48)
-            mult = mult / 10
-    return num * sign
-    
-def num_to_ascii(num, is_integer):
-    sign = b'+' if num >= 0 else b'-'
-    if is_integer:
-        return sign + str(abs(floor(num))).encode()
-    else:
-        return sign + str(num).encode()
-    
+    App.Encoders1.write(IOCON_INITIAL, IOCON_ENCODERS)
+    App.Encoders1.write(GPINTENA_PAIRED, 0xFC)
+    App.Encoders1.write(GPINTENB_PAIRED, 0xFF)
+    App.Encoders1.write(GPPUA_PAIRED, 0x03)
     
 def update_select_funcs():
-    global ActiveMenu
-    EncoderBank1A.encoders[2].cw_action = ActiveMenu.increment_cursor
-    EncoderBank1A.encoders[2].ccw_action = ActiveMenu.decrement_cursor
+    App.EncoderBank1A.encoders[2].cw_action = App.ActiveMenu.increment_cursor
+    App.EncoderBank1A.encoders[2].ccw_action = App.ActiveMenu.decrement_cursor
     
     
 def init_encoders():
@@ -287,74 +236,79 @@ def init_encoders():
     Ch1Scale = Encoder(A_CH1_SC, B_CH1_SC)
     Ch1Scale.detent = True
     Ch1Scale.enabled = True
-    Ch1Scale.cw_action = Scope.Channel1.cw_scale
-    Ch1Scale.ccw_action = Scope.Channel1.ccw_scale
+    Ch1Scale.cw_action = App.Scope.Channel1.cw_scale
+    Ch1Scale.ccw_action = App.Scope.Channel1.ccw_scale
     
     Ch1Offset = Encoder(A_CH1_OS, B_CH1_OS)
     Ch1Offset.enabled = True
-    Ch1Offset.cw_action = Scope.Channel1.cw_offset
-    Ch1Offset.ccw_action = Scope.Channel1.ccw_offset
+    Ch1Offset.accelerate = True
+    Ch1Offset.cw_action = App.Scope.Channel1.cw_offset
+    Ch1Offset.ccw_action = App.Scope.Channel1.ccw_offset
 
     Ch2Scale = Encoder(A_CH2_SC, B_CH2_SC)
     Ch2Scale.detent = True
     Ch2Scale.enabled = True
-    Ch2Scale.cw_action = Scope.Channel2.cw_scale
-    Ch2Scale.ccw_action = Scope.Channel2.ccw_scale
+    Ch2Scale.cw_action = App.Scope.Channel2.cw_scale
+    Ch2Scale.ccw_action = App.Scope.Channel2.ccw_scale
     
     Ch2Offset = Encoder(A_CH2_OS, B_CH2_OS)
     Ch2Offset.enabled = True
-    Ch2Offset.cw_action = Scope.Channel2.cw_offset
-    Ch2Offset.ccw_action = Scope.Channel2.ccw_offset
+    Ch2Offset.accelerate = True
+    Ch2Offset.cw_action = App.Scope.Channel2.cw_offset
+    Ch2Offset.ccw_action = App.Scope.Channel2.ccw_offset
     
     bank0A = [Ch1Scale, Ch1Offset,  Ch2Scale, Ch2Offset]
-    EncoderBank0A.encoders = bank0A
+    App.EncoderBank0A.encoders = bank0A
     
     # Bank 0B
     Ch3Scale = Encoder(A_CH3_SC, B_CH3_SC)
     Ch3Scale.detent = True
     Ch3Scale.enabled = True
-    Ch3Scale.cw_action = Scope.Channel3.cw_scale
-    Ch3Scale.ccw_action = Scope.Channel3.ccw_scale
+    Ch3Scale.cw_action = App.Scope.Channel3.cw_scale
+    Ch3Scale.ccw_action = App.Scope.Channel3.ccw_scale
     
     Ch3Offset = Encoder(A_CH3_OS, B_CH3_OS)
     Ch3Offset.enabled = True
-    Ch3Offset.cw_action = Scope.Channel3.cw_offset
-    Ch3Offset.ccw_action = Scope.Channel3.ccw_offset
+    Ch3Offset.accelerate = True
+    Ch3Offset.cw_action = App.Scope.Channel3.cw_offset
+    Ch3Offset.ccw_action = App.Scope.Channel3.ccw_offset
     
     Ch4Scale = Encoder(A_CH4_SC, B_CH4_SC)
     Ch4Scale.detent = True
     Ch4Scale.enabled = True
-    Ch4Scale.cw_action = Scope.Channel4.cw_scale
-    Ch4Scale.ccw_action = Scope.Channel4.ccw_scale
+    Ch4Scale.cw_action = App.Scope.Channel4.cw_scale
+    Ch4Scale.ccw_action = App.Scope.Channel4.ccw_scale
     
     Ch4Offset = Encoder(A_CH4_OS, B_CH4_OS)
     Ch4Offset.enabled = True
-    Ch4Offset.cw_action = Scope.Channel4.cw_offset
-    Ch4Offset.ccw_action = Scope.Channel4.ccw_offset
+    Ch4Offset.accelerate = True
+    Ch4Offset.cw_action = App.Scope.Channel4.cw_offset
+    Ch4Offset.ccw_action = App.Scope.Channel4.ccw_offset
     
     bank0B = [Ch3Scale, Ch3Offset, Ch4Scale, Ch4Offset]
-    EncoderBank0B.encoders = bank0B
+    App.EncoderBank0B.encoders = bank0B
     
     # Bank 1A
     Timebase = Encoder(A_HORIZ, B_HORIZ)
     Timebase.enabled = True
     Timebase.detent = True
-    Timebase.cw_action = Scope.Timebase.cw_scale
-    Timebase.ccw_action = Scope.Timebase.ccw_scale
+    Timebase.cw_action = App.Scope.Timebase.cw_scale
+    Timebase.ccw_action = App.Scope.Timebase.ccw_scale
     
     Delay = Encoder(A_DELAY, B_DELAY)
     Delay.enabled = True
-    Delay.cw_action = Scope.Timebase.cw_delay
-    Delay.ccw_action = Scope.Timebase.ccw_delay
+    Delay.accelerate = True
+    Delay.cw_action = App.Scope.Timebase.cw_delay
+    Delay.ccw_action = App.Scope.Timebase.ccw_delay
     
     Select = Encoder(A_SEL, B_SEL)
     Select.enabled = True
     Select.sensitivity = 4
-    Select.cw_action = ActiveMenu.increment_cursor
-    Select.ccw_action = ActiveMenu.decrement_cursor
+    Select.cw_action = App.ActiveMenu.increment_cursor
+    Select.ccw_action = App.ActiveMenu.decrement_cursor
     
     bank1A = [Timebase, Delay, Select]
-    EncoderBank1A.encoders = bank1A
+    App.EncoderBank1A.encoders = bank1A
     
     # Bank 1B
     MathScale = Encoder(A_MATH_SC, B_MATH_SC)
@@ -364,304 +318,211 @@ def init_encoders():
     
     Cursor = Encoder(A_CURS, B_CURS)
     Cursor.enabled = True
-    Cursor.cw_action = Scope.Cursor.cw_cursor
-    Cursor.ccw_action = Scope.Cursor.ccw_cursor
+    Cursor.accelerate = True
+    Cursor.cw_action = App.Scope.Cursor.cw_cursor
+    Cursor.ccw_action = App.Scope.Cursor.ccw_cursor
     
     Trigger = Encoder(A_TRIG, B_TRIG)
     Trigger.enabled = True
-    Trigger.cw_action = Scope.Trigger.cw_level
-    Trigger.ccw_action = Scope.Trigger.ccw_level
+    Trigger.accelerate = True
+    Trigger.cw_action = App.Scope.Trigger.cw_level
+    Trigger.ccw_action = App.Scope.Trigger.ccw_level
     
     bank1B = [MathScale, MathOffset, Cursor, Trigger]
-    EncoderBank1B.encoders = bank1B
+    App.EncoderBank1B.encoders = bank1B
     
 
-def get_reply():
-    reply = Sock.recv(4096)
-    return reply
+def send_cmd(cmd):
+    App.Transport.send(cmd)
+
+def send_latest(cmd):
+    # for settings a knob sends on every detent, only the newest value
+    # is sent each COALESCE_INTERVAL, the model is still updated per detent
+    App.Transport.send_latest(cmd)
+
+def query(cmd, timeout=REPLY_TIMEOUT):
+    return App.Transport.query(cmd).result(timeout)
+
+def parse_reply(cmd, reply, parse):
+    # hands the reply fields to parse, timed against the header of cmd
+    start = App.clock()
+    result = parse(reply_fields(reply))
+    App.Stats.record_parse(cmd, App.clock() - start)
+    return result
+
+def query_number(cmd):
+    return parse_reply(cmd, query(cmd), lambda fields: parse_number(fields[0]))
+
+def query_values(queries, timeout=REPLY_TIMEOUT):
+    # sends the queries as one compound command, one reply field per query
+    cmd = compound_query(queries)
+    return parse_reply(cmd, query(cmd, timeout), list)
+
+def query_state(subsystem):
+    # refreshes a subsystem's model with one compound query
+    cmd = compound_query(subsystem.state_queries())
+    parse_reply(cmd, query(cmd), subsystem.set_state)
+
+def compound_query(queries):
+    return b';'.join(queries) + b'\r\n'
+
 
-def print_reply():
-    print(get_reply())
+    
+def open_menu(menu):
+    App.ActiveMenu.disable()
+    App.ActiveMenu = menu
+    update_select_funcs()
+    App.ActiveMenu.enable()
+    App.ActiveMenu.display_menu()
 
+def toggle_menu(menu):
+    # the shared action of the menu keys: open it, or close it if it is open
+    if (not menu.is_active):
+        open_menu(menu)
+    else:
+        App.ActiveMenu.disable()
+
+def press_channel(channel):
+    # turns the channel on and opens its menu, a second press closes the
+    # menu and turns it off; only channels 1/2 are active in XY mode and
+    # neither can be turned off there
+    xy = App.Scope.Timebase.mode[0:1] == b'X'
+    if (xy and channel.number > 2):
+        return
     
+    if (not channel.enabled.value):
+        channel.enable()
+        open_menu(channel.Menu)
+    elif (not channel.Menu.is_active):
+        open_menu(channel.Menu)
+    else:
+        if (not xy):
+            channel.disable()
+        App.ActiveMenu.disable()
+
+def press_cursor_knob():
+    if (App.Scope.Cursor.mode[0:1] == b'O'):
+        App.Scope.Cursor.set_mode_manual()
+        
+    if (not App.Scope.Cursor.ActiveCursorMenu.is_active):
+        App.ActiveMenu.disable()
+        App.ActiveMenu = App.Scope.Cursor.ActiveCursorMenu
+        App.Scope.Cursor.cursor_select = True
+        App.ActiveMenu.enable()
+        App.ActiveMenu.display_menu()
+    elif (App.Scope.Cursor.cursor_select):
+        App.ActiveMenu.select()
+        App.Scope.Cursor.cursor_select = False
+    else:
+        App.Scope.Cursor.cursor_select = True
+
+def run_stop():
+    cmd = b':OPER:COND?\r\n'
+    oscr = query_number(cmd)
+    
+    if (oscr & OPER_RUN):
+        cmd = b':STOP\r\n'
+        send_cmd(cmd)
+        App.Scope.running = False
+    else:
+        cmd = b'RUN\r\n'
+        send_cmd(cmd)
+        App.Scope.running = True
+
+def single():
+    cmd = b':SINGLE\r\n'
+    send_cmd(cmd)
+    App.Scope.running = False # stops after the one acquisition
+
+def zoom():
+    if (not App.Scope.Timebase.mode[0:1] == b'W'):
+        App.Scope.Timebase.set_mode_window()
+    else:
+        App.Scope.Timebase.set_mode_main()
+
+def default_setup():
+    cmd = b'*CLS\r\n'
+    send_cmd(cmd)
+    cmd = b'*RST\r\n'
+    send_cmd(cmd)
+    cmd = b'*OPC?\r\n'   # replies once the reset has finished
+    query(cmd, AUTOSCALE_TIMEOUT)
+    App.Scope.get_state()
+
+def autoscale():
+    cmd = b':AUTOSCALE\r\n'
+    send_cmd(cmd)
+    cmd = b'*OPC?\r\n'   # replies once autoscale has finished
+    query(cmd, AUTOSCALE_TIMEOUT)
+    App.Scope.get_state()
+
+def zero_trigger_level():
+    App.Scope.Trigger.level = 0
+    cmd = b':TRIG:LFIF\r\n'
+    send_cmd(cmd)
+
+class Key: # one button of the matrix, timed per press
+    
+    def __init__(self, name, action):
+        self.name = name
+        self.action = action
+        self.presses = 0
+        self.seconds = 0
+        
+    def press(self):
+        start = App.clock()
+        self.action()
+        self.presses += 1
+        self.seconds += App.clock() - start
+
+def build_keymap():
+    # (row, col) to Key, the buttons with nothing to do are left out:
+    # R2 C1 horizontal scale knob, R2 C5 math scale knob, R2 C6, R3 C6 math,
+    # R4 acquire/display/label/save/utility/math offset knob, R5 C1-C4 scale knobs
+    keys = {
+        (R1, C1): Key("select", lambda: App.ActiveMenu.select()),
+        (R1, C2): Key("back", lambda: App.ActiveMenu.back()),
+        (R1, C3): Key("horizontal", lambda: toggle_menu(App.Scope.Timebase.Menu)),
+        (R1, C4): Key("delay knob", App.Scope.Timebase.zero_delay),
+        (R1, C5): Key("run/stop", run_stop),
+        (R1, C6): Key("single", single),
+        
+        (R2, C2): Key("zoom", zoom),
+        (R2, C3): Key("default setup", default_setup),
+        (R2, C4): Key("autoscale", autoscale),
+        
+        (R3, C1): Key("trigger", lambda: toggle_menu(App.Scope.Trigger.Menu)),
+        (R3, C2): Key("trigger level knob", zero_trigger_level),
+        (R3, C3): Key("measure", lambda: toggle_menu(App.Scope.Measure.Menu)),
+        (R3, C4): Key("cursors", lambda: toggle_menu(App.Scope.Cursor.Menu)),
+        (R3, C5): Key("cursors knob", press_cursor_knob),
+        
+        (R5, C5): Key("ch3", lambda: press_channel(App.Scope.Channel3)),
+        (R5, C6): Key("ch4", lambda: press_channel(App.Scope.Channel4)),
+        
+        (R6, C1): Key("ch1", lambda: press_channel(App.Scope.Channel1)),
+        (R6, C2): Key("ch2", lambda: press_channel(App.Scope.Channel2)),
+        (R6, C3): Key("ch1 offset knob", App.Scope.Channel1.zero_offset),
+        (R6, C4): Key("ch2 offset knob", App.Scope.Channel2.zero_offset),
+        (R6, C5): Key("ch3 offset knob", App.Scope.Channel3.zero_offset),
+        (R6, C6): Key("ch4 offset knob", App.Scope.Channel4.zero_offset),
+    }
+    return keys
+
 def button_press(row, col):
-    global ActiveMenu
-    if   (row & R1):
-        if   (col & C1): # select
-            ActiveMenu.select()
-        elif (col & C2): # back
-            ActiveMenu.back()
-        elif (col & C3): # horizontal
-            if (not Scope.Timebase.Menu.is_active):
-                ActiveMenu.disable()
-                ActiveMenu = Scope.Timebase.Menu
-                update_select_funcs()
-                ActiveMenu.enable()
-                ActiveMenu.display_menu()
-            elif  (Scope.Timebase.Menu.is_active):
-                ActiveMenu.disable()
-                
-        elif (col & C4): # delay knob
-            Scope.Timebase.zero_delay()
-            
-        elif (col & C5): # run/stop
-            cmd = b':OPER:COND?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            reply = get_reply()
-            reply = reply[::-1]
-            
-            oscr = 0
-            mult = 1
-            for i in range(4, 9):
-                if (reply[i] == 43):
-                    break
-                else:
-                    oscr += mult * (reply[i]-48)
-                    mult *= 10
-            
-            if (oscr & 1<<3):
-                cmd = b':STOP\r\n'
-                Sock.sendall(cmd)
-            else:
-                cmd = b'RUN\r\n'
-                Sock.sendall(cmd)
-            
-            sleep(CMD_WAIT)
-            
-        elif (col & C6): # single
-            cmd = b':SINGLE\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-    elif (row & R2):
-        if   (col & C1): # horizontal scale knob
-            pass
-        elif (col & C2): # zoom
-            if (not Scope.Timebase.mode[0:1] == b'W'):
-                Scope.Timebase.set_mode_window()
-            else:
-                Scope.Timebase.set_mode_main()
-                
-        elif (col & C3): # default setup
-            cmd = b'*CLS\r\n'
-            Sock.sendall(cmd)
-            cmd = b'*RST\r\n'
-            Sock.sendall(cmd)
-            sleep(AUTOSCALE_WAIT)
-            get_reply()
-            Scope.get_state()
-            
-        elif (col & C4): # autoscale
-            cmd = b':AUTOSCALE\r\n'
-            Sock.sendall(cmd)
-            sleep(AUTOSCALE_WAIT)
-            get_reply()
-            Scope.get_state()
-            
-        elif (col & C5): # math scale knob
-            pass
-        elif (col & C6): # invalid input
-            pass 
-    elif (row & R3):
-        if   (col & C1): # trigger 
-            if (not Scope.Trigger.Menu.is_active):
-                ActiveMenu.disable()
-                ActiveMenu = Scope.Trigger.Menu
-                update_select_funcs()
-                ActiveMenu.enable()
-                ActiveMenu.display_menu()
-            elif  (Scope.Trigger.Menu.is_active):
-                ActiveMenu.disable()
-                
-        elif (col & C2): # trigger level knob
-            Scope.Trigger.level = 0
-            cmd = b':TRIG:LFIF\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-        elif (col & C3): # measure
-            if (not Scope.Measure.Menu.is_active):
-                ActiveMenu.disable()
-                ActiveMenu = Scope.Measure.Menu
-                update_select_funcs()
-                ActiveMenu.enable()
-                ActiveMenu.display_menu()
-            elif  (Scope.Measure.Menu.is_active):
-                ActiveMenu.disable()
-                
-        elif (col & C4): # cursors
-            if (not Scope.Cursor.Menu.is_active):
-                ActiveMenu.disable()
-                ActiveMenu = Scope.Cursor.Menu
-                update_select_funcs()
-                ActiveMenu.enable()
-                ActiveMenu.display_menu()
-            elif  (Scope.Cursor.Menu.is_active):
-                ActiveMenu.disable()
-        
-        elif (col & C5): # cursors knob
-            if (Scope.Cursor.mode[0:1] == b'O'):
-                Scope.Cursor.set_mode_manual()
-                
-            if (not Scope.Cursor.ActiveCursorMenu.is_active):
-                ActiveMenu.disable()
-                ActiveMenu = Scope.Cursor.ActiveCursorMenu
-                Scope.Cursor.cursor_select = True
-                ActiveMenu.enable()
-                ActiveMenu.display_menu()
-            elif (Scope.Cursor.ActiveCursorMenu.is_active and Scope.Cursor.cursor_select):
-                ActiveMenu.select()
-                Scope.Cursor.cursor_select = False
-            elif (Scope.Cursor.ActiveCursorMenu.is_active and not Scope.Cursor.cursor_select):
-                Scope.Cursor.cursor_select = True
-            
-        elif (col & C6): # math
-            pass
-    elif (row & R4):
-        if   (col & C1): # acquire
-            pass
-            
-        elif (col & C2): # display
-            pass
-            
-        elif (col & C3): # label
-            pass
-            
-        elif (col & C4): # save/recall
-            pass
-            
-        elif (col & C5): # utility
-            pass
-            
-        elif (col & C6): # math offset knob
-            pass
-    elif (row & R5):
-        if   (col & C1): # ch1 scale knob
-            pass
-        elif (col & C2): # ch2 scale knob
-            pass
-        elif (col & C3): # ch2 scale knob
-            pass
-        elif (col & C4): # ch4 scale knob
-            pass
-        elif (col & C5): # ch3
-            if (Scope.Timebase.mode[0:1] != b'X'): # only channels 1/2 active in XY mode
-                if (not Scope.Channel3.enabled.value):
-                    Scope.Channel3.enable()
-                    ActiveMenu.disable()
-                    ActiveMenu = Scope.Channel3.Menu
-                    update_select_funcs()
-                    ActiveMenu.enable()
-                    ActiveMenu.display_menu()
-                elif (Scope.Channel3.enabled.value and not Scope.Channel3.Menu.is_active):
-                    ActiveMenu.disable()
-                    ActiveMenu = Scope.Channel3.Menu
-                    update_select_funcs()
-                    ActiveMenu.enable()
-                    ActiveMenu.display_menu()
-                elif  (Scope.Channel3.enabled.value and Scope.Channel3.Menu.is_active):
-                    Scope.Channel3.disable()
-                    ActiveMenu.disable()
-                
-        elif (col & C6): # ch4
-            if (Scope.Timebase.mode[0:1] != b'X'): # only channels 1/2 active in XY mode
-                if (not Scope.Channel4.enabled.value):
-                    Scope.Channel4.enable()
-                    ActiveMenu.disable()
-                    ActiveMenu = Scope.Channel4.Menu
-                    update_select_funcs()
-                    ActiveMenu.enable()
-                    ActiveMenu.display_menu()
-                elif (Scope.Channel4.enabled.value and not Scope.Channel4.Menu.is_active):
-                    ActiveMenu.disable()
-                    ActiveMenu = Scope.Channel4.Menu
-                    update_select_funcs()
-                    ActiveMenu.enable()
-                    ActiveMenu.display_menu()
-                elif  (Scope.Channel4.enabled.value and Scope.Channel4.Menu.is_active):
-                    Scope.Channel4.disable()
-                    ActiveMenu.disable()
-                
-    elif (row & R6):
-        if   (col & C1): # ch1
-            if (not Scope.Channel1.enabled.value):
-                Scope.Channel1.enable()
-                ActiveMenu.disable()
-                ActiveMenu = Scope.Channel1.Menu
-                update_select_funcs()
-                ActiveMenu.enable()
-                ActiveMenu.display_menu()
-            elif (Scope.Channel1.enabled.value and not Scope.Channel1.Menu.is_active):
-                ActiveMenu.disable()
-                ActiveMenu = Scope.Channel1.Menu
-                update_select_funcs()
-                ActiveMenu.enable()
-                ActiveMenu.display_menu()
-            elif  (Scope.Channel1.enabled.value and Scope.Channel1.Menu.is_active):
-                if (Scope.Timebase.mode[0:1] != b'X'): # can't disable channel 1 in xy mode
-                    Scope.Channel1.disable()
-                ActiveMenu.disable()
-                
-        elif (col & C2): # ch2
-            if (not Scope.Channel2.enabled.value):
-                Scope.Channel2.enable()
-                ActiveMenu.disable()
-                ActiveMenu = Scope.Channel2.Menu
-                update_select_funcs()
-                ActiveMenu.enable()
-                ActiveMenu.display_menu()
-            elif (Scope.Channel2.enabled.value and not Scope.Channel2.Menu.is_active):
-                ActiveMenu.disable()
-                ActiveMenu = Scope.Channel2.Menu
-                update_select_funcs()
-                ActiveMenu.enable()
-                ActiveMenu.display_menu()
-            elif  (Scope.Channel2.enabled.value and Scope.Channel2.Menu.is_active):
-                if (Scope.Timebase.mode[0:1] != b'X'): # can't disable channel 2 in xy mode
-                    Scope.Channel2.disable()
-                ActiveMenu.disable()
-                
-        elif (col & C3): #ch1 offset knob
-            Scope.Channel1.zero_offset()
-        elif (col & C4): # ch2 offset knob
-            Scope.Channel2.zero_offset()
-        elif (col & C5): # ch3 offset knob
-            Scope.Channel3.zero_offset()
-        elif (col & C6): # ch4 offset knob
-            Scope.Channel4.zero_offset()
-            
-
-# Set board power
-pwr_en = DigitalOutputDevice(5)
-pwr_fault = DigitalInputDevice(6, pull_up=True)
-pwr_fault.when_activated = disable_power
-enable_power()
-
-# Set up SPI and interrupt pins
-spi = spidev.SpiDev()
-# in case bit banging were necessary
-#cs0 = DigitalOutputDevice( 8, active_high=False)
-#cs1 = DigitalOutputDevice( 7, active_high=False)
-cs2 = DigitalOutputDevice(12, active_high=False)
-
-interrupt1 = DigitalInputDevice(13)
-interrupt2 = DigitalInputDevice(16)
-# cut trace on board and rerouted
-#interrupt3 = DigitalInputDevice(19)
-spi_reset = DigitalOutputDevice(19, active_high=False)
-interrupt4 = DigitalInputDevice(20)
-interrupt5 = DigitalInputDevice(26)
-interrupt6 = DigitalInputDevice(21)
-
-# Set up LCD
-lcd = CharLCD(
-    pin_rs=25, pin_rw=24, pin_e=22, pins_data=[23, 27, 17, 18],
-    cols=20, rows=4,
-    numbering_mode=GPIO.BCM,
-    auto_linebreaks = False,
-    charmap = 'A02')
+    key = App.Keymap.get((row, col))
+    if (key is not None):
+        key.press()
+
+def keymap_report():
+    lines = ["button presses, mean handler ms"]
+    for key in App.Keymap.values():
+        if (key.presses):
+            lines.append("  {:20} {:5} {:8.3f}".format(key.name, key.presses, key.seconds / key.presses * 1000))
+    return "\n".join(lines) + "\n"
+    
 
+# Custom LCD characters
 up_arrow = (
 	0b00000,
 	0b00000,
@@ -672,7 +533,6 @@ up_arrow = (
 	0b11111,
 	0b00000
 )
-lcd.create_char(0, up_arrow)
 
 down_arrow = (
     0b00000,
@@ -684,167 +544,285 @@ down_arrow = (
 	0b00100,
 	0b00000
 )
-lcd.create_char(1, down_arrow)
-    
-bklt_en = PWMOutputDevice(4)
-bklt_fault = DigitalInputDevice(2, pull_up=True)
-bklt_fault.when_activated = disable_backlight
-bklt_en.on()
 
+class FrontPanel: # the application, everything it opens comes from its backend
+    
+    def __init__(self, backend):
+        self.Backend = backend
+        self.clock = backend.clock   # every time read on the input path
+        self.service_inputs = backend.sampled(service_inputs)
+        
+        # round trip and parse times per SCPI header, written to SCPI_STATS_FILE
+        # every SCPI_STATS_INTERVAL seconds and printed on SIGUSR1
+        self.Stats = ScpiStats(environ.get("SCPI_STATS_FILE", "/tmp/scope_scpi_stats.txt"),
+                               float(environ.get("SCPI_STATS_INTERVAL", 60)))
+        
+        self.Wake = Event()   # set on a rising edge of any interrupt line, see main()
+        self.Inputs = InputQueue(INPUT_QUEUE)
+        self.ActiveMenu = BlankMenu()
+        self.Dashboard = Dashboard()
+        self.Keymap = {}      # (row, col) to Key, see build_keymap()
+        
+    def open(self):
+        # powers the board, opens the panel devices and connects to the scope
+        backend = self.Backend
+        
+        # Set board power
+        self.pwr_en = backend.output(5)
+        self.pwr_fault = backend.input(6, pull_up=True)
+        self.pwr_fault.when_activated = disable_power
+        enable_power()
+        
+        # Set up SPI and interrupt pins
+        # in case bit banging were necessary
+        #cs0 = backend.output( 8, active_high=False)
+        #cs1 = backend.output( 7, active_high=False)
+        self.cs2 = backend.output(12, active_high=False)
+        
+        # one open handle per chip select, transfers recorded when tracing
+        self.Bus = SpiBus(0, SPI_MODE, SPI_RATE, backend.spi, backend.recorder)
+        self.Buttons = MCP23S17(self.Bus, 0, self.cs2)   # shares CE0 with encoder bank 0, selected by cs2
+        self.Encoders0 = MCP23S17(self.Bus, 0)
+        self.Encoders1 = MCP23S17(self.Bus, 1)
+        
+        self.interrupt1 = backend.input(13)
+        self.interrupt2 = backend.input(16)
+        # cut trace on board and rerouted
+        #interrupt3 = backend.input(19)
+        self.spi_reset = backend.output(19, active_high=False)
+        self.interrupt4 = backend.input(20)
+        self.interrupt5 = backend.input(26)
+        self.interrupt6 = backend.input(21)
+        
+        # Set up LCD, drawn through a framebuffer that only sends changed cells
+        self.lcd = FrameBuffer(backend.lcd(
+            pin_rs=25, pin_rw=24, pin_e=22, pins_data=[23, 27, 17, 18],
+            cols=20, rows=4,
+            auto_linebreaks = False,
+            charmap = 'A02'))
+        self.lcd.create_char(0, up_arrow)
+        self.lcd.create_char(1, down_arrow)
+        
+        self.bklt_en = backend.pwm(4)
+        self.bklt_fault = backend.input(2, pull_up=True)
+        self.bklt_fault.when_activated = disable_backlight
+        self.bklt_en.on()
+        
+        self.Stats.start()
+        signal(SIGUSR1, self.Stats.request_dump)
+        
+        if (SCOPELESS):
+            class DummyTransport:
+                def send(self, cmd):
+                    return
+                def send_latest(self, cmd):
+                    return
+                def close(self):
+                    return
+            self.Transport = DummyTransport()
+        else:
+            self.connect()
+        
+        self.Scope = Scope()
+        self.Keymap = build_keymap()
+        
+        self.EncoderBank0A = EncoderBank(self.Encoders0, GPIOA_PAIRED)
+        self.EncoderBank0B = EncoderBank(self.Encoders0, GPIOB_PAIRED)
+        self.EncoderBank1A = EncoderBank(self.Encoders1, GPIOA_PAIRED)
+        self.EncoderBank1B = EncoderBank(self.Encoders1, GPIOB_PAIRED)
+        
+        self.Keys = ButtonMatrix(self.Buttons)
+        
+        self.EncoderDevice0 = EncoderDevice(self.EncoderBank0A, self.EncoderBank0B)
+        self.EncoderDevice1 = EncoderDevice(self.EncoderBank1A, self.EncoderBank1B)
+        
+    def connect(self):
+        lcd = self.lcd
+        
+        # Set up socket to scope
+        remote_ip, port = self.Backend.address()
 
-if (SCOPELESS):
-    class DummySocket:
-        def sendall(self, data):
-            return
-        def close(self):
-            return
-    Sock = DummySocket()
-else:
-    # Set up socket to scope
-    # Code provided by Agilent/Keysight with minor modifications
-    remote_ip = "169.254.254.254"
-    port = 5024
-
-    #create an AF_INET, STREAM socket (TCP)
-    Sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    #NODELAY turns of Nagle improves chatty performance
-    Sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
-
-    if maxsize > 2**32:
-      time = struct.pack(str("ll"), int(1), int(0))
-    else:
-      time = struct.pack(str("ii"), int(1), int(0))
-    Sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, time)
+        #Connect to remote server
+        while True:
+            try:
+                print("Attempting to connect")
+                
+                lcd.clear()
+                lcd.write_string("Trying to connect...\r\n")
+                lcd.write_string("IP: " + remote_ip + '\r\n')
+                lcd.write_string("Port: " + str(port) + '\r\n')
+                lcd.flush()
+                
+                sock = self.Backend.connect(remote_ip, port)
+                break
+            
+            except OSError as e:
+                # wait and try to connect again
+                print(e)
+                print("Unable to connect, trying again in 30s")
+                
+                lcd.clear()
+                lcd.write_string("Unable to connect...\r\n")
+                lcd.write_string("Trying again in ")
+                
+                for i in range(1, 30):
+                    lcd.cursor_pos = (1,16)
+                    lcd.write_string(str(30-i) + "s")
+                    if (30-i == 9):
+                        lcd.cursor_pos = (1,18)
+                        lcd.write(BLANK)
+                    lcd.flush()
+                    sleep(1)
+                
+        print ('Socket Connected to ip ' + remote_ip)
 
-    #Connect to remote server
+        lcd.clear()
+        lcd.write_string("Connected!")
+        lcd.flush()
+        sleep(1)
+
+        # the scope is driven from an asyncio client in a worker thread
+        # so handlers never wait on the socket
+        self.Transport = self.Backend.transport(sock, TRANSPORT_QUEUE, COALESCE_INTERVAL, self.Stats)
+        self.Transport.start()
+        print(self.Transport.expect().result(REPLY_TIMEOUT)) # greeting message
+
+def setup(backend):
+    # builds the application on the backend, so that importing this file
+    # has no side effects; App is set first since Scope() already queries through it
+    global App
+    App = FrontPanel(backend)
+    App.open()
+    return App
+
+
+def encoder_report():
+    # nonzero counts mean the loop is reading the encoders too slowly
+    lines = ["encoder reads with a missed transition, per encoder"]
+    for name, bank in (("0A", App.EncoderBank0A), ("0B", App.EncoderBank0B), ("1A", App.EncoderBank1A), ("1B", App.EncoderBank1B)):
+        lines.append("  bank " + name + ": " + " ".join(str(e.skipped) for e in bank.encoders))
+    return "\n".join(lines) + "\n"
+
+def wake_main_loop():
+    App.Wake.set()
+
+def sample_inputs():
+    # wakes for an interrupt, a debounce deadline or, when this is the main
+    # loop's wait, a dashboard redraw held back by DASHBOARD_INTERVAL
+    timeout = min(IDLE_WAIT, App.Keys.time_left())
+    redraw = App.Dashboard.time_left()
+    if (redraw is not None):
+        timeout = min(timeout, redraw)
+    App.Wake.wait(timeout)
+    App.Wake.clear()
+    App.service_inputs()
+
+def service_inputs():
+    # the interrupt lines stay high until their expander is read,
+    # so keep servicing until all of them are low
     while True:
-        try:
-            print("Attempting to connect")
-            
-            lcd.clear()
-            lcd.write_string("Trying to connect...\r\n")
-            lcd.write_string("IP: " + remote_ip + '\r\n')
-            lcd.write_string("Port: " + str(port) + '\r\n')
-            
-            Sock.connect((remote_ip , port))
-            break
+        active = False
         
-        except OSError as e:
-            # wait and try to connect again
-            print(e)
-            print("Unable to connect, trying again in 30s")
-            
-            lcd.clear()
-            lcd.write_string("Unable to connect...\r\n")
-            lcd.write_string("Trying again in ")
+        if (App.interrupt4.value): # button matrix changed
+            App.Keys.interrupt()
+            active = True
+        
+        # check for encoder change
+        if (BURST_ENCODER_READS):
+            if (App.interrupt5.value or App.interrupt6.value):
+                App.EncoderDevice0.update_encoders()
+                active = True
             
-            for i in range(1, 30):
-                lcd.cursor_pos = (1,16)
-                lcd.write_string(str(30-i) + "s")
-                if (30-i == 9):
-                    lcd.cursor_pos = (1,18)
-                    lcd.write(BLANK)
-                sleep(1)
+            if (App.interrupt1.value or App.interrupt2.value):
+                App.EncoderDevice1.update_encoders()
+                active = True
+        
+        else:
+            if (App.interrupt5.value):
+                App.EncoderBank0A.update_encoders()
+                active = True
             
-    print ('Socket Connected to ip ' + remote_ip)
-
-    lcd.clear()
-    lcd.write_string("Connected!")
-    sleep(1)
-
-    print_reply() # greeting message
-
+            if (App.interrupt6.value):
+                App.EncoderBank0B.update_encoders()
+                active = True
+                
+            if (App.interrupt1.value):
+                App.EncoderBank1A.update_encoders()
+                active = True
+                
+            if (App.interrupt2.value):
+                App.EncoderBank1B.update_encoders()
+                active = True
+        
+        App.Keys.tick()   # on every pass, a knob that keeps its line active must not hold up debouncing
+        
+        if (not active):
+            return
 
-def main():
+def start_panel():
+    # everything main() does before its loop that does not start a thread,
+    # shared with scope_trace.py's replay and the benchmarks
     init_spi()
     init_encoders()
-    lcd.clear()
+    App.Stats.add_report(encoder_report)
+    App.Stats.add_report(App.Inputs.report)
+    App.Stats.add_report(App.lcd.report)
+    App.Stats.add_report(keymap_report)
+    for bank in (App.EncoderBank0A, App.EncoderBank0B, App.EncoderBank1A, App.EncoderBank1B):
+        bank.sync()
+    App.Keys.arm()
+    
+    App.lcd.clear()
+    App.ActiveMenu.enable()
+    App.ActiveMenu.display_menu()
+    App.lcd.flush()
+    
+def run_actions():
+    # one pass of the main loop once the inputs have been sampled
+    App.Inputs.dispatch()
+    App.Dashboard.refresh()
+    App.lcd.flush() # whatever the actions drew, as one frame
+
+def main():
+    start_panel()
     print("initialized")
     
-    global ActiveMenu
-    ActiveMenu.enable()
-    ActiveMenu.display_menu()
+    if (LCD_THREAD):
+        App.lcd.start()
     
  
+    # the loop sleeps until an MCP23S17 interrupt line goes high
+    for line in (App.interrupt1, App.interrupt2, App.interrupt4, App.interrupt5, App.interrupt6):
+        line.when_activated = wake_main_loop
+    
+    if (INPUT_THREAD):
+        InputThread().start()
+    
     try: 
-        c = 0
-        
         while True:
-            # drive button matrix columns
-            if (c >= 6):
-                c = 0
-            drive_col = ~(1 << c)
-            c += 1
-            
-            
-            spi.open(0,0)
-            spi.mode = SPI_MODE
-            spi.max_speed_hz = SPI_RATE
-            
-            to_send = [SPI_WRITE, OLATA, drive_col]
-            cs2.on()
-            spi.xfer2(to_send)
-            cs2.off()
-            
-            if (interrupt4.value): # button pressed
-                to_send = [SPI_READ, INTFB]
-                cs2.on()
-                spi.xfer2(to_send)
-                int_flag = spi.readbytes(1)
-                cs2.off()
-                
-                sleep(DEBOUNCE)    # debounce
-                
-                to_send = [SPI_READ, GPIOB]
-                cs2.on()
-                spi.xfer2(to_send)
-                button_io = spi.readbytes(1)
-                cs2.off()
-                
-                to_send = [SPI_READ, INTCAPB, 0x00]
-                cs2.on()
-                spi.xfer(to_send)
-                cs2.off()
-                
-                if (int_flag[0] & button_io[0] > 0): # real press
-                    release = button_io
-                    to_send = [SPI_READ, GPIOB]
-                    cs2.on()
-                    spi.xfer2(to_send)
-                    while(release[0] != 0):          # wait until release
-                        release = spi.readbytes(1)
-                        sleep(0.01)
-                    cs2.off()
-                    
-                    button_press(button_io[0], ~drive_col)  # perform action
-                    
-                    
-            spi.close()
-            
-            # check for encoder change
-            if (interrupt5.value):
-                EncoderBank0A.update_encoders()
-            
-            if (interrupt6.value):
-                EncoderBank0B.update_encoders()
-                
-            if (interrupt1.value):
-                EncoderBank1A.update_encoders()
-                
-            if (interrupt2.value):
-                EncoderBank1B.update_encoders()
+            if (INPUT_THREAD):
+                App.Inputs.ready.wait(App.Dashboard.time_left())
+                App.Inputs.ready.clear()
+                if (App.Inputs.error is not None):
+                    raise App.Inputs.error
+            else:
+                sample_inputs()
             
+            run_actions()
         
     except Exception as e: # restart the program if anything goes wrong
         print(e)           # (usually happens when string parsing)
-        ActiveMenu.disable()
-        lcd.clear()
-        lcd.write_string("An unexpected error\r\noccurred.\r\n\nRestarting...")
+        App.ActiveMenu.disable()
+        App.lcd.clear()
+        App.lcd.write_string("An unexpected error\r\noccurred.\r\n\nRestarting...")
+        App.lcd.flush()
         sleep(3)
         disable_power()
         disable_backlight()
-        Sock.close()
-        GPIO.cleanup()
+        App.Transport.close()
+        App.Stats.write()
+        App.Bus.close()
+        App.Backend.cleanup()   # also closes a trace being recorded
         execv(__file__, argv)
         
         
@@ -897,7 +875,8 @@ class BlankMenu(Menu):
         return
     
     def display_menu(self):
-        lcd.clear()
+        App.lcd.clear()
+        App.Dashboard.draw()
     
     def display_cursor(self):
         return
@@ -914,6 +893,91 @@ class BlankMenu(Menu):
     def back(self):
         return
 
+
+def engineering(value, width):
+    # compact engineering notation for the dashboard, 3 digits or as many as fit
+    # 0.5 -> '500m', -0.0125 -> '-12.5m', 1e-4 -> '100u', 5e-10 -> '500p',
+    # and float residue such as 7e-18 -> '0'
+    value = float("{:.3g}".format(value)) # so 0.9997 picks the same prefix as 1
+    if (abs(value) < RESOLUTION):
+        return "0"
+    for factor, prefix in SI_PREFIXES:
+        if (abs(value) >= factor):
+            break
+    mantissa = value / factor
+    decimals = 2 if abs(mantissa) < 10 else 1 if abs(mantissa) < 100 else 0
+    while True:
+        text = "{:.{}f}".format(mantissa, decimals)
+        if (decimals):
+            text = text.rstrip("0").rstrip(".")
+        if (len(text) + len(prefix) <= width or decimals == 0):
+            return text + prefix
+        decimals -= 1
+
+class Dashboard: # scope settings on the idle screen, drawn from the model only
+    
+    def __init__(self):
+        self.lines = None   # what was last drawn
+        self.drawn = 0      # when it was drawn
+        self.due = False    # the model changed since, waiting for DASHBOARD_INTERVAL
+        
+    def render(self):
+        # 1 500m  -12m     RUN   channel scale and offset, run state
+        # 2 off          100us   timebase scale
+        # 3 1       0   D-13.2u  delay
+        # 4 off        T1-120m   trigger source (1-4, L line, E external) and level
+        source = App.Scope.Trigger.source
+        tag = source[4:5] if source[0:4] == b'CHAN' else source[0:1]
+        level = App.Scope.Trigger.level
+        # a space or the sign always separates the level from the source
+        right = ["STOP" if App.Scope.running == False else "RUN" if App.Scope.running else "",
+                 engineering(App.Scope.Timebase.scale, 6) + "s",
+                 "D" + engineering(App.Scope.Timebase.position, 6),
+                 "T{}{:>5}".format(tag.decode(), engineering(level, 4 if level >= 0 else 5))]
+        lines = []
+        for channel, extra in zip(App.Scope.channels, right):
+            if (channel.enabled.value):
+                left = "{} {:4} {:>5}".format(channel.number, engineering(channel.scale, 4),
+                                              engineering(channel.offset, 5))
+            else:
+                left = "{} off".format(channel.number)
+            lines.append("{:12} {:>7}".format(left, extra))
+        return lines
+        
+    def draw(self):
+        self.lines = self.render()
+        self.drawn = App.clock()
+        self.due = False
+        for row, line in enumerate(self.lines):
+            App.lcd.cursor_pos = (row, 0)
+            App.lcd.write_string(line)
+            
+    def refresh(self):
+        # called after every dispatch, redraws only when a value shown has
+        # changed and at most every DASHBOARD_INTERVAL, or at once when a
+        # menu has just been closed and left the screen empty
+        if (App.ActiveMenu.is_active):
+            self.lines = None
+            self.due = False
+            return
+        if (self.render() == self.lines):
+            self.due = False
+        elif (self.lines is None or App.clock() - self.drawn >= DASHBOARD_INTERVAL):
+            self.draw()
+        else:
+            self.due = True
+            
+    def time_left(self):
+        # until a held back redraw, None when there is none
+        if (not self.due):
+            return None
+        return max(0, self.drawn + DASHBOARD_INTERVAL - App.clock())
+
+def place(page, row, col, text):
+    # writes text into a page of LCD cells, clipped at the right edge
+    text = text[:len(page[row]) - col]
+    page[row][col:col + len(text)] = text
+
 class ToggleMenu(Menu):
     text = ""
     options_set = False
@@ -922,6 +986,7 @@ class ToggleMenu(Menu):
     def __init__(self, text):
         super().__init__()
         self.text = text
+        self.pages = {}   # setting value: (texts, page)
         
     def set_options(self, option1, option2, setting):
         self.option1 = option1
@@ -936,23 +1001,42 @@ class ToggleMenu(Menu):
     def disable(self):
         if (self.is_active):
             self.is_active = False
-            lcd.clear()
+            App.lcd.clear()
+            
+    def render_page(self):
+        page = [[' '] * App.lcd.cols for row in range(App.lcd.rows)]
+        place(page, 0, 0, self.text)
+        place(page, 1, 2, self.option1.text)
+        place(page, 2, 2, self.option2.text)
+        page[1 if self.setting.value else 2][1] = ACTIVE
+        return page
+        
+    def page(self):
+        # rendered once per setting value, again only if a text has changed
+        texts = (self.text, self.option1.text, self.option2.text)
+        cached = self.pages.get(self.setting.value)
+        if (cached is None or cached[0] != texts):
+            cached = (texts, self.render_page())
+            self.pages[self.setting.value] = cached
+        return cached[1]
             
     def display_menu(self):
-        if (self.is_active and self.options_set):
-            lcd.clear()
-            lcd.write_string(self.text)
-            lcd.cursor_pos = (1,2)
-            lcd.write_string(self.option1.text)
-            lcd.cursor_pos = (2,2)
-            lcd.write_string(self.option2.text)
+        if (self.is_active and self.options_set and MENU_CACHE):
+            App.lcd.blit(self.page())
+        elif (self.is_active and self.options_set):
+            App.lcd.clear()
+            App.lcd.write_string(self.text)
+            App.lcd.cursor_pos = (1,2)
+            App.lcd.write_string(self.option1.text)
+            App.lcd.cursor_pos = (2,2)
+            App.lcd.write_string(self.option2.text)
             
             if (self.setting.value):
-                lcd.cursor_pos = (1,1)
-                lcd.write(ACTIVE)
+                App.lcd.cursor_pos = (1,1)
+                App.lcd.write(ACTIVE)
             else:
-                lcd.cursor_pos = (2,1)
-                lcd.write(ACTIVE)
+                App.lcd.cursor_pos = (2,1)
+                App.lcd.write(ACTIVE)
             
         
     def display_cursor(self):
@@ -967,8 +1051,7 @@ class ToggleMenu(Menu):
     def select(self):
         if (not self.is_active):
             self.container.disable()
-            global ActiveMenu 
-            ActiveMenu = self
+            App.ActiveMenu = self
             update_select_funcs()
             self.enable()
             self.display_menu()
@@ -982,8 +1065,7 @@ class ToggleMenu(Menu):
     def back(self):
         if (self.is_active):
             self.disable()
-            global ActiveMenu 
-            ActiveMenu = self.container
+            App.ActiveMenu = self.container
             update_select_funcs()
             self.container.enable()
             self.container.display_menu()
@@ -998,6 +1080,7 @@ class ListMenu(Menu):
     def __init__(self):
         super().__init__()
         self.menu_items = []
+        self.pages = {}   # start_index: (texts, page)
     
     def set_text(self, text):
         self.text = text
@@ -1005,6 +1088,7 @@ class ListMenu(Menu):
     def set_menu(self, menu_items):
         self.menu_items = menu_items
         self.max_index = len(self.menu_items) - 1
+        self.pages = {}
         
         for x in menu_items:
             x.container = self
@@ -1018,31 +1102,55 @@ class ListMenu(Menu):
     def disable(self):
         if(self.is_active):
             self.is_active = False
-            lcd.clear()
+            App.lcd.clear()
+        
+    def render_page(self, start):
+        page = [[' '] * App.lcd.cols for row in range(App.lcd.rows)]
+        for row, i in enumerate(range(start, min(start + 4, self.max_index + 1))):
+            place(page, row, 0, str(i + 1) + "." + self.menu_items[i].text)
+            
+        if (start > 0):
+            page[0][19] = UP_ARROW
+            
+        if (start + 3 < self.max_index):
+            page[3][19] = DOWN_ARROW
+        return page
+        
+    def page(self):
+        # rendered once per start_index, again only if an item's text has changed
+        texts = [item.text for item in self.menu_items[self.start_index:self.start_index + 4]]
+        cached = self.pages.get(self.start_index)
+        if (cached is None or cached[0] != texts):
+            cached = (texts, self.render_page(self.start_index))
+            self.pages[self.start_index] = cached
+        return cached[1]
         
     def display_menu(self):
-        if (self.is_active and self.max_index >= 0):
-            lcd.clear()
+        if (self.is_active and self.max_index >= 0 and MENU_CACHE):
+            App.lcd.blit(self.page())
+            self.display_cursor()
+        elif (self.is_active and self.max_index >= 0):
+            App.lcd.clear()
             for i in range(self.start_index, self.start_index + 4):
                 if (i <= self.max_index):
-                    lcd.write_string(str(i + 1) + ".")
-                    lcd.write_string(self.menu_items[i].text)
-                    lcd.crlf()
+                    App.lcd.write_string(str(i + 1) + ".")
+                    App.lcd.write_string(self.menu_items[i].text)
+                    App.lcd.crlf()
                     
             if (self.start_index > 0):
-                lcd.cursor_pos = (0,19)
-                lcd.write(UP_ARROW)
+                App.lcd.cursor_pos = (0,19)
+                App.lcd.write(UP_ARROW)
                 
             if (self.start_index + 3 < self.max_index):
-                lcd.cursor_pos = (3,19)
-                lcd.write(DOWN_ARROW)
+                App.lcd.cursor_pos = (3,19)
+                App.lcd.write(DOWN_ARROW)
             
             self.display_cursor()
                     
     def display_cursor(self):
         if (self.is_active and self.max_index >= 0):
-            lcd.cursor_pos = (self.cursor - self.start_index, 18)
-            lcd.write(CURSOR)
+            App.lcd.cursor_pos = (self.cursor - self.start_index, 18)
+            App.lcd.write(CURSOR)
             
     def increment_cursor(self):
         if (self.is_active and self.cursor < self.max_index):
@@ -1051,8 +1159,8 @@ class ListMenu(Menu):
                 self.start_index += 1
                 self.display_menu()
             else:
-                lcd.cursor_pos = (self.cursor - 1 - self.start_index, 18)
-                lcd.write(BLANK)
+                App.lcd.cursor_pos = (self.cursor - 1 - self.start_index, 18)
+                App.lcd.write(BLANK)
                 self.display_cursor()
         
     def decrement_cursor(self):
@@ -1062,15 +1170,14 @@ class ListMenu(Menu):
                 self.start_index = self.cursor
                 self.display_menu()
             else:
-                lcd.cursor_pos = (self.cursor + 1 - self.start_index, 18)
-                lcd.write(BLANK)
+                App.lcd.cursor_pos = (self.cursor + 1 - self.start_index, 18)
+                App.lcd.write(BLANK)
                 self.display_cursor()
                 
     def select(self):
         if (not self.is_active):
             self.container.disable()
-            global ActiveMenu
-            ActiveMenu = self
+            App.ActiveMenu = self
             update_select_funcs()
             self.enable()
             self.display_menu()
@@ -1081,8 +1188,7 @@ class ListMenu(Menu):
     def back(self):
         if (self.is_active):
             self.disable()
-            global ActiveMenu 
-            ActiveMenu = self.container
+            App.ActiveMenu = self.container
             update_select_funcs()
             self.container.enable()
             self.container.display_menu()
@@ -1094,10 +1200,10 @@ class ListMenu(Menu):
 #         have them call a function for common code as in Measure
 #       - Remove "SCOPELESS" clauses for functions that do not parse replies
 #       - Formatting, naming convention, unused/unnecessary  variables(?)
-#       - Add a "send_cmd" function to Scope to eliminate all of the extra
-#         "Sock.sendall(cmd)" "sleep(CMD_WAIT)" lines
 class Scope: # state modeling/commands
     
+    running = None # acquiring, None until known
+    
     def __init__(self):
         self.Trigger = Trigger(self)
         self.Cursor = Cursor(self)
@@ -1112,14 +1218,32 @@ class Scope: # state modeling/commands
         
         self.get_state()
     
+    def state_queries(self):
+        return [b':OPER:COND?']
+    
+    def set_state(self, fields):
+        self.running = bool(int(parse_number(fields[0])) & OPER_RUN)
+    
     def get_state(self):
         if (not SCOPELESS):
-            for c in self.channels:
-                c.get_state()
-                
-            self.Timebase.get_state()
-            self.Trigger.get_state()
-            self.Cursor.get_state()
+            # one compound query per subsystem, all sent before reading back
+            # channels come first since the trigger range depends on them
+            subsystems = self.channels + [self.Timebase, self.Trigger, self.Cursor, self]
+            cmds = [compound_query(s.state_queries()) for s in subsystems]
+            replies = App.Transport.query_all(cmds).result(REPLY_TIMEOUT)
+            
+            for s, cmd, reply in zip(subsystems, cmds, replies):
+                parse_reply(cmd, reply, s.set_state)
+            
+            # the EXT trigger range and the cursor position can only be asked
+            # for once those replies are parsed, so they follow as a second batch
+            followups = [(cmd, set_value) for cmd, set_value in (
+                (self.Trigger.range_query(), self.Trigger.set_source_range),
+                (self.Cursor.position_query(), self.Cursor.set_cursor_pos)) if (cmd)]
+            if (followups):
+                replies = App.Transport.query_all([cmd for cmd, set_value in followups]).result(REPLY_TIMEOUT)
+                for (cmd, set_value), reply in zip(followups, replies):
+                    parse_reply(cmd, reply, set_value)
 
 class Channel: # implement: probe attenuation, vernier, units
         
@@ -1186,170 +1310,67 @@ class Channel: # implement: probe attenuation, vernier, units
         else:
             raise ValueError('Invalid number used to initialize Channel class')
     
+    def state_queries(self):
+        header = b':CHAN' + str(self.number).encode()
+        return [header + b':DISP?', header + b':SCAL?', header + b':OFFS?', header + b':COUP?',
+                header + b':IMP?', header + b':BWL?', header + b':INV?']
+    
     def get_state(self):
         if (not SCOPELESS):
-            cmd = b'CHAN' + str(self.number).encode() + b':DISP?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            if (reply[0:1] == b'0'):
-                self.enabled.value = False
-            elif (reply[0:1] == b'1'):
-                self.enabled.value = True
-            
-            
-            cmd = b'CHAN'  + str(self.number).encode() + b':SCAL?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            num_end = reply.index(b'E')
-            self.scale_base_b = reply[:num_end]
-            self.scale_exp_b = reply[num_end+1:]
-            
-            self.scale_base = ascii_to_num(self.scale_base_b)
-            self.scale_exp = ascii_to_num(self.scale_exp_b)
-            
-            self.scale = self.scale_base * 10 ** self.scale_exp
-            self.channel_range = self.scale * 8
-            
-            
-            cmd = b'CHAN'  + str(self.number).encode() + b':OFFS?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            self.offset_b = reply
-            
-            base_end = reply.index(b'E')
-            base = reply[:base_end]
-            exp = reply[base_end+1:]
-            base = ascii_to_num(base)
-            exp = ascii_to_num(exp)
-            
-            self.offset = base * 10 ** exp
-            
-            
-            cmd = b'CHAN'  + str(self.number).encode() + b':COUP?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            if (reply[0:1] == b'D'):
-                self.ac_coupling.value = False
-            elif (reply[0:1] == b'A'):
-                self.ac_coupling.value = True
-                
-                
-            cmd = b'CHAN'  + str(self.number).encode() + b':IMP?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            if (reply[0:1] == b'O'):
-                self.high_input_imped.value = True
-            elif (reply[0:1] == b'F'):
-                self.high_input_imped.value = False
+            query_state(self)
             
-            
-            cmd = b'CHAN'  + str(self.number).encode() + b':BWL?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            if (reply[0:1] == b'1'):
-                self.bw_limit.value = True
-            elif (reply[0:1] == b'0'):
-                self.bw_limit.value = False
-            
-            
-            cmd = b'CHAN'  + str(self.number).encode() + b':INV?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            if (reply[0:1] == b'1'):
-                self.inverted.value = True
-            elif (reply[0:1] == b'0'):
-                self.inverted.value = False
-                
+    def set_state(self, values):
+        display, scale, offset, coupling, impedance, bw_limit, inverted = values
+        
+        self.enabled.value = parse_bool(display)
+        
+        base, exp = split_exponent(scale)
+        self.scale_base_b = parse_enum(base)
+        self.scale_exp_b = parse_enum(exp)
+        self.scale_base = parse_number(base)
+        self.scale_exp = parse_number(exp)
+        
+        self.scale = parse_number(scale)
+        self.channel_range = self.scale * 8
+        
+        self.offset_b = parse_enum(offset)
+        self.offset = parse_number(offset)
+        
+        self.ac_coupling.value = coupling[0:1] == b'A'
+        self.high_input_imped.value = impedance[0:1] == b'O'
+        self.bw_limit.value = parse_bool(bw_limit)
+        self.inverted.value = parse_bool(inverted)
         
     def enable(self):
         if (not SCOPELESS):
             cmd = b':CHAN' + str(self.number).encode() + b':DISP 1\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             self.enabled.value = True
         
     def disable(self):
         if (not SCOPELESS):
             cmd = b':CHAN' + str(self.number).encode() + b':DISP 0\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             self.enabled.value = False
         
     def zero_offset(self):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 self.offset = 0
                 cmd = b'CHAN' + str(self.number).encode() + b':OFFS +0E+0V\r\n'
-                Sock.sendall(cmd)
-                sleep(CMD_WAIT)
+                send_cmd(cmd)
                 
     def clear_protection(self):
         if (self.enabled.value):
             cmd = b'CHAN' + str(self.number).encode() + b':PROT:CLE\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
         
     def cw_scale(self):
         # deal with probe attenuation factor here
         # fine adjustment?
         
         if (not SCOPELESS and self.enabled.value and self.scale < 5):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 if (self.scale_base_b[1:2] == b'1'):
                     self.scale_base = self.scale_base * 2
                     self.offset = self.offset * 2
@@ -1362,20 +1383,20 @@ class Channel: # implement: probe attenuation, vernier, units
                     self.scale_exp += 1
                     
                 #update state
-                self.scale = self.scale_base * 10 ** self.scale_exp
+                self.scale_base_b = format_number(self.scale_base, False)
+                self.scale_exp_b = format_number(self.scale_exp, True)
+                self.scale = parse_number(self.scale_base_b + b'E' + self.scale_exp_b)
                 self.channel_range = self.scale * 8
-                self.scale_base_b = num_to_ascii(self.scale_base, False)
-                self.scale_exp_b = num_to_ascii(self.scale_exp, True)
                 
                 cmd = b'CHAN' + str(self.number).encode() + b':SCAL ' + self.scale_base_b + b'E' + self.scale_exp_b + b'V\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
         
     def ccw_scale(self):
         # deal with probe attenuation factor here
         # fine adjustment?
         
         if (not SCOPELESS and self.enabled.value and self.scale > 0.002):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 if (self.scale_base_b[1:2] == b'1'):
                     self.scale_base = self.scale_base / 2 * 10
                     self.offset = self.offset * 2 / 10
@@ -1388,86 +1409,88 @@ class Channel: # implement: probe attenuation, vernier, units
                     self.offset = self.offset * 2 / 5
                 
                 #update state
-                self.scale = self.scale_base * 10 ** self.scale_exp
+                self.scale_base_b = format_number(self.scale_base, False)
+                self.scale_exp_b = format_number(self.scale_exp, True)
+                self.scale = parse_number(self.scale_base_b + b'E' + self.scale_exp_b)
                 self.channel_range = self.scale * 8
-                self.scale_base_b = num_to_ascii(self.scale_base, False)
-                self.scale_exp_b = num_to_ascii(self.scale_exp, True)
                 
                 cmd = b'CHAN' + str(self.number).encode() + b':SCAL ' + self.scale_base_b + b'E' + self.scale_exp_b + b'V\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
 
-    def cw_offset(self):
+    def cw_offset(self, steps=1):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
-                step = 0.125 * self.scale
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+                step = 0.125 * self.scale * steps
                 self.offset -= step
+                self.offset = float("{:.6E}".format(self.offset))   # keep the value as sent, so out and back returns to exactly 0
                 
                 cmd = b'CHAN' + str(self.number).encode() + b':OFFS ' + "{:.6E}".format(self.offset).encode() + b'V\r\n'
-                Sock.sendall(cmd)
+                send_latest(cmd)
         
-    def ccw_offset(self):
+    def ccw_offset(self, steps=1):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
-                step = 0.125 * self.scale
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+                step = 0.125 * self.scale * steps
                 self.offset += step
+                self.offset = float("{:.6E}".format(self.offset))
                 
                 cmd = b'CHAN' + str(self.number).encode() + b':OFFS ' + "{:.6E}".format(self.offset).encode() + b'V\r\n'
-                Sock.sendall(cmd)
+                send_latest(cmd)
         
     def set_ac_coupling(self):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 cmd = b'CHAN' + str(self.number).encode() + b':COUP AC\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
                 self.ac_coupling.value = True
         
     def set_dc_coupling(self):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 cmd = b'CHAN' + str(self.number).encode() + b':COUP DC\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
                 self.ac_coupling.value = False
 
     def set_impedance_high(self):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 cmd = b'CHAN' + str(self.number).encode() + b':IMP ONEM\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
                 self.high_input_imped.value = True
     
     def set_impedance_low(self):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 cmd = b'CHAN' + str(self.number).encode() + b':IMP FIFT\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
                 self.high_input_imped.value = False
                 
     def set_bw_limit(self):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 cmd = b'CHAN' + str(self.number).encode() + b':BWL 1\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
                 self.bw_limit.value = True
     
     def unset_bw_limit(self):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 cmd = b'CHAN' + str(self.number).encode() + b':BWL 0\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
                 self.bw_limit.value = False
                 
     def set_invert(self):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 cmd = b'CHAN' + str(self.number).encode() + b':INV 1\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
                 self.inverted.value = True
     
     def unset_invert(self):
         if (not SCOPELESS and self.enabled.value):
-            if (not (Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
+            if (not (App.Scope.Timebase.mode[0:1] == b'X' and (self.number == 3 or self.number == 4))): # only channels 1/2 active in XY mode
                 cmd = b'CHAN' + str(self.number).encode() + b':INV 0\r\n'
-                Sock.sendall(cmd)
+                send_cmd(cmd)
                 self.inverted.value = False
        
 class Timebase: # implement: vernier, window scale/position
@@ -1515,96 +1538,53 @@ class Timebase: # implement: vernier, window scale/position
         self.Menu.set_menu(TimebaseMenuItems)
         self.Menu.container = BlankMenu()
     
+    def state_queries(self):
+        return [b':TIM:MODE?', b':TIM:REF?', b':TIM:SCAL?', b':TIM:POS?']
+    
     def get_state(self):
         if (not SCOPELESS):
-            cmd = b'TIM:MODE?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            self.mode = reply
-            
-            cmd = b'TIM:REF?\r\n'
-            Sock.sendall(cmd)
-            sleep(2*CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            self.reference = reply
-            
-            cmd = b'TIM:SCAL?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            num_end = reply.index(b'E')
-            self.scale_base_b = reply[:num_end]
-            self.scale_exp_b = reply[num_end+1:]
-            
-            self.scale_base = ascii_to_num(self.scale_base_b)
-            self.scale_exp = ascii_to_num(self.scale_exp_b)
-            
-            self.scale = self.scale_base * 10 ** self.scale_exp
-            
-            cmd = b'TIM:POS?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            self.position_b = reply
-            
-            base_end = reply.index(b'E')
-            base = reply[:base_end]
-            exp = reply[base_end+1:]
-            base = ascii_to_num(base)
-            exp = ascii_to_num(exp)
-            
-            self.position = base * 10 ** exp
+            query_state(self)
+            
+    def set_state(self, values):
+        mode, reference, scale, position = values
+        
+        self.mode = parse_enum(mode)
+        self.reference = parse_enum(reference)
+        
+        base, exp = split_exponent(scale)
+        self.scale_base_b = parse_enum(base)
+        self.scale_exp_b = parse_enum(exp)
+        self.scale_base = parse_number(base)
+        self.scale_exp = parse_number(exp)
+        
+        self.scale = parse_number(scale)
+        
+        self.position_b = parse_enum(position)
+        self.position = parse_number(position)
             
     def zero_delay(self):
         if (not SCOPELESS):
             self.position = 0
             cmd = b'TIM:POS +0E+0\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
                 
-    def cw_delay(self):
+    def cw_delay(self, steps=1):
         if (not SCOPELESS):
-            step = 0.125 * self.scale
+            step = 0.125 * self.scale * steps
             self.position -= step
+            self.position = float("{:.6E}".format(self.position))
             
             cmd = b'TIM:POS ' + "{:.6E}".format(self.position).encode() + b'\r\n'
-            Sock.sendall(cmd)
+            send_latest(cmd)
         
-    def ccw_delay(self):
+    def ccw_delay(self, steps=1):
         if (not SCOPELESS):
-            step = 0.125 * self.scale
+            step = 0.125 * self.scale * steps
             self.position += step
+            self.position = float("{:.6E}".format(self.position))
             
             cmd = b'TIM:POS ' + "{:.6E}".format(self.position).encode() + b'\r\n'
-            Sock.sendall(cmd)
+            send_latest(cmd)
        
     def cw_scale(self):
         # fine adjustment?
@@ -1619,12 +1599,12 @@ class Timebase: # implement: vernier, window scale/position
                 self.scale_exp += 1
                     
             #update state
-            self.scale = self.scale_base * 10 ** self.scale_exp
-            self.scale_base_b = num_to_ascii(self.scale_base, False)
-            self.scale_exp_b = num_to_ascii(self.scale_exp, True)
+            self.scale_base_b = format_number(self.scale_base, False)
+            self.scale_exp_b = format_number(self.scale_exp, True)
+            self.scale = parse_number(self.scale_base_b + b'E' + self.scale_exp_b)
             
             cmd = b'TIM:SCAL ' + self.scale_base_b + b'E' + self.scale_exp_b + b'\r\n'
-            Sock.sendall(cmd)
+            send_cmd(cmd)
         
     def ccw_scale(self):
         # fine adjustment?
@@ -1640,40 +1620,36 @@ class Timebase: # implement: vernier, window scale/position
                 self.scale_base = self.scale_base * 2 / 5
             
             #update state
-            self.scale = self.scale_base * 10 ** self.scale_exp
-            self.scale_base_b = num_to_ascii(self.scale_base, False)
-            self.scale_exp_b = num_to_ascii(self.scale_exp, True)
+            self.scale_base_b = format_number(self.scale_base, False)
+            self.scale_exp_b = format_number(self.scale_exp, True)
+            self.scale = parse_number(self.scale_base_b + b'E' + self.scale_exp_b)
             
             cmd = b'TIM:SCAL ' + self.scale_base_b + b'E' + self.scale_exp_b + b'\r\n'
-            Sock.sendall(cmd)
+            send_cmd(cmd)
     
     def set_mode_main(self):
         if (not SCOPELESS and not self.mode[0:1] == b'M'):
             self.mode = b'MAIN'
             cmd = b'TIM:MODE '+ self.mode + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
     
     def set_mode_window(self):
         if (not SCOPELESS and not self.mode[0:1] == b'W'):
             self.mode = b'WIND'
             cmd = b'TIM:MODE '+ self.mode + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
     def set_mode_xy(self):
         if (not SCOPELESS and not self.mode[0:1] == b'X'):
             self.mode = b'XY'
             cmd = b'TIM:MODE '+ self.mode + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
     def set_mode_roll(self):
         if (not SCOPELESS and not self.mode[0:1] == b'R'):
             self.mode = b'ROLL'
             cmd = b'TIM:MODE '+ self.mode + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             self.get_state()
         
         
@@ -1681,22 +1657,19 @@ class Timebase: # implement: vernier, window scale/position
         if (not SCOPELESS and not (self.mode[0:1] == b'X' or self.mode[0:1] == b'R')):
             self.reference = b'LEFT'
             cmd = b'TIM:REF '+ self.reference + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
     def set_ref_center(self):
         if (not SCOPELESS and not (self.mode[0:1] == b'X' or self.mode[0:1] == b'R')):
             self.reference = b'CENT'
             cmd = b'TIM:REF '+ self.reference + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
     def set_ref_right(self):
         if (not SCOPELESS and not (self.mode[0:1] == b'X' or self.mode[0:1] == b'R')):
             self.reference = b'RIGH'
             cmd = b'TIM:REF '+ self.reference + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
 
 class Trigger: # implement: holdoff, external probe
     
@@ -1798,90 +1771,41 @@ class Trigger: # implement: holdoff, external probe
         self.Menu.set_menu(TriggerMenuItems)
         Menu.container = BlankMenu()
         
+    def state_queries(self):
+        # :TRIG:HFR? left out along with the HF reject menu
+        return [b':TRIG:NREJ?', b':TRIG:MODE?', b':TRIG:SWE?', b':TRIG:EDGE:SOUR?', b':TRIG:EDGE:LEV?']
+    
     def get_state(self):
         if (not SCOPELESS):
-            """
-            cmd = b':TRIG:HFR?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            if (reply[0:1] == b'0'):
-                self.HFReject.value = False
-            elif (reply[0:1] == b'1'):
-                self.HFReject.value = True
-            """
-                
-                
-            cmd = b':TRIG:NREJ?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            if (reply[0:1] == b'0'):
-                self.NReject.value = False
-            elif (reply[0:1] == b'1'):
-                self.NReject.value = True
-                
-            
-            cmd = b':TRIG:MODE?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            self.mode = reply
-            
-            
-            cmd = b':TRIG:SWE?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            self.sweep = reply
-            
-            
-            cmd = b':TRIG:EDGE:SOUR?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            self.source = reply
-            
+            query_state(self)
             self.get_source_range()
-            self.get_level()
             
+    def set_state(self, values):
+        noise_reject, mode, sweep, source, level = values
+        
+        self.NReject.value = parse_bool(noise_reject)
+        self.mode = parse_enum(mode)
+        self.sweep = parse_enum(sweep)
+        self.source = parse_enum(source)
+        self.level = parse_number(level)
+        
+        self.get_channel_range()   # the EXT range is queried once this returns, see get_state
             
     def get_source_range(self):
+        self.get_channel_range()
+        cmd = self.range_query()
+        if (cmd and not SCOPELESS):
+            self.source_range = query_number(cmd)
+            
+    def range_query(self):
+        # only the scope knows the EXT input's range
+        if (self.source[0:1] == b'E'):
+            return self.source + b':RANG?\r\n'
+        
+    def set_source_range(self, fields):
+        self.source_range = parse_number(fields[0])
+            
+    def get_channel_range(self):
         if (self.source[4:5] == b'1'):
             self.source_range = self.Scope.Channel1.channel_range
         if (self.source[4:5] == b'2'):
@@ -1890,234 +1814,177 @@ class Trigger: # implement: holdoff, external probe
             self.source_range = self.Scope.Channel3.channel_range
         if (self.source[4:5] == b'4'):
             self.source_range = self.Scope.Channel4.channel_range
-        elif (self.source[0:1] == b'E'):
-            cmd = self.source + b':RANG?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            if (not SCOPELESS):
-                reply = get_reply()
-                reply = reply[::-1]
-                reply = reply[4:]
-                start = reply.index(b'\n')
-                reply = reply[:start]
-                reply = reply[::-1]
-                
-                num_end = reply.index(b'E')
-                range_base_b = reply[:num_end]
-                range_exp_b = reply[num_end+1:]
-                
-                range_base = ascii_to_num(range_base_b)
-                range_exp = ascii_to_num(range_exp_b)
-                
-                self.source_range = range_base * 10 ** range_exp
             
     def get_level(self):
             cmd = b'TRIG:EDGE:LEV?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
             if (not SCOPELESS):
-                reply = get_reply()
-                reply = reply[::-1]
-                reply = reply[4:]
-                start = reply.index(b'\n')
-                reply = reply[:start]
-                reply = reply[::-1]
-                self.offset_b = reply
-                
-                base_end = reply.index(b'E')
-                base = reply[:base_end]
-                exp = reply[base_end+1:]
-                base = ascii_to_num(base)
-                exp = ascii_to_num(exp)
-                
-                self.level = base * 10 ** exp
+                self.level = query_number(cmd)
                 
             
-    def cw_level(self):
+    def cw_level(self, steps=1):
         if (self.source[0:1] == b'C' or self.source[0:1] == b'E'):
             self.get_source_range()
 
-            step = 0.01 * self.source_range
+            step = 0.01 * self.source_range * steps
             self.level += step
                 
             if (self.source[0:1] == b'C'):
                 if(self.level > self.source_range * 0.75):
                     self.level = self.source_range * 0.75
                     
+                self.level = float("{:.6E}".format(self.level))
                 cmd = b'TRIG:EDGE:LEV ' + "{:.6E}".format(self.level).encode() + b'V\r\n'
-                Sock.sendall(cmd)
+                send_latest(cmd)
                 
             elif (self.source[0:1] == b'E'):
                 if (self.level > self.source_range * 1):
                     self.level = self.source_range * 1
+                self.level = float("{:.6E}".format(self.level))
                 cmd = b'TRIG:EDGE:LEV ' + "{:.6E}".format(self.level).encode() + b'V\r\n'
-                Sock.sendall(cmd)
+                send_latest(cmd)
                    
-    def ccw_level(self):
+    def ccw_level(self, steps=1):
         if (self.source[0:1] == b'C' or self.source[0:1] == b'E'):
             self.get_source_range()
             
-            step = 0.01 * self.source_range
+            step = 0.01 * self.source_range * steps
             self.level -= step
                 
             if (self.source[0:1] == b'C'):
                 if(self.level < self.source_range * -0.75):
                     self.level = self.source_range * -0.75
+                self.level = float("{:.6E}".format(self.level))
                 cmd = b'TRIG:EDGE:LEV ' + "{:.6E}".format(self.level).encode() + b'V\r\n'
-                Sock.sendall(cmd)
+                send_latest(cmd)
                 
             elif (self.source[0:1] == b'E'):
                 if (self.level < self.source_range * -1):
                     self.level = self.source_range * -1
+                self.level = float("{:.6E}".format(self.level))
                 cmd = b'TRIG:EDGE:LEV ' + "{:.6E}".format(self.level).encode() + b'V\r\n'
-                Sock.sendall(cmd)
+                send_latest(cmd)
                 
             
     """
     def enable_HFRej(self):
         self.HFReject.value = True
         cmd = b':TRIG:HFR 1\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
             
     def disable_HFRej(self):
         self.HFReject.value = False
         cmd = b':TRIG:HFR 0\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
     """
             
     def enable_NRej(self):
         self.NReject.value = True
         cmd = b':TRIG:NREJ 1\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
             
     def disable_NRej(self):
         self.NReject.value = False
         cmd = b':TRIG:NREJ 0\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
          
     """
     def set_mode_edge(self):
         self.mode = b'EDGE'
         cmd = b':TRIG:MODE ' + self.mode + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
     """
             
     def set_sweep_auto(self):
         self.SweepIsAuto.value = True
         self.sweep = b'AUTO'
         cmd = b':TRIG:SWE ' + self.sweep + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
             
     def set_sweep_normal(self):
         self.SweepIsAuto.value = False
         self.sweep = b'NORM'
         cmd = b':TRIG:SWE ' + self.sweep + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_edge_coupling_ac(self):
         cmd = b':TRIG:EDGE:COUP AC\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
     
     def set_edge_coupling_dc(self):
         cmd = b':TRIG:EDGE:COUP DC\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_edge_coupling_lf(self):
         cmd = b':TRIG:EDGE:COUP LFR\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
     
     def set_reject_off(self):
         cmd = b':TRIG:EDGE:REJ OFF\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_reject_lf(self):
         cmd = b':TRIG:EDGE:REJ LFR\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_reject_hf(self):
         cmd = b':TRIG:EDGE:REJ HFR\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
             
     def set_slope_positive(self):
         cmd = b':TRIG:EDGE:SLOP POS\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_slope_negative(self):
         cmd = b':TRIG:EDGE:SLOP NEG\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_slope_either(self):
         cmd = b':TRIG:EDGE:SLOP EITH\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_slope_alternate(self):
         cmd = b':TRIG:EDGE:SLOP ALT\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_source_ch1(self):
         self.source = b'CHAN1'
         cmd = b':TRIG:EDGE:SOUR ' + self.source + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         self.get_source_range()
         self.get_level()
         
     def set_source_ch2(self):
         self.source = b'CHAN2'
         cmd = b':TRIG:EDGE:SOUR ' + self.source + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         self.get_source_range()
         self.get_level()
         
     def set_source_ch3(self):
         self.source = b'CHAN3'
         cmd = b':TRIG:EDGE:SOUR ' + self.source + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         self.get_source_range()
         self.get_level()
         
     def set_source_ch4(self):
         self.source = b'CHAN4'
         cmd = b':TRIG:EDGE:SOUR ' + self.source + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         self.get_source_range()
         self.get_level()
         
     def set_source_external(self):
         self.source = b'EXT'
         cmd = b':TRIG:EDGE:SOUR ' + self.source + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         self.get_source_range()
         self.get_level()
         
     def set_source_line(self):
         self.source = b'LINE'
         cmd = b':TRIG:EDGE:SOUR ' + self.source + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         self.level = 0
 
 class Cursor: # update appropriate functions for Math class
@@ -2197,23 +2064,20 @@ class Cursor: # update appropriate functions for Math class
         self.Menu.set_menu(CursorMenuItems)
         self.Menu.container = BlankMenu()
         
+    def state_queries(self):
+        return [b':MARK:MODE?', b':MARK:X1Y1?', b':MARK:X2Y2?']
+    
     def get_state(self):
         if (not SCOPELESS):
-            cmd = b'MARK:MODE?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
-            
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            self.mode = reply
-            
+            query_state(self)
             self.get_cursor_pos()
-            self.get_cursor_source()
+            
+    def set_state(self, values):
+        mode, source1, source2 = values
+        
+        self.mode = parse_enum(mode)
+        self.source1 = parse_enum(source1)
+        self.source2 = parse_enum(source2)
     
     def zero_cursor(self):
         if (not (self.mode[0:1] == b'O')):
@@ -2225,13 +2089,12 @@ class Cursor: # update appropriate functions for Math class
             self.cursor_position = 0
             
             cmd = b'MARK:' + self.active_cursor + b'P ' + "{:.6E}".format(self.cursor_position).encode() + suffix + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
     
-    def cw_cursor(self): #update for math
+    def cw_cursor(self, steps=1): #update for math
         if (not (self.mode[0:1] == b'O')):
             if (self.cursor_select and self.ActiveCursorMenu.is_active):
-                ActiveMenu.increment_cursor()
+                App.ActiveMenu.increment_cursor()
             else:
                 suffix = b's'
                 scale = self.Scope.Timebase.scale
@@ -2258,17 +2121,17 @@ class Cursor: # update appropriate functions for Math class
                         # scale = self.Scope.Math.scale
                         pass
                 
-                step = 0.125 * scale
+                step = 0.125 * scale * steps
                 self.cursor_position += step
+                self.cursor_position = float("{:.6E}".format(self.cursor_position))
                 
                 cmd = b'MARK:' + self.active_cursor + b'P ' + "{:.6E}".format(self.cursor_position).encode() + suffix + b'\r\n'
-                Sock.sendall(cmd)
-                sleep(CMD_WAIT)
+                send_latest(cmd)
             
-    def ccw_cursor(self): #update for math
+    def ccw_cursor(self, steps=1): #update for math
         if (not (self.mode[0:1] == b'O')):
             if (self.cursor_select and self.ActiveCursorMenu.is_active):
-                ActiveMenu.decrement_cursor()
+                App.ActiveMenu.decrement_cursor()
             else:
                 suffix = b's'
                 scale = self.Scope.Timebase.scale
@@ -2295,76 +2158,41 @@ class Cursor: # update appropriate functions for Math class
                         # scale = self.Scope.Math.scale
                         pass
                         
-                step = 0.125 * scale
+                step = 0.125 * scale * steps
                 self.cursor_position -= step
+                self.cursor_position = float("{:.6E}".format(self.cursor_position))
                 
                 cmd = b'MARK:' + self.active_cursor + b'P ' + "{:.6E}".format(self.cursor_position).encode() + suffix + b'\r\n'
-                Sock.sendall(cmd)
-                sleep(CMD_WAIT)
+                send_latest(cmd)
             
     def get_cursor_pos(self):
-        if (not self.mode[0:1] == b'O'):
-            cmd = b'MARK:' + self.active_cursor + b'P?\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+        cmd = self.position_query()
+        if (cmd and not SCOPELESS):
+            self.cursor_position = query_number(cmd)
             
-            if (not SCOPELESS):
-                reply = get_reply()
-                reply = reply[::-1]
-                reply = reply[4:]
-                start = reply.index(b'\n')
-                reply = reply[:start]
-                reply = reply[::-1]
-                
-                num_end = reply.index(b'E')
-                pos_base_b = reply[:num_end]
-                pos_exp_b = reply[num_end+1:]
-                
-                pos_base = ascii_to_num(pos_base_b)
-                pos_exp = ascii_to_num(pos_exp_b)
-                
-                self.cursor_position = pos_base * 10 ** pos_exp
-        
-    def get_cursor_source(self):
-        cmd = b'MARK:X1Y1?\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+    def position_query(self):
+        # position can only be read back once the mode is known
+        if (not self.mode[0:1] == b'O'):
+            return b'MARK:' + self.active_cursor + b'P?\r\n'
         
-        if (not SCOPELESS):
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            self.source1 = reply
-            
-        cmd = b'MARK:X2Y2?\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+    def set_cursor_pos(self, fields):
+        self.cursor_position = parse_number(fields[0])
         
+    def get_cursor_source(self):
         if (not SCOPELESS):
-            reply = get_reply()
-            reply = reply[::-1]
-            reply = reply[4:]
-            start = reply.index(b'\n')
-            reply = reply[:start]
-            reply = reply[::-1]
-            
-            self.source2 = reply
+            source1, source2 = query_values([b':MARK:X1Y1?', b':MARK:X2Y2?'])
+            self.source1 = parse_enum(source1)
+            self.source2 = parse_enum(source2)
     
     def set_mode_off(self):
         self.mode = b'OFF'
         cmd = b'MARK:MODE ' + self.mode + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
     
     def set_mode_manual(self):
         self.mode = b'MAN'
         cmd = b'MARK:MODE ' + self.mode + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
         self.get_cursor_pos()
         self.get_cursor_source()
@@ -2372,8 +2200,7 @@ class Cursor: # update appropriate functions for Math class
     def set_mode_measurement(self):
         self.mode = b'MEAS'
         cmd = b'MARK:MODE ' + self.mode + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
                 
         self.get_cursor_pos()
         self.get_cursor_source()
@@ -2381,8 +2208,7 @@ class Cursor: # update appropriate functions for Math class
     def set_mode_waveform(self):
         self.mode = b'WAV'
         cmd = b'MARK:MODE ' + self.mode + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
         self.get_cursor_pos()
         self.get_cursor_source()
@@ -2407,8 +2233,7 @@ class Cursor: # update appropriate functions for Math class
         if(self.Scope.Channel1.enabled.value):
             self.source1 = b'CHAN1'
             cmd = b'MARK:X1Y1 ' + self.source1 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2419,8 +2244,7 @@ class Cursor: # update appropriate functions for Math class
         if(self.Scope.Channel2.enabled.value):
             self.source1 = b'CHAN2'
             cmd = b'MARK:X1Y1 ' + self.source1 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2431,8 +2255,7 @@ class Cursor: # update appropriate functions for Math class
         if(self.Scope.Channel3.enabled.value):
             self.source1 = b'CHAN3'
             cmd = b'MARK:X1Y1 ' + self.source1 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2443,8 +2266,7 @@ class Cursor: # update appropriate functions for Math class
         if(self.Scope.Channel2.enabled.value):
             self.source1 = b'CHAN4'
             cmd = b'MARK:X1Y1 ' + self.source1 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2455,8 +2277,7 @@ class Cursor: # update appropriate functions for Math class
         if(False):
             self.source1 = b'FUNC'
             cmd = b'MARK:X1Y1 ' + self.source1 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2467,8 +2288,7 @@ class Cursor: # update appropriate functions for Math class
         if(self.Scope.Channel1.enabled.value):
             self.source2 = b'CHAN1'
             cmd = b'MARK:X2Y2 ' + self.source2 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2479,8 +2299,7 @@ class Cursor: # update appropriate functions for Math class
         if(self.Scope.Channel2.enabled.value):
             self.source2 = b'CHAN2'
             cmd = b'MARK:X2Y2 ' + self.source2 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2491,8 +2310,7 @@ class Cursor: # update appropriate functions for Math class
         if(self.Scope.Channel3.enabled.value):
             self.source2 = b'CHAN3'
             cmd = b'MARK:X2Y2 ' + self.source2 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2503,8 +2321,7 @@ class Cursor: # update appropriate functions for Math class
         if(self.Scope.Channel2.enabled.value):
             self.source2 = b'CHAN4'
             cmd = b'MARK:X2Y2 ' + self.source2 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2515,8 +2332,7 @@ class Cursor: # update appropriate functions for Math class
         if(False):
             self.source2 = b'FUNC'
             cmd = b'MARK:X2Y2 ' + self.source2 + b'\r\n'
-            Sock.sendall(cmd)
-            sleep(CMD_WAIT)
+            send_cmd(cmd)
             
             if(not (self.mode[0:1] == b'W')):
                 self.mode = b'MAN'
@@ -2660,23 +2476,19 @@ class Measure: # update appropriate functions for Math class
     
     def clear(self):
         cmd = b':MEAS:CLE\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def reset_statistics(self):
         cmd = b':MEAS:STAT:RES\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_source1(self):
         cmd = b':MEAS:SOUR ' + self.source1 + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_source2(self):
         cmd = b':MEAS:SOUR ' + self.source1 + b',' + self.source2 + b'\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
     
     def set_source1_ch1(self):
         self.source1 = b'CHAN1'
@@ -2720,146 +2532,131 @@ class Measure: # update appropriate functions for Math class
         
     def set_window_main(self):
         cmd = b':MEAS:WIND MAIN\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_window_zoom(self):
         cmd = b':MEAS:WIND ZOOM\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def set_window_auto(self):
         cmd = b':MEAS:WIND AUTO\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def counter(self):
         cmd = b':MEAS:COUN\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def delay(self):
         cmd = b':MEAS:DEL\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def duty_cycle(self):
         cmd = b':MEAS:DUTY\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def fall_time(self):
         cmd = b':MEAS:FALL\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def frequency(self):
         cmd = b':MEAS:FREQ\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def neg_pulse_width(self):
         cmd = b':MEAS:NWID\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def overshoot(self):
         cmd = b':MEAS:OVER\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def period(self):
         cmd = b':MEAS:PER\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def phase(self):
         cmd = b':MEAS:PHAS\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def preshoot(self):
         cmd = b':MEAS:PRES\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def pulse_width(self):
         cmd = b':MEAS:PWID\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def rise_time(self):
         cmd = b':MEAS:RIS\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def std_dev(self):
         cmd = b':MEAS:SDEV\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def v_amp(self):
         cmd = b':MEAS:VAMP\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def v_avg(self):
         cmd = b':MEAS:VAV\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def v_base(self):
         cmd = b':MEAS:VBAS\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def v_max(self):
         cmd = b':MEAS:VMAX\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def v_min(self):
         cmd = b':MEAS:VMIN\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def v_pp(self):
         cmd = b':MEAS:VPP\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def v_ratio(self):
         cmd = b':MEAS:VRAT\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def v_rms(self):
         cmd = b':MEAS:VRMS\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def v_top(self):
         cmd = b':MEAS:VTOP\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def x_max(self):
         cmd = b':MEAS:XMAX\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
+        send_cmd(cmd)
         
     def x_min(self):
         cmd = b':MEAS:XMIN\r\n'
-        Sock.sendall(cmd)
-        sleep(CMD_WAIT)
-    
-            
+        send_cmd(cmd)
+    
+            
+# quadrature transitions indexed by (previous AB << 2) | current AB
+# 1 clockwise, -1 counter-clockwise, 0 no change,
+# SKIPPED when both bits changed and a transition was missed
+SKIPPED = 2
+QUADRATURE = (
+     0, -1,  1,  SKIPPED,   # from 00
+     1,  0,  SKIPPED, -1,   # from 01
+    -1,  SKIPPED,  0,  1,   # from 10
+     SKIPPED,  1, -1,  0,   # from 11
+)
+
 class Encoder:
-    a = 0
-    b = 0
+    state = None  # AB at the last read, None until the first
+    skipped = 0   # reads where both bits had changed, see encoder_report()
+    pending = 0   # actions decoded from the current read, + for clockwise
     ppr = 24
     raw_count = 0
-    clockwise = False
+    clockwise = None # direction of the last step, None until one is decoded
     
     sensitivity = 1 # higher = less sensitive, modify for instances (e.g. select knob)
     count = 0
@@ -2870,25 +2667,64 @@ class Encoder:
     
     enabled = False
     
+    accelerate = False   # actions take a step count that grows with turning speed
+    speed = 0            # revolutions per second, smoothed
+    last_action = 0
+    last_clockwise = False
+    
     def __init__(self, a_bit, b_bit):
         self.a_bit = a_bit
         self.b_bit = b_bit
+        self.mask = (1<<a_bit) | (1<<b_bit)
         
     def action(self):
+        # actions are collected and run by flush() once the read is decoded
         if self.detent:
             if ((self.detent_count >= self.detent_max) != (self.detent_count <= -1 * self.detent_max)):
                 self.detent_count = 0
-                if (self.clockwise):
-                    self.cw_action()
-                else:
-                    self.ccw_action()
+                self.pending += 1 if self.clockwise else -1
         else: 
             if ((self.count >= self.sensitivity) != (self.count <= -1 * self.sensitivity)):
                 self.count = 0
-                if (self.clockwise):
-                    self.cw_action()
-                else:
-                    self.ccw_action()
+                self.pending += 1 if self.clockwise else -1
+    
+    def flush(self):
+        pending = self.pending
+        if (pending == 0):
+            return
+        self.pending = 0
+        
+        if (self.accelerate):
+            pending *= self.acceleration(pending) # one command for all of them
+        App.Inputs.put(self, pending)
+    
+    def dispatch(self, steps, unused):
+        # runs on the main thread, see InputQueue
+        func = self.cw_action if steps > 0 else self.ccw_action
+        if (self.accelerate):
+            func(abs(steps))
+        else:
+            for i in range(abs(steps)):
+                func()
+    
+    def acceleration(self, actions):
+        # step multiplier from how fast the knob is being turned
+        now = App.clock()
+        elapsed = now - self.last_action
+        clockwise = actions > 0
+        turned_back = clockwise != self.last_clockwise
+        self.last_action = now
+        self.last_clockwise = clockwise
+        
+        if (elapsed > ACCEL_RESET or turned_back):
+            self.speed = 0
+        else:
+            actions_per_rev = self.ppr * 4 / (self.detent_max if self.detent else self.sensitivity)
+            self.speed = (self.speed + abs(actions) / max(elapsed, 0.001) / actions_per_rev) / 2
+        
+        if (self.speed <= ACCEL_START):
+            return 1
+        return min(ACCEL_MAX, int(1 + ACCEL_GAIN * (self.speed - ACCEL_START)))
         
     def adjust_count(self):
         if (self.raw_count == 0 and not self.clockwise):
@@ -2910,54 +2746,243 @@ class Encoder:
             
     
     def update(self, byte):
-        a = (byte & (1<<self.a_bit)) >> self.a_bit
-        b = (byte & (1<<self.b_bit)) >> self.b_bit
-        if ((a != self.a) != (b != self.b)):
-            if (a != self.a):
-                self.clockwise = a != b
-            elif (b != self.b):
-                self.clockwise = a == b
-            self.adjust_count()
-            if self.enabled:
-                self.action()
-            else :
-                pass
-                #cmd = b'SYST:DSP "This control is disabled"\r\n'
-                #Sock.sendall(cmd)
-        self.a = a
-        self.b = b
+        state = ((byte >> self.a_bit) & 1) << 1 | ((byte >> self.b_bit) & 1)
+        if (self.state is None):
+            # the resting level, nothing to decode yet
+            self.state = state
+            return
+        step = QUADRATURE[self.state << 2 | state]
+        self.state = state
+        
+        if (step == SKIPPED):
+            # a read was missed, it most likely kept turning the same way;
+            # with no step seen yet there is no way to tell, so it is dropped
+            self.skipped += 1
+            if (self.clockwise is not None):
+                self.step(self.clockwise)
+                self.step(self.clockwise)
+        elif (step != 0):
+            self.step(step > 0)
+        self.flush()
+    
+    def step(self, clockwise):
+        self.clockwise = clockwise
+        self.adjust_count()
+        if self.enabled:
+            self.action()
+        else :
+            pass
+            #cmd = b'SYST:DSP "This control is disabled"\r\n'
+            #send_cmd(cmd)
 
 class EncoderBank:
     
-    def __init__(self, device, gpio_addr):
-        self.device = device
+    def __init__(self, expander, gpio_addr):
+        self.expander = expander
         self.gpio_addr = gpio_addr
         self.encoders = []
+        self.byte = None   # port at the last read
         
     def set_encoders(self, encoders):
         self.encoders = encoders
         
     def update_encoders(self):
-        spi.open(0,self.device)
-        spi.mode = SPI_MODE
-        spi.max_speed_hz = SPI_RATE
+        self.update(self.expander.read(self.gpio_addr))
         
-        to_send = [SPI_READ, self.gpio_addr, 0x00]
-        spi.xfer2(to_send)
-        spi.close()
+    def sync(self):
+        # takes the contacts' resting levels as the starting state without acting on them
+        self.byte = None
+        for e in self.encoders:
+            e.state = None
+        self.update_encoders()
+        
+    def update(self, byte):
+        # only encoders with a changed bit are decoded, on the first read
+        # all of them take their resting state
+        if (self.byte is None):
+            changed = 0xFF
+        else:
+            changed = byte ^ self.byte
+        if (not changed):
+            return
         
+        self.byte = byte
         for e in self.encoders:
-            e.update(to_send[2])
+            if (changed & e.mask):
+                e.update(byte)
+
+class ButtonMatrix: # debounces the button matrix without ever sleeping
+    # one key at a time: a press is confirmed after DEBOUNCE and acted on
+    # straight away, the release is then debounced the same way
+    IDLE = 0
+    PRESSING = 1
+    HELD = 2
+    RELEASING = 3
+    
+    def __init__(self, expander):
+        self.expander = expander
+        self.state = self.IDLE
+        self.deadline = None
+        self.row = 0
+        self.col = 0
+        
+    def arm(self):
+        # with every column driven low any press sets a row and raises interrupt4
+        self.expander.write(OLATA, 0x00)
+        self.expander.read(INTCAPB)   # clear the interrupt
+        self.state = self.IDLE
+        self.deadline = None
+        
+    def time_left(self):
+        if (self.deadline is None):
+            return IDLE_WAIT
+        return max(0, self.deadline - App.clock())
+        
+    def interrupt(self):
+        if (self.state == self.IDLE):
+            # the row that changed and its level when it did, reading INTCAPB clears the interrupt
+            flags = self.expander.read(INTFB)
+            rows = flags & self.expander.read(INTCAPB)
+            if (rows):
+                self.row = 1 << (rows.bit_length() - 1)   # R1 first if several went active together, as before
+                self.state = self.PRESSING
+                self.deadline = App.clock() + DEBOUNCE
+            return
+        
+        rows = self.expander.read(GPIOB)   # also clears the interrupt
+        
+        if (self.state == self.HELD and not rows & self.row):
+            self.state = self.RELEASING
+            self.deadline = App.clock() + DEBOUNCE
+        elif (self.state == self.RELEASING and rows & self.row): # bounced
+            self.state = self.HELD
+            self.deadline = None
+        
+    def tick(self):
+        if (self.deadline is None or App.clock() < self.deadline):
+            return
+        
+        if (self.state == self.PRESSING):
+            if (self.scan()):
+                self.state = self.HELD
+                self.deadline = None
+                App.Inputs.put(self, self.row, self.col)
+            else:
+                self.arm()
+        
+        elif (self.state == self.RELEASING):
+            if (self.expander.read(GPIOB) & self.row):
+                self.state = self.HELD
+                self.deadline = None
+            else:
+                self.arm()
+        
+    def dispatch(self, row, col):
+        button_press(row, col)  # perform action
+        
+    def scan(self):
+        # halve the driven columns until the one holding the captured row
+        # is left, its column stays driven so the release raises interrupt4 as well
+        cols = 0x3F
+        while (cols & (cols - 1)):
+            half = 0
+            n = bin(cols).count('1') // 2
+            for c in range(6):
+                if (n and cols & 1 << c):
+                    half |= 1 << c
+                    n -= 1
+            self.expander.write(OLATA, ~half & 0x3F)
+            cols = half if self.expander.read(GPIOB) & self.row else cols & ~half
+        
+        self.expander.write(OLATA, ~cols & 0x3F)
+        if (self.expander.read(GPIOB) & self.row): # real press
+            self.col = cols
+            return True
+        return False
+
+class InputQueue: # ring of preallocated input events, one producer and one consumer
+    # the producer only moves head and the consumer only moves tail,
+    # so neither side takes a lock
+    
+    def __init__(self, size):
+        self.size = size
+        self.slots = [[0.0, None, 0, 0] for i in range(size)] # time, control, value, value
+        self.head = 0
+        self.tail = 0
+        self.ready = Event()
+        self.error = None   # raised on the main thread if the input thread fails
+        
+        self.dropped = 0
+        self.high_water = 0
+        self.max_age = 0
+        
+    def put(self, control, a, b=0):
+        depth = self.head - self.tail
+        if (depth >= self.size):
+            self.dropped += 1
+            return
+        
+        slot = self.slots[self.head % self.size]
+        slot[0] = App.clock()
+        slot[1] = control
+        slot[2] = a
+        slot[3] = b
+        self.head += 1
+        
+        if (depth >= self.high_water):
+            self.high_water = depth + 1
+        self.ready.set()
+        
+    def dispatch(self):
+        # runs the actions of everything queued so far
+        while (self.tail != self.head):
+            stamp, control, a, b = self.slots[self.tail % self.size]
+            self.tail += 1
+            
+            age = App.clock() - stamp
+            if (age > self.max_age):
+                self.max_age = age
+            control.dispatch(a, b)
+            
+    def report(self):
+        return ("input queue: high water " + str(self.high_water) + "/" + str(self.size)
+                + ", dropped " + str(self.dropped)
+                + ", longest wait " + "{:.1f}".format(self.max_age * 1000) + " ms\n")
 
+class InputThread(Thread): # samples the panel at its own pace, whatever the actions are doing
+    
+    def __init__(self):
+        super().__init__(name="input", daemon=True)
+        
+    def run(self):
+        try:
+            setpriority(PRIO_PROCESS, get_native_id(), INPUT_NICE)
+        except OSError: # not root
+            pass
+        
+        try:
+            while True:
+                sample_inputs()
+        except Exception as e: # handed to the main thread, which restarts
+            App.Inputs.error = e
+            App.Inputs.ready.set()
+
+class EncoderDevice: # both ports of one expander, read in a single transfer
+    
+    def __init__(self, bank_a, bank_b):
+        self.expander = bank_a.expander
+        self.bank_a = bank_a
+        self.bank_b = bank_b
+        
+    def update_encoders(self):
+        port_a, port_b = self.expander.read_burst(self.bank_a.gpio_addr, 2)
+        self.bank_a.update(port_a)
+        self.bank_b.update(port_b)
 
-ActiveMenu = BlankMenu()
 
-Scope = Scope()
+App = None   # FrontPanel, see setup()
 
-EncoderBank0A = EncoderBank(0, GPIOA)
-EncoderBank0B = EncoderBank(0, GPIOB)
-EncoderBank1A = EncoderBank(1, GPIOA)
-EncoderBank1B = EncoderBank(1, GPIOB)
 
 if __name__ == "__main__":
+    setup(open_backend())
     main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# Stand-in for the DSO6104L telnet port (5024) for tests and benchmarks
+# answers the CHAN, TIM, TRIG, MARK, MEAS and status commands scope.py uses
+# with the same framing as the scope: each line is echoed, query replies
+# follow on their own line and every line ends with the prompt
+#
+# usage: python3 scope_sim.py [--port 5024] [--latency 0.002] [--jitter 0.001]
+#                             [--chunk 0] [--chunk-delay 0.0005]
+
+import socket
+import socketserver
+from argparse import ArgumentParser
+from random import uniform
+from threading import Lock
+from threading import Thread
+from time import monotonic
+from time import sleep
+
+from scpi import REPLY_END
+
+GREETING = b'Welcome to the DSO6104L simulator'
+IDN = b'AGILENT TECHNOLOGIES,DSO6104L,SIM00000,0.0'
+
+OPER_RUN = 1<<3   # :OPER:COND? bit set while acquiring
+
+
+def nr3(value):
+    return b'%+.5E' % value
+
+def default_state():
+    state = {}
+    for n in range(1, 5):
+        chan = 'CHAN' + str(n)
+        state[chan + ':DISP'] = b'1' if n == 1 else b'0'
+        state[chan + ':SCAL'] = nr3(5)
+        state[chan + ':OFFS'] = nr3(0)
+        state[chan + ':COUP'] = b'DC'
+        state[chan + ':IMP'] = b'ONEM'
+        state[chan + ':BWL'] = b'0'
+        state[chan + ':INV'] = b'0'
+
+    state['EXT:RANG'] = nr3(5)
+
+    state['TIM:MODE'] = b'MAIN'
+    state['TIM:REF'] = b'CENT'
+    state['TIM:SCAL'] = nr3(100e-6)
+    state['TIM:POS'] = nr3(0)
+
+    state['TRIG:HFR'] = b'0'
+    state['TRIG:NREJ'] = b'0'
+    state['TRIG:MODE'] = b'EDGE'
+    state['TRIG:SWE'] = b'AUTO'
+    state['TRIG:EDGE:SOUR'] = b'CHAN1'
+    state['TRIG:EDGE:LEV'] = nr3(0)
+    state['TRIG:EDGE:COUP'] = b'DC'
+    state['TRIG:EDGE:REJ'] = b'OFF'
+    state['TRIG:EDGE:SLOP'] = b'POS'
+
+    state['MARK:MODE'] = b'OFF'
+    state['MARK:X1Y1'] = b'CHAN1'
+    state['MARK:X2Y2'] = b'CHAN1'
+    for cursor in ('X1', 'X2', 'Y1', 'Y2'):
+        state['MARK:' + cursor + 'P'] = nr3(0)
+
+    state['MEAS:SOUR'] = b'CHAN1'
+    state['MEAS:WIND'] = b'AUTO'
+    return state
+
+
+class SimulatedScope:
+    # instrument state, shared by every connection
+
+    def __init__(self, autoscale_time=0.5):
+        self.autoscale_time = autoscale_time
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = default_state()
+        self.running = True
+        self.measurements = []
+        self.errors = []
+        self.display = b''
+
+    def execute(self, line):
+        # returns the reply line for a program message, None when nothing is queried
+        replies = []
+        with self.lock:
+            for unit in line.split(b';'):
+                unit = unit.strip()
+                if (unit):
+                    reply = self.execute_unit(unit)
+                    if (reply is not None):
+                        replies.append(reply)
+
+        if (replies):
+            return b';'.join(replies)
+        return None
+
+    def execute_unit(self, unit):
+        header, _, arg = unit.partition(b' ')
+        header = header.decode().upper().lstrip(':')
+        arg = arg.strip()
+
+        if (header.endswith('?')):
+            return self.query(header[:-1])
+        self.command(header, arg)
+        return None
+
+    def query(self, header):
+        if (header == '*IDN'):
+            return IDN
+        if (header == '*OPC'):
+            return b'1'
+        if (header == 'OPER:COND'):
+            return b'+%d' % (OPER_RUN if self.running else 0)
+        if (header == 'SYST:ERR'):
+            return self.errors.pop(0) if self.errors else b'+0,"No error"'
+        if (header in self.state):
+            return self.state[header]
+
+        self.errors.append(b'-113,"Undefined header"')
+        return None
+
+    def command(self, header, arg):
+        if (header == '*RST'):
+            self.reset()
+        elif (header == '*CLS'):
+            self.errors = []
+        elif (header == 'AUTOSCALE'):
+            sleep(self.autoscale_time)
+            for n in range(1, 5):
+                self.state['CHAN' + str(n) + ':DISP'] = b'1'
+                self.state['CHAN' + str(n) + ':SCAL'] = nr3(0.5)
+                self.state['CHAN' + str(n) + ':OFFS'] = nr3(0)
+            self.state['TIM:SCAL'] = nr3(200e-6)
+            self.running = True
+        elif (header == 'RUN'):
+            self.running = True
+        elif (header in ('STOP', 'SINGLE', 'SING')):
+            self.running = False
+        elif (header == 'TRIG:LFIF'):
+            self.state['TRIG:EDGE:LEV'] = nr3(0)
+        elif (header == 'SYST:DSP'):
+            self.display = arg
+        elif (header.startswith('MEAS:') and not arg and header not in self.state):
+            if (header == 'MEAS:CLE'):
+                self.measurements = []
+            elif (header != 'MEAS:STAT:RES'):
+                self.measurements.append(header[5:])
+        elif (header.endswith(':PROT:CLE')):
+            pass
+        elif (header in self.state):
+            self.state[header] = self.value(header, arg)
+        else:
+            self.errors.append(b'-113,"Undefined header"')
+
+    def value(self, header, arg):
+        if (self.state[header][0:1] in (b'+', b'-')):   # NR3 setting
+            number = arg.rstrip(b'Vs')   # units
+            try:
+                return nr3(float(number))
+            except ValueError:
+                self.errors.append(b'-104,"Data type error"')
+                return self.state[header]
+        return arg.upper()
+
+
+class ScopeSimulator:
+    # TCP server for SimulatedScope with configurable timing
+
+    def __init__(self, host="127.0.0.1", port=5024, latency=0.002, jitter=0.0,
+                 chunk=0, chunk_delay=0.0005, autoscale_time=0.5):
+        self.latency = latency            # seconds before each reply is sent
+        self.jitter = jitter              # +/- seconds added to the latency
+        self.chunk = chunk                # split replies into packets of this many bytes, 0 to not split
+        self.chunk_delay = chunk_delay    # seconds between split packets
+        self.scope = SimulatedScope(autoscale_time)
+        self.log = []                     # (arrival time, line) of every line received
+        self.log_lock = Lock()
+
+        simulator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                simulator.serve(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever, name="scope-sim", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self.serve_lines(sock)
+        except ConnectionError:   # client went away
+            pass
+
+    def serve_lines(self, sock):
+        self.send(sock, GREETING + REPLY_END)
+
+        buffer = b''
+        while (True):
+            data = sock.recv(4096)
+            if (not data):
+                return
+
+            buffer += data
+            while (b'\n' in buffer):
+                line, buffer = buffer.split(b'\n', 1)
+                line = line.rstrip(b'\r')
+                with self.log_lock:
+                    self.log.append((monotonic(), line))
+
+                delay = self.latency + uniform(-self.jitter, self.jitter)
+                if (delay > 0):
+                    sleep(delay)
+
+                reply = line + b'\r\n'
+                result = self.scope.execute(line)
+                if (result is not None):
+                    reply += result + b'\r\n'
+                self.send(sock, reply + REPLY_END[2:])
+
+    def send(self, sock, data):
+        if (self.chunk <= 0):
+            sock.sendall(data)
+            return
+
+        for i in range(0, len(data), self.chunk):
+            sock.sendall(data[i:i + self.chunk])
+            if (self.chunk_delay > 0):
+                sleep(self.chunk_delay)
+
+
+def main():
+    parser = ArgumentParser(description="DSO6104L port 5024 simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5024)
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds before each reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to the latency")
+    parser.add_argument("--chunk", type=int, default=0, help="split replies into packets of this many bytes")
+    parser.add_argument("--chunk-delay", type=float, default=0.0005, help="seconds between split packets")
+    parser.add_argument("--autoscale-time", type=float, default=0.5)
+    args = parser.parse_args()
+
+    sim = ScopeSimulator(args.host, args.port, args.latency, args.jitter,
+                         args.chunk, args.chunk_delay, args.autoscale_time)
+    print("Simulating DSO6104L on " + sim.host + ":" + str(sim.port))
+    try:
+        sim.server.serve_forever()
+    except KeyboardInterrupt:
+        sim.server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# Recording and replay of a panel session
+# with SCOPE_TRACE=<file> scope.py runs on a Recording of its backend, which
+# writes every SPI transfer, input pin read, input-path clock read and SCPI
+# exchange to a compact binary trace; replaying it builds the application
+# on a ReplayBackend that hands those back, and runs the same startup,
+# sampling, actions, dashboard and LCD frames as main() as fast as possible,
+# so a field report becomes a repeatable run ending on the screen it showed
+#
+# usage: python3 scope_trace.py dump <file>
+#        python3 scope_trace.py replay <file>
+
+import struct
+from argparse import ArgumentParser
+from atexit import register
+from concurrent.futures import Future
+from threading import Lock
+from threading import get_ident
+from time import monotonic
+from time import perf_counter
+
+from hal import Simulated
+from mcp23s17 import SELECTED
+from scpi import ScpiTransport
+
+MAGIC = b'SCOPETRACE2\n'
+RECORD = struct.Struct('<BdH')   # kind, seconds, payload length
+
+SPI = 1        # chip, length, bytes out, bytes in
+PIN = 2        # BCM pin, value
+CLOCK = 3      # the seconds field is the value returned
+SCPI_OUT = 4   # line sent
+SCPI_IN = 5    # reply up to and including the prompt
+SCPI_LATEST = 6   # knob setting sent once its coalesce interval was up
+
+NAMES = {SPI: "spi", PIN: "pin", CLOCK: "clock", SCPI_OUT: "scpi>", SCPI_IN: "scpi<", SCPI_LATEST: "scpi>>"}
+
+
+class TraceRecorder:
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.lock = Lock()
+        self.sampling = None   # thread inside service_inputs, the only one whose clock is recorded
+        register(self.flush)
+
+    def write(self, kind, stamp, payload):
+        with self.lock:
+            self.file.write(RECORD.pack(kind, stamp, len(payload)))
+            self.file.write(payload)
+
+    def spi(self, chip, out, reply):
+        self.write(SPI, monotonic(), bytes((chip, len(out))) + bytes(out) + bytes(reply))
+
+    def pin(self, pin, value):
+        self.write(PIN, monotonic(), bytes((pin, value)))
+
+    def scpi_out(self, cmd):
+        self.write(SCPI_OUT, monotonic(), bytes(cmd))
+
+    def scpi_latest(self, cmd):
+        self.write(SCPI_LATEST, monotonic(), bytes(cmd))
+
+    def scpi_in(self, reply):
+        self.write(SCPI_IN, monotonic(), bytes(reply))
+
+    def input(self, device, pin):
+        return TracedInput(device, self, pin)
+
+    def clock(self, func):
+        def clock():
+            now = func()
+            if (self.sampling == get_ident()):
+                self.write(CLOCK, now, b'')
+            return now
+        return clock
+
+    def sampled(self, func):
+        def sampled():
+            self.sampling = get_ident()
+            try:
+                return func()
+            finally:
+                self.sampling = None
+        return sampled
+
+    def flush(self):
+        with self.lock:
+            if (not self.file.closed):
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class TracedInput:
+    # passes everything through to the gpiozero device, recording each read of value
+
+    def __init__(self, device, recorder, pin):
+        object.__setattr__(self, "device", device)
+        object.__setattr__(self, "recorder", recorder)
+        object.__setattr__(self, "pin", pin)
+
+    @property
+    def value(self):
+        value = int(self.device.value)
+        self.recorder.pin(self.pin, value)
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.device, name, value)
+
+
+class Recording:
+    # a hal backend that records what the session reads from the one it wraps
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.recorder = TraceRecorder(path)
+        self.clock = self.recorder.clock(backend.clock)
+
+    def sampled(self, func):
+        return self.recorder.sampled(func)
+
+    def input(self, pin, pull_up=False):
+        return self.recorder.input(self.backend.input(pin, pull_up), pin)
+
+    def transport(self, sock, queue_size, coalesce_interval, stats):
+        return ScpiTransport(sock, queue_size, coalesce_interval, stats, self.recorder)
+
+    def cleanup(self):
+        self.recorder.close()
+        self.backend.cleanup()
+
+    def __getattr__(self, name):
+        # outputs, the LCD, SPI handles and the connection are the wrapped backend's
+        return getattr(self.backend, name)
+
+
+def read_trace(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if (not data.startswith(MAGIC)):
+        raise ValueError(path + " is not a scope trace")
+
+    records = []
+    offset = len(MAGIC)
+    while (offset + RECORD.size <= len(data)):
+        kind, stamp, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        records.append((kind, stamp, data[offset:offset + length]))
+        offset += length
+    return records
+
+
+class Divergence(Exception):
+    pass
+
+
+class EndOfTrace(Exception):
+    pass
+
+
+class Replay:
+    # hands the recorded SPI replies, interrupt lines and clock back to the
+    # sampling code in the order they were recorded
+
+    def __init__(self, records):
+        self.inputs = [r for r in records if r[0] in (SPI, PIN, CLOCK)]
+        self.position = 0
+        self.sampling = False
+        self.now = 0   # last recorded clock, what everything outside sampling sees
+
+    def next(self, kind):
+        if (self.position >= len(self.inputs)):
+            raise EndOfTrace()
+        record = self.inputs[self.position]
+        if (record[0] != kind):
+            raise Divergence("record {}: expected {}, recorded {}".format(
+                self.position, NAMES[kind], NAMES[record[0]]))
+        self.position += 1
+        return record
+
+    def transfer(self, device, data):
+        # chips sharing a device are told apart by the bytes sent
+        kind, stamp, payload = self.next(SPI)
+        n = payload[1]
+        if (payload[0] & ~SELECTED != device or list(payload[2:2 + n]) != [b & 0xFF for b in data]):
+            raise Divergence("record {}: sent {} to {:#x}, recorded {} to {:#x}".format(
+                self.position - 1, list(data), device, list(payload[2:2 + n]), payload[0]))
+        return list(payload[2 + n:])
+
+    def clock(self):
+        if (self.sampling):
+            self.now = self.next(CLOCK)[1]
+        return self.now
+
+    def sampled(self, func):
+        def sampled():
+            self.sampling = True
+            try:
+                return func()
+            finally:
+                self.sampling = False
+        return sampled
+
+
+class ReplayPin:
+
+    def __init__(self, replay, pin):
+        self.replay = replay
+        self.pin = pin
+        self.when_activated = None
+
+    @property
+    def value(self):
+        kind, stamp, payload = self.replay.next(PIN)
+        if (payload[0] != self.pin):
+            raise Divergence("record {}: read pin {}, recorded pin {}".format(
+                self.replay.position - 1, self.pin, payload[0]))
+        return payload[1]
+
+
+class ReplaySpi:
+    # stands in for spidev.SpiDev
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.device = None
+        self.mode = 0
+        self.max_speed_hz = 0
+
+    def open(self, bus, device):
+        self.device = device
+
+    def xfer2(self, data):
+        return self.replay.transfer(self.device, data)
+
+    def close(self):
+        return
+
+
+class ReplayTransport:
+    # answers queries with the recorded replies, or from a simulated scope
+    # when the session asks something the recording never did
+    # commands and queries are checked line by line in the order sent; knob
+    # settings are coalesced by timing in the live transport, so for those
+    # only the last setting sent per header is checked
+
+    def __init__(self, records):
+        from scope_sim import SimulatedScope
+        from scpi import REPLY_END
+        from scpi_stats import header_of
+
+        self.scope = SimulatedScope(autoscale_time=0)
+        self.reply_end = REPLY_END
+        self.header_of = header_of
+        self.recorded = []   # [line sent, reply, coalesced] in the order sent
+        for kind, stamp, payload in records:
+            if (kind == SCPI_OUT or kind == SCPI_LATEST):
+                self.recorded.append([payload, None, kind == SCPI_LATEST])
+            elif (kind == SCPI_IN):
+                # one prompt per line, the greeting arrives with none outstanding
+                for line in self.recorded:
+                    if (line[1] is None):
+                        line[1] = payload
+                        break
+        self.position = 0
+        self.sent = 0
+        self.lines = []      # commands and queries sent in the replay, in order
+        self.latest = {}     # header: last knob setting sent in the replay
+
+    def reply(self, cmd, coalesced=False):
+        cmd = bytes(cmd)
+        self.sent += 1
+        if (coalesced):
+            self.latest[self.header_of(cmd)] = cmd
+        else:
+            self.lines.append(cmd)
+        result = self.scope.execute(cmd.strip())   # kept in step either way
+
+        for i in range(self.position, len(self.recorded)):
+            line, reply, recorded_coalesced = self.recorded[i]
+            if (line == cmd and reply is not None):
+                self.position = i + 1
+                return reply
+
+        reply = cmd
+        if (result is not None):
+            reply += result + b'\r\n'
+        return reply + self.reply_end[2:]
+
+    def differences(self):
+        differences = []
+        ordered = [line for line, reply, coalesced in self.recorded if not coalesced]
+        for i in range(max(len(ordered), len(self.lines))):
+            sent = self.lines[i] if i < len(self.lines) else None
+            line = ordered[i] if i < len(ordered) else None
+            if (sent != line):
+                differences.append("line {}: sent {!r}, recorded {!r}".format(i, sent, line))
+                break   # everything after is shifted
+
+        recorded = {}
+        for line, reply, coalesced in self.recorded:
+            if (coalesced):
+                recorded[self.header_of(line)] = line
+        differences += ["{}: last sent {!r}, recorded {!r}".format(header, self.latest.get(header), line)
+                        for header, line in recorded.items() if self.latest.get(header) != line]
+        return differences
+
+    def start(self):
+        return
+
+    def done(self, value):
+        future = Future()
+        future.set_result(value)
+        return future
+
+    def send(self, cmd):
+        self.reply(cmd)
+
+    def send_latest(self, cmd):
+        self.reply(cmd, True)
+
+    def query(self, cmd):
+        return self.done(self.reply(cmd))
+
+    def query_all(self, cmds):
+        return self.done([self.reply(cmd) for cmd in cmds])
+
+    def expect(self):
+        return self.done(b'')
+
+    def close(self):
+        return
+
+
+class ReplayBackend(Simulated):
+    # an emulated panel whose pins, SPI replies, clock and scope come from a trace
+
+    def __init__(self, records):
+        from panel_sim import PanelSimulator
+
+        self.panel = PanelSimulator()
+        self.sim = None
+        self.session = Replay(records)
+        self.scpi = ReplayTransport(records)
+        self.clock = self.session.clock
+
+    def sampled(self, func):
+        return self.session.sampled(func)
+
+    def input(self, pin, pull_up=False):
+        return ReplayPin(self.session, pin)
+
+    def spi(self):
+        return ReplaySpi(self.session)
+
+    def address(self):
+        return "replay", 0
+
+    def connect(self, remote_ip, port):
+        return None
+
+    def transport(self, sock, queue_size, coalesce_interval, stats):
+        return self.scpi
+
+
+def replay(path):
+    import scope
+
+    records = read_trace(path)
+    recorded_time = records[-1][1] - records[0][1] if records else 0
+
+    backend = ReplayBackend(records)
+    session = backend.session
+    transport = backend.scpi
+    error = None
+    start = perf_counter()
+    try:
+        app = scope.setup(backend)
+        start = perf_counter()   # setup() waits on the connection screen
+
+        # main() without its threads: the LCD is drawn as each frame is flushed
+        scope.start_panel()
+        while True:
+            app.service_inputs()
+            scope.run_actions()
+    except EndOfTrace:
+        pass
+    except Divergence as e:
+        error = e
+    elapsed = perf_counter() - start
+
+    print("replayed {} of {} input records in {:.3f} s, recorded over {:.3f} s ({:.0f}x)".format(
+        session.position, len(session.inputs), elapsed, recorded_time,
+        recorded_time / elapsed if elapsed > 0 else 0))
+    print("SCPI lines: {} sent, {} recorded".format(transport.sent, len(transport.recorded)))
+    for difference in transport.differences():
+        print("SCPI diverged at " + difference)
+    if (error is not None):
+        print("input diverged at " + str(error))
+
+    print(scope.encoder_report() + scope.App.Inputs.report())
+    print("\n".join(backend.panel.lcd.lines()))
+
+def dump(path):
+    records = read_trace(path)
+    start = records[0][1] if records else 0
+    for kind, stamp, payload in records:
+        if (kind == SPI):
+            n = payload[1]
+            text = "chip {:#04x} out {} in {}".format(payload[0], payload[2:2 + n].hex(), payload[2 + n:].hex())
+        elif (kind == PIN):
+            text = "pin {} = {}".format(payload[0], payload[1])
+        elif (kind == CLOCK):
+            text = ""
+        else:
+            text = repr(payload)
+        print("{:12.6f} {:6} {}".format(stamp - start, NAMES[kind], text))
+
+def main():
+    parser = ArgumentParser(description="dump or replay a scope.py trace")
+    parser.add_argument("action", choices=["dump", "replay"])
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    if (args.action == "dump"):
+        dump(args.path)
+    else:
+        replay(args.path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# SCPI transport for the DSO6104L telnet port (5024)
+# kept free of any Raspberry Pi imports so it can run on any machine
+
+import asyncio
+import socket
+import struct
+from collections import deque
+from concurrent.futures import Future
+from sys import maxsize
+from threading import BoundedSemaphore
+from threading import Event
+from threading import Thread
+from time import monotonic
+
+from scpi_parse import REPLY_END
+
+
+def open_socket(remote_ip, port, timeout=None):
+    # Code provided by Agilent/Keysight with minor modifications
+
+    #create an AF_INET, STREAM socket (TCP)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    if maxsize > 2**32:
+      time = struct.pack(str("ll"), int(1), int(0))
+    else:
+      time = struct.pack(str("ii"), int(1), int(0))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, time)
+
+    sock.settimeout(timeout)
+    try:
+        sock.connect((remote_ip, port))
+    except OSError:
+        sock.close()
+        raise
+
+    sock.settimeout(None)
+    return sock
+
+
+class ReplyParser: # incremental parser, splits the port 5024 stream at each prompt
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+        replies = []
+        start = 0
+        while (True):
+            end = self.buffer.find(REPLY_END, start)
+            if (end < 0):
+                break
+
+            end += len(REPLY_END)
+            replies.append(bytes(self.buffer[start:end]))
+            start = end
+
+        del self.buffer[:start]
+        return replies
+
+
+class LatestWrites: # holds back knob settings, keeping the newest per SCPI header
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}
+        self.last_flush = 0
+
+    def put(self, cmd):
+        header = cmd.split(b' ', 1)[0]
+        self.pending[header] = cmd
+
+    def time_left(self):
+        return max(0, self.interval - (monotonic() - self.last_flush))
+
+    def is_due(self):
+        return self.time_left() == 0
+
+    def take(self):
+        cmds = list(self.pending.values())
+        self.pending.clear()
+        self.last_flush = monotonic()
+        return cmds
+
+
+class AsyncScpiClient:
+    # every line sent is answered by one prompt, so replies are matched to
+    # requests in the order they were written
+    # only call from the event loop that owns the streams
+
+    def __init__(self, reader, writer, coalesce_interval, stats=None, trace=None):
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.parser = ReplyParser()
+        self.writes = LatestWrites(coalesce_interval)
+        self.flush_handle = None
+        self.stats = stats           # ScpiStats, or None to not time round trips
+        self.trace = trace           # TraceRecorder, or None to not record lines and replies
+        self.outstanding = deque()   # (future or None, cmd, time written) per line sent
+        self.unclaimed = deque()     # replies that arrived with nothing sent
+        self.error = None
+
+    @classmethod
+    async def connect(cls, sock, coalesce_interval, stats=None, trace=None):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        return cls(reader, writer, coalesce_interval, stats, trace)
+
+    def send(self, cmd):
+        self.write(cmd, None)
+
+    def send_latest(self, cmd):
+        # only the newest value per header is sent each coalesce interval
+        self.writes.put(cmd)
+        if (self.writes.is_due()):
+            self.flush_writes()
+        elif (self.flush_handle is None):
+            self.flush_handle = self.loop.call_later(self.writes.time_left(), self.flush_writes)
+
+    def query(self, cmd):
+        reply = self.loop.create_future()
+        self.write(cmd, reply)
+        return reply
+
+    def query_all(self, cmds):
+        # pipelines the queries, the result lists the replies in order
+        return asyncio.gather(*[self.query(cmd) for cmd in cmds])
+
+    def expect(self):
+        # for output the scope sends unprompted, e.g. the greeting
+        reply = self.loop.create_future()
+        if (self.unclaimed):
+            reply.set_result(self.unclaimed.popleft())
+        else:
+            self.outstanding.append((reply, None, monotonic()))
+        return reply
+
+    def write(self, cmd, reply):
+        if (self.error is not None):
+            raise self.error
+
+        # anything held back goes first so commands reach the scope in order
+        if (self.writes.pending):
+            self.flush_writes()
+
+        self.writer.write(cmd)
+        self.outstanding.append((reply, cmd, monotonic()))
+        if (self.trace is not None):
+            self.trace.scpi_out(cmd)
+
+    def flush_writes(self):
+        if (self.flush_handle is not None):
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if (self.error is not None):
+            self.writes.take()   # the connection is gone, call() reports self.error
+            return
+
+        for cmd in self.writes.take():
+            self.writer.write(cmd)
+            self.outstanding.append((None, cmd, monotonic()))
+            if (self.trace is not None):
+                self.trace.scpi_latest(cmd)
+
+    async def read_replies(self):
+        try:
+            while (True):
+                data = await self.reader.read(4096)
+                if (not data):
+                    raise ConnectionError("Connection closed by the scope")
+
+                for reply in self.parser.feed(data):
+                    self.resolve(reply)
+
+        except Exception as e:
+            self.error = e
+            while (self.outstanding):
+                reply = self.outstanding.popleft()[0]
+                if (reply is not None and not reply.done()):
+                    reply.set_exception(e)
+
+    def resolve(self, reply):
+        if (self.trace is not None):
+            self.trace.scpi_in(reply)
+        if (not self.outstanding):
+            self.unclaimed.append(reply)
+            return
+
+        owner, cmd, written = self.outstanding.popleft()
+        if (self.stats is not None and cmd is not None):
+            self.stats.record_round_trip(cmd, len(reply), monotonic() - written)
+        if (owner is not None and not owner.done()):
+            owner.set_result(reply)
+
+    def close(self):
+        self.writer.close()
+
+
+class ScpiTransport(Thread):
+    # runs an AsyncScpiClient on its own event loop so that the input loop
+    # only ever waits for a free request slot, never for the socket
+
+    def __init__(self, sock, queue_size, coalesce_interval, stats=None, trace=None):
+        super().__init__(name="scpi-transport", daemon=True)
+        self.sock = sock
+        self.coalesce_interval = coalesce_interval
+        self.stats = stats
+        self.trace = trace
+        self.slots = BoundedSemaphore(queue_size)   # requests not yet handed to the loop
+        self.loop = asyncio.new_event_loop()
+        self.client = None
+        self.failure = None   # raised by a request on the loop, for the caller's next call()
+        self.connected = Event()
+
+    def start(self):
+        super().start()
+        self.connected.wait()
+        if (self.client is None):
+            raise ConnectionError("Unable to start the SCPI client")
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.connected.set()
+            self.loop.close()
+
+    async def serve(self):
+        self.client = await AsyncScpiClient.connect(self.sock, self.coalesce_interval, self.stats, self.trace)
+        self.connected.set()
+        await self.client.read_replies()
+
+    def call(self, func, *args):
+        if (self.failure is not None):
+            raise self.failure
+        if (self.client.error is not None):
+            raise self.client.error
+
+        self.slots.acquire()   # blocks only while the loop is this far behind
+        self.loop.call_soon_threadsafe(self.run_request, func, args)
+
+    def run_request(self, func, args):
+        self.slots.release()
+        try:
+            func(*args)
+        except Exception as e:
+            # send() and send_latest() have already returned, so keep the
+            # failure for the next call() rather than leave it to the loop's handler
+            self.failure = e
+
+    def send(self, cmd):
+        self.call(self.client.send, cmd)
+
+    def send_latest(self, cmd):
+        self.call(self.client.send_latest, cmd)
+
+    def query(self, cmd):
+        reply = Future()
+        self.call(self.forward, self.client.query, (cmd,), reply)
+        return reply
+
+    def query_all(self, cmds):
+        reply = Future()
+        self.call(self.forward, self.client.query_all, (cmds,), reply)
+        return reply
+
+    def expect(self):
+        reply = Future()
+        self.call(self.forward, self.client.expect, (), reply)
+        return reply
+
+    def forward(self, func, args, target):
+        # hands the result of an awaitable on the loop to a waiting thread
+        try:
+            source = func(*args)
+        except Exception as e:
+            target.set_exception(e)
+            return
+
+        def done(source):
+            if (source.cancelled()):
+                target.cancel()
+            elif (source.exception() is not None):
+                target.set_exception(source.exception())
+            else:
+                target.set_result(source.result())
+
+        source.add_done_callback(done)
+
+    def close(self):
+        if (self.client is not None and self.is_alive()):
+            self.loop.call_soon_threadsafe(self.client.close)
+            self.join(1)
@@ -0,0 +1,55 @@
+# Parsing of DSO6104L replies and formatting of SCPI numbers
+# fields are handed out as memoryview slices of the reply, nothing is copied
+# until a value is stored in the model
+
+from math import floor
+
+REPLY_END = b'\r\n> '   # prompt that ends every reply on port 5024
+SEPARATOR = ord(';')
+NEWLINE = ord('\n')
+
+
+def reply_fields(reply):
+    # fields of the reply line just before the prompt, in one pass,
+    # one field per query of a compound query
+    end = len(reply) - len(REPLY_END)
+    start = reply.rfind(NEWLINE, 0, end) + 1
+    view = memoryview(reply)
+
+    fields = []
+    while (True):
+        split = reply.find(SEPARATOR, start, end)
+        if (split < 0):
+            fields.append(view[start:end])
+            return fields
+
+        fields.append(view[start:split])
+        start = split + 1
+
+def split_exponent(field):
+    # NR3 mantissa and exponent, e.g. +5.00000E+00 -> +5.00000, +00
+    for i in range(len(field) - 1, -1, -1):
+        if (field[i] == 69 or field[i] == 101): # 'E', 'e'
+            return field[:i], field[i+1:]
+    return field, memoryview(b'+0')
+
+def parse_number(field):
+    # NR1 gives an int, NR2/NR3 a correctly rounded float, so values such
+    # as +2.50000E-03 come out the same as the literal 2.5e-3
+    text = field.tobytes() if isinstance(field, memoryview) else bytes(field)
+    if (b'.' in text or b'E' in text or b'e' in text):
+        return float(text)
+    return int(text)
+
+def parse_enum(field):
+    # enumerated replies are kept as bytes, e.g. b'MAIN', b'CHAN1'
+    return bytes(field)
+
+def parse_bool(field):
+    return field[0:1] == b'1'
+
+def format_number(num, is_integer):
+    if (is_integer):
+        return b'%+d' % floor(num)
+    # 15 significant digits drops any drift left by 1-2-5 stepping
+    return b'%+.15g' % num
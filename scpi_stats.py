@@ -0,0 +1,148 @@
+# Latency statistics for the SCPI round trips to the DSO6104L
+# every line sent is timed from the write to its prompt coming back and
+# every parse of a reply is timed, both kept per SCPI header in
+# fixed-bucket histograms so recording never allocates per sample
+#
+# the table is written to a file every interval and on request_dump(),
+# which is safe to call from a signal handler
+
+import os
+from bisect import bisect_left
+from sys import stdout
+from threading import Event
+from threading import Lock
+from threading import Thread
+
+# upper edges of the histogram buckets in ms, the last bucket is open ended
+BUCKETS_MS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def header_of(cmd):
+    # b':CHAN1:SCAL +5E-01\r\n' -> 'CHAN1:SCAL', a compound query keeps every header
+    units = bytes(cmd).strip().split(b';')
+    return b';'.join(unit.strip().split(b' ', 1)[0].lstrip(b':') for unit in units).decode(errors="replace")
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ms):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if (ms > self.max):
+            self.max = ms
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, p):
+        # upper edge of the bucket holding the p-th percentile, never above the max seen
+        if (not self.count):
+            return 0
+        target = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if (seen >= target and n):
+                return min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+
+class HeaderStats:
+
+    def __init__(self):
+        self.wait = Histogram()    # write to prompt
+        self.parse = Histogram()   # reply to model updated
+        self.sent = 0
+        self.received = 0
+
+
+class ScpiStats:
+
+    def __init__(self, path=None, interval=60):
+        self.path = path
+        self.interval = interval
+        self.headers = {}
+        self.lock = Lock()
+        self.dump_requested = Event()
+        self.writer = None
+        self.reports = []   # functions returning more text for the dump
+
+    def get(self, cmd):
+        header = header_of(cmd)
+        stats = self.headers.get(header)
+        if (stats is None):
+            stats = self.headers[header] = HeaderStats()
+        return stats
+
+    def add_report(self, report):
+        self.reports.append(report)
+
+    def record_round_trip(self, cmd, received, seconds):
+        with self.lock:
+            stats = self.get(cmd)
+            stats.wait.add(seconds * 1000)
+            stats.sent += len(cmd)
+            stats.received += received
+
+    def record_parse(self, cmd, seconds):
+        with self.lock:
+            self.get(cmd).parse.add(seconds * 1000)
+
+    def format(self):
+        with self.lock:
+            rows = sorted(self.headers.items(), key=lambda item: item[1].wait.total, reverse=True)
+            lines = ["{:40} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+                "header", "count", "sent B", "recv B", "wait p50", "p99", "max", "total", "parse avg")]
+            for header, stats in rows:
+                lines.append("{:40} {:7} {:9} {:9} {:9.2f} {:9.2f} {:9.2f} {:9.1f} {:9.3f}".format(
+                    header[:40], stats.wait.count, stats.sent, stats.received,
+                    stats.wait.percentile(50), stats.wait.percentile(99), stats.wait.max,
+                    stats.wait.total, stats.parse.mean()))
+
+            lines.append("")
+            lines.append("wait histograms, ms upper edge: count")
+            edges = [str(edge) for edge in BUCKETS_MS] + ["inf"]
+            for header, stats in rows:
+                buckets = ["{}:{}".format(edge, n) for edge, n in zip(edges, stats.wait.counts) if n]
+                lines.append("  " + header + "  " + " ".join(buckets))
+        text = "\n".join(lines) + "\n"
+
+        for report in self.reports:
+            text += "\n" + report()
+        return text
+
+    def write(self):
+        # replaced in one step so a reader never sees half a table
+        if (self.path is None):
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(self.format())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(e)
+
+    def request_dump(self, *args):
+        # only sets an event, so it can be used directly as a signal handler
+        self.dump_requested.set()
+
+    def start(self):
+        self.writer = Thread(target=self.run, name="scpi-stats", daemon=True)
+        self.writer.start()
+
+    def run(self):
+        while (True):
+            requested = self.dump_requested.wait(self.interval)
+            self.dump_requested.clear()
+            if (requested):
+                stdout.write(self.format())
+                stdout.flush()
+            self.write()
@@ -0,0 +1,116 @@
+# Every key of the 6x6 matrix, pressed on the emulated panel, is debounced
+# and scanned down to its own row and column
+
+import pytest
+
+import scope
+from conftest import take_inputs
+
+ROWS = (scope.R1, scope.R2, scope.R3, scope.R4, scope.R5, scope.R6)
+COLS = (scope.C1, scope.C2, scope.C3, scope.C4, scope.C5, scope.C6)
+
+
+def release(panel, clock, row, col):
+    panel.release(row, col)
+    scope.App.service_inputs()
+    clock.advance(scope.DEBOUNCE)
+    scope.App.service_inputs()
+
+
+@pytest.mark.parametrize("col", COLS, ids=["C1", "C2", "C3", "C4", "C5", "C6"])
+@pytest.mark.parametrize("row", ROWS, ids=["R1", "R2", "R3", "R4", "R5", "R6"])
+def test_key_scans_to_its_row_and_column(panel, clock, row, col):
+    keys = scope.App.Keys
+    panel.press(row, col)
+    scope.App.service_inputs()
+    assert take_inputs() == []   # nothing until DEBOUNCE has passed
+
+    clock.advance(scope.DEBOUNCE)
+    scope.App.service_inputs()
+    assert take_inputs() == [(keys, row, col)]
+
+    release(panel, clock, row, col)
+    assert keys.state == keys.IDLE
+    assert take_inputs() == []
+
+
+def test_press_shorter_than_debounce_is_ignored(panel, clock):
+    keys = scope.App.Keys
+    panel.press(scope.R3, scope.C4)
+    scope.App.service_inputs()
+    panel.release(scope.R3, scope.C4)
+    clock.advance(scope.DEBOUNCE)
+    scope.App.service_inputs()
+    assert keys.state == keys.IDLE
+    assert take_inputs() == []
+
+
+def test_release_bounce_does_not_repeat_the_key(panel, clock):
+    keys = scope.App.Keys
+    panel.press(scope.R6, scope.C1)
+    scope.App.service_inputs()
+    clock.advance(scope.DEBOUNCE)
+    scope.App.service_inputs()
+    assert take_inputs() == [(keys, scope.R6, scope.C1)]
+
+    panel.release(scope.R6, scope.C1)
+    scope.App.service_inputs()
+    panel.press(scope.R6, scope.C1)   # contact bounces back before DEBOUNCE
+    scope.App.service_inputs()
+    clock.advance(scope.DEBOUNCE)
+    scope.App.service_inputs()
+    assert keys.state == keys.HELD
+    assert take_inputs() == []
+
+    release(panel, clock, scope.R6, scope.C1)
+    assert keys.state == keys.IDLE
+
+
+class BusyLine: # interrupt5 held active by a knob that keeps turning for a number of passes
+
+    def __init__(self, passes):
+        self.passes = passes
+        self.heads = []   # the input queue's head at each read
+
+    @property
+    def value(self):
+        self.heads.append(scope.App.Inputs.head)
+        return len(self.heads) <= self.passes
+
+
+def test_key_is_confirmed_while_a_knob_turns(panel, clock, monkeypatch):
+    keys = scope.App.Keys
+    panel.press(scope.R2, scope.C5)
+    scope.App.service_inputs()
+    clock.advance(scope.DEBOUNCE)
+
+    line = BusyLine(5)
+    monkeypatch.setattr(scope.App, "interrupt5", line)
+    scope.App.service_inputs()
+    assert line.heads[line.passes - 1] > line.heads[0]   # queued before the line went low
+    assert take_inputs() == [(keys, scope.R2, scope.C5)]
+
+    monkeypatch.undo()
+    release(panel, clock, scope.R2, scope.C5)
+    assert keys.state == keys.IDLE
+
+
+@pytest.mark.parametrize("pressed, first", [
+    (((scope.R5, scope.C3), (scope.R2, scope.C3)), (scope.R2, scope.C3)),
+    (((scope.R6, scope.C1), (scope.R1, scope.C6)), (scope.R1, scope.C6)),
+], ids=["same column", "R1 and R6"])
+def test_rows_active_together_take_the_first_row(panel, clock, pressed, first):
+    # R1 comes before R6, as in the row cascade this replaced
+    keys = scope.App.Keys
+    panel.press_together(pressed)
+    scope.App.service_inputs()
+    clock.advance(scope.DEBOUNCE)
+    scope.App.service_inputs()
+    assert take_inputs() == [(keys,) + first]
+
+    panel.release_together(pressed)
+    scope.App.service_inputs()
+    clock.advance(scope.DEBOUNCE)
+    scope.App.service_inputs()
+    assert keys.state == keys.IDLE
+    assert take_inputs() == []
@@ -0,0 +1,49 @@
+# The idle screen shows settings in compact engineering notation, and
+# float residue left by turning a knob out and back reads as 0
+
+import pytest
+
+import scope
+
+
+@pytest.mark.parametrize("value, width, text", [
+    (0.5, 4, "500m"),
+    (-0.0125, 6, "-12.5m"),
+    (1e-4, 4, "100u"),
+    (5e-10, 6, "500p"),
+    (1e-12, 4, "1p"),
+    (0.9997, 4, "1"),
+    (0, 5, "0"),
+    (7e-18, 5, "0"),
+    (-1e-18, 6, "0"),
+    (-3.7499999999999985e-4, 6, "-375u"),
+])
+def test_engineering(value, width, text):
+    assert scope.engineering(value, width) == text
+
+
+def knobs_out_and_back(cw, ccw):
+    for n in (1, 3, 2, 5, 1):
+        cw(n)
+    for n in range(12):
+        ccw()
+
+
+def test_out_and_back_reads_zero(panel):
+    state = scope.App.Scope
+    channel, timebase = state.Channel1, state.Timebase
+    try:
+        knobs_out_and_back(channel.cw_offset, channel.ccw_offset)
+        knobs_out_and_back(timebase.ccw_delay, timebase.cw_delay)
+        lines = scope.App.Dashboard.render()
+        assert lines[0].split()[2] == "0"
+        assert lines[2].split()[-1] == "D0"
+
+        channel.offset = 7e-18   # residue as an unrounded model would leave it
+        timebase.position = 1e-18
+        lines = scope.App.Dashboard.render()
+        assert lines[0].split()[2] == "0"
+        assert lines[2].split()[-1] == "D0"
+    finally:
+        channel.zero_offset()
+        timebase.zero_delay()
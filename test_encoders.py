@@ -0,0 +1,101 @@
+# The quadrature table decodes every single step the way the chained
+# comparisons it replaced did, and handles the reads the old decoder
+# could not: the first one and those that missed a transition
+
+import random
+
+import scope
+from conftest import take_inputs
+
+
+def old_step(previous, state):
+    # Encoder.update before the QUADRATURE table, on AB states:
+    # True clockwise, False counter-clockwise, None no step
+    a0, b0 = previous >> 1, previous & 1
+    a, b = state >> 1, state & 1
+    if ((a != a0) != (b != b0)):
+        if (a != a0):
+            return a != b
+        return a == b
+    return None
+
+
+def encoder(state):
+    # one enabled encoder on bits 1 (A) and 0 (B), one action per step
+    e = scope.Encoder(1, 0)
+    e.enabled = True
+    e.update(state)   # resting level
+    return e
+
+
+def test_table_matches_old_decoder_on_single_steps():
+    for previous in range(4):
+        for state in range(4):
+            step = scope.QUADRATURE[previous << 2 | state]
+            if (previous ^ state == 3):
+                assert step == scope.SKIPPED
+            elif (old_step(previous, state) is None):
+                assert step == 0
+            else:
+                assert (step > 0) == old_step(previous, state)
+
+
+def test_random_walk_matches_old_decoder(panel):
+    rng = random.Random(13)
+    state = 0b11
+    e = encoder(state)
+    take_inputs()
+    expected = []
+    queued = []
+    for i in range(2000):
+        if (rng.random() < 0.2):
+            following = state   # a read with nothing changed
+        else:
+            following = state ^ rng.choice((1, 2))
+        direction = old_step(state, following)
+        if (direction is not None):
+            expected.append((e, 1 if direction else -1, 0))
+        e.update(following)
+        queued += take_inputs()   # drained per read, the queue holds INPUT_QUEUE
+        state = following
+    assert queued == expected
+    assert e.skipped == 0
+
+
+def test_first_read_only_takes_the_resting_level(panel):
+    take_inputs()
+    for state in range(4):
+        e = scope.Encoder(1, 0)
+        e.enabled = True
+        e.update(state)
+        assert e.state == state
+        assert e.skipped == 0
+    assert take_inputs() == []
+
+
+def test_missed_transition_before_any_step_is_dropped(panel):
+    e = encoder(0b11)
+    take_inputs()
+    e.update(0b00)
+    assert e.skipped == 1
+    assert take_inputs() == []
+
+
+def test_missed_transition_continues_the_last_direction(panel):
+    e = encoder(0b00)
+    e.update(0b10)   # one clockwise step, see QUADRATURE
+    take_inputs()
+    e.update(0b01)   # both bits changed
+    assert e.skipped == 1
+    assert take_inputs() == [(e, 2, 0)]
+
+
+def test_bank_first_read_does_not_move_resting_encoders(panel):
+    bank = scope.EncoderBank(None, 0)
+    bank.encoders = [scope.Encoder(1, 0), scope.Encoder(3, 2)]
+    for e in bank.encoders:
+        e.enabled = True
+    take_inputs()
+    bank.update(0b1111)
+    assert [e.state for e in bank.encoders] == [0b11, 0b11]
+    assert take_inputs() == []
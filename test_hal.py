@@ -0,0 +1,16 @@
+# Importing scope.py and the backends leaves asyncio, the Pi libraries and
+# the simulators to the backend that needs them
+
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize("module", ["hal", "scope"])
+def test_import_leaves_transport_and_simulators_out(module):
+    check = ("import sys, {}; "
+             "print(sorted(m for m in ('asyncio', 'scpi', 'panel_sim', 'scope_sim', 'gpiozero', 'spidev') "
+             "if m in sys.modules))").format(module)
+    out = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
@@ -0,0 +1,111 @@
+# The framebuffer sends the display only the cells that changed, one cursor
+# move per run, and the writer thread drops a frame replaced before it
+# was drawn
+
+from threading import Event
+
+from lcd_frame import FrameBuffer
+
+
+class RecordingLcd: # the CharLCD calls FrameBuffer makes, in order
+
+    def __init__(self):
+        self.calls = []
+        self.busy = None   # Event set while a write is held
+        self.gate = None   # Event a write waits for, None to not hold
+
+    @property
+    def cursor_pos(self):
+        return next((c[1] for c in reversed(self.calls) if c[0] == "move"), (0, 0))
+
+    @cursor_pos.setter
+    def cursor_pos(self, pos):
+        self.calls.append(("move", pos))
+
+    def write_string(self, value):
+        self.calls.append(("char", value))
+        if (self.gate is not None):
+            self.busy.set()
+            self.gate.wait(1)
+
+    def write(self, value):
+        self.calls.append(("code", value))
+
+    def clear(self):
+        self.calls.append(("clear",))
+
+    def create_char(self, location, bitmap):
+        self.calls.append(("create", location))
+
+
+def drawn(text):
+    lcd = RecordingLcd()
+    frame = FrameBuffer(lcd)
+    frame.write_string(text)
+    frame.flush()
+    del lcd.calls[:]
+    return lcd, frame
+
+
+def test_unchanged_frame_writes_nothing():
+    lcd, frame = drawn("1.Channel\r\n2.Timebase")
+    frames, commands = frame.frames, frame.commands
+    frame.clear()
+    frame.write_string("1.Channel\r\n2.Timebase")
+    frame.flush()
+    assert lcd.calls == []
+    assert (frame.frames, frame.commands) == (frames, commands)
+
+
+def test_single_cell_change_is_one_positioned_run():
+    lcd, frame = drawn("1.Channel\r\n2.Timebase")
+    commands = frame.commands
+    frame.cursor_pos = (1, 4)
+    frame.write_string("M")
+    frame.flush()
+    assert lcd.calls == [("move", (1, 4)), ("char", "M")]
+    assert frame.commands == commands + 2
+
+
+def test_close_changes_merge_into_one_run():
+    lcd, frame = drawn("abcdef")
+    frame.cursor_pos = (0, 1)
+    frame.write_string("X")
+    frame.cursor_pos = (0, 3)
+    frame.write_string("Y")
+    frame.write(0)   # a custom character
+    frame.flush()
+    assert lcd.calls == [("move", (0, 1)), ("char", "X"), ("char", "c"), ("char", "Y"), ("code", 0)]
+
+
+def test_runs_on_other_rows_each_move_the_cursor():
+    lcd, frame = drawn("")
+    frame.cursor_pos = (0, 19)
+    frame.write_string("a")
+    frame.cursor_pos = (2, 0)
+    frame.write_string("b")
+    frame.flush()
+    assert lcd.calls == [("move", (0, 19)), ("char", "a"), ("move", (2, 0)), ("char", "b")]
+
+
+def test_writer_drops_a_frame_replaced_before_it_is_drawn():
+    lcd, frame = drawn("")
+    lcd.busy = Event()
+    lcd.gate = Event()
+    frame.start()
+
+    frame.write_string("A")
+    frame.flush()
+    assert lcd.busy.wait(1)   # the writer is drawing A
+    frame.clear()
+    frame.write_string("B")
+    frame.flush()   # waits for the writer
+    frame.clear()
+    frame.write_string("C")
+    frame.flush()   # replaces B
+    lcd.gate.set()
+    frame.drain()
+
+    assert frame.dropped == 1
+    assert [c for c in lcd.calls if c[0] == "char"] == [("char", "A"), ("char", "C")]
+    assert frame.shown[0][0] == "C"
@@ -0,0 +1,92 @@
+# Every page of every menu draws the same cells from the page cache as it
+# does item by item, and a cached page follows changes to its texts and
+# toggle setting
+
+import pytest
+
+import scope
+
+MENUS = {
+    "channel1": lambda s: s.Channel1.Menu,
+    "channel2": lambda s: s.Channel2.Menu,
+    "channel3": lambda s: s.Channel3.Menu,
+    "channel4": lambda s: s.Channel4.Menu,
+    "timebase": lambda s: s.Timebase.Menu,
+    "trigger": lambda s: s.Trigger.Menu,
+    "cursor": lambda s: s.Cursor.Menu,
+    "cursor select": lambda s: s.Cursor.ActiveCursorMenu,
+    "measure": lambda s: s.Measure.Menu,
+}
+
+
+def screen(monkeypatch, menu, cached):
+    monkeypatch.setattr(scope, "MENU_CACHE", cached)
+    menu.display_menu()
+    return [row[:] for row in scope.App.lcd.cells]
+
+
+def pages(menu):
+    # (description, menu, start_index, setting) for every page of the menu
+    # and the menus under it
+    if (isinstance(menu, scope.ListMenu) and menu.max_index >= 0):
+        for start in range(max(1, menu.max_index - 2)):
+            yield "{} from item {}".format(menu.text, start + 1), menu, start, None
+        for item in menu.menu_items:
+            yield from pages(item)
+    elif (isinstance(menu, scope.ToggleMenu) and menu.options_set):
+        for value in (True, False):
+            yield "{} set {}".format(menu.text, value), menu, None, value
+
+
+@pytest.mark.parametrize("name", MENUS)
+def test_cached_pages_match_drawn_pages(panel, monkeypatch, name):
+    checked = 0
+    for description, menu, start, value in pages(MENUS[name](scope.App.Scope)):
+        menu.enable()
+        if (start is not None):
+            menu.start_index = start
+            menu.cursor = start
+        setting = menu.setting.value if value is not None else None
+        if (value is not None):
+            menu.setting.value = value
+        try:
+            drawn = screen(monkeypatch, menu, False)
+            assert screen(monkeypatch, menu, True) == drawn, description
+        finally:
+            menu.is_active = False
+            if (value is not None):
+                menu.setting.value = setting
+        checked += 1
+    assert checked
+
+
+def test_cached_page_follows_item_text(panel, monkeypatch):
+    menu = scope.App.Scope.Measure.Menu
+    item = menu.menu_items[1]
+    text = item.text
+    menu.enable()
+    try:
+        screen(monkeypatch, menu, True)
+        item.text = "Renamed"
+        cells = screen(monkeypatch, menu, True)
+        assert "".join(str(c) for c in cells[1]).startswith("2.Renamed")
+        assert cells == screen(monkeypatch, menu, False)
+    finally:
+        item.text = text
+        menu.is_active = False
+
+
+def test_cached_page_follows_toggle_setting(panel, monkeypatch):
+    menu = next(m for d, m, s, v in pages(scope.App.Scope.Channel1.Menu) if v is not None)
+    setting = menu.setting.value
+    menu.enable()
+    try:
+        menu.setting.value = True
+        on = screen(monkeypatch, menu, True)
+        menu.setting.value = False
+        off = screen(monkeypatch, menu, True)
+        assert on[1][1] == scope.ACTIVE and off[2][1] == scope.ACTIVE
+        assert off == screen(monkeypatch, menu, False)
+    finally:
+        menu.setting.value = setting
+        menu.is_active = False
@@ -0,0 +1,121 @@
+# The transport splits the port 5024 stream at each prompt however it is
+# read, answers queries in the order they were written, sends held-back
+# knob settings ahead of the next ordered line with only the newest per
+# header, and reports a lost connection to everything still waiting
+
+import asyncio
+import socket
+from concurrent.futures import Future
+
+import pytest
+
+from scpi import AsyncScpiClient
+from scpi import ReplyParser
+from scpi import ScpiTransport
+
+INTERVAL = 10   # long enough that nothing held back is flushed by the timer
+
+
+def received(peer, size):
+    # what the client wrote, as the scope would read it
+    data = b''
+    peer.settimeout(1)
+    while (len(data) < size):
+        more = peer.recv(4096)
+        if (not more):
+            break
+        data += more
+    return data
+
+
+def test_prompt_split_across_reads():
+    parser = ReplyParser()
+    assert parser.feed(b'+1.0E+00\r') == []
+    assert parser.feed(b'\n') == []
+    assert parser.feed(b'> +2') == [b'+1.0E+00\r\n> ']
+    assert parser.feed(b'.0E+00\r\n>') == []
+    assert parser.feed(b' ') == [b'+2.0E+00\r\n> ']
+    assert parser.buffer == b''
+
+
+def test_several_replies_in_one_read():
+    parser = ReplyParser()
+    assert parser.feed(b'1\r\n> 2;3\r\n> 4') == [b'1\r\n> ', b'2;3\r\n> ']
+    assert parser.feed(b'\r\n> ') == [b'4\r\n> ']
+
+
+def test_replies_go_to_queries_in_write_order():
+    async def run(sock, peer):
+        client = await AsyncScpiClient.connect(sock, INTERVAL)
+        reader = asyncio.ensure_future(client.read_replies())
+        first = client.query(b':TIM:SCAL?\r\n')
+        both = client.query_all([b':TIM:POS?\r\n', b':OPER:COND?\r\n'])
+        await asyncio.sleep(0)
+        peer.sendall(b'+1.0E-03\r\n> +2.5E')
+        peer.sendall(b'-04\r\n> +8\r\n> ')
+        replies = (await first, await both)
+        client.close()
+        reader.cancel()
+        return replies
+
+    sock, peer = socket.socketpair()
+    with peer:
+        first, both = asyncio.run(run(sock, peer))
+    assert first == b'+1.0E-03\r\n> '
+    assert both == [b'+2.5E-04\r\n> ', b'+8\r\n> ']
+
+
+def test_held_back_settings_go_first_newest_per_header():
+    async def run(sock):
+        client = await AsyncScpiClient.connect(sock, INTERVAL)
+        client.send_latest(b'TIM:POS 1.0E-03\r\n')   # the first is due straight away
+        client.send_latest(b'TIM:POS 2.0E-03\r\n')
+        client.send_latest(b'CHAN1:OFFS 1.0E+00V\r\n')
+        client.send_latest(b'TIM:POS 3.0E-03\r\n')   # replaces 2.0E-03
+        client.query(b':TIM:POS?\r\n')
+        await client.writer.drain()
+        client.close()
+
+    expected = (b'TIM:POS 1.0E-03\r\n'
+                b'TIM:POS 3.0E-03\r\n'
+                b'CHAN1:OFFS 1.0E+00V\r\n'
+                b':TIM:POS?\r\n')
+    sock, peer = socket.socketpair()
+    with peer:
+        asyncio.run(run(sock))
+        assert received(peer, len(expected)) == expected
+
+
+def test_closed_connection_fails_waiting_queries_and_next_call():
+    sock, peer = socket.socketpair()
+    transport = ScpiTransport(sock, 8, INTERVAL)
+    transport.start()
+    try:
+        reply = transport.query(b':TIM:SCAL?\r\n')
+        received(peer, len(b':TIM:SCAL?\r\n'))
+        peer.close()
+        with pytest.raises(ConnectionError):
+            reply.result(1)
+        with pytest.raises(ConnectionError):
+            transport.send(b':RUN\r\n')
+    finally:
+        transport.close()
+
+
+def test_failure_on_the_loop_reaches_next_call():
+    def fail():
+        raise ValueError("bad request")
+
+    sock, peer = socket.socketpair()
+    with peer:
+        transport = ScpiTransport(sock, 8, INTERVAL)
+        transport.start()
+        try:
+            transport.call(fail)
+            ran = Future()   # the loop runs callbacks in order, so fail() has run
+            transport.loop.call_soon_threadsafe(ran.set_result, None)
+            ran.result(1)
+            with pytest.raises(ValueError):
+                transport.send(b':RUN\r\n')
+        finally:
+            transport.close()
@@ -0,0 +1,94 @@
+# Replies split into the same fields and numbers come out the same as the
+# float(reply.decode()) parsing they replaced, and settings are formatted
+# the way the 1-2-5 stepping sends them
+
+import pytest
+
+from scpi_parse import format_number
+from scpi_parse import parse_bool
+from scpi_parse import parse_enum
+from scpi_parse import parse_number
+from scpi_parse import reply_fields
+from scpi_parse import split_exponent
+
+FIELDS = [
+    (b'+5.00000E+00\r\n> ', [b'+5.00000E+00']),
+    (b'MAIN;+1;CHAN1;-2.50000E-03\r\n> ', [b'MAIN', b'+1', b'CHAN1', b'-2.50000E-03']),
+    (b':TIM:POS?\r\n+9.9E+37\r\n> ', [b'+9.9E+37']),   # echoed line before the reply
+    (b'1;;3\r\n> ', [b'1', b'', b'3']),
+    (b';\r\n> ', [b'', b'']),
+    (b'\r\n> ', [b'']),
+]
+
+NUMBERS = [
+    (b'+5.00000E+00', 5.0),
+    (b'-2.50000E-03', -2.5e-3),
+    (b'+2.5E-04', 2.5e-4),
+    (b'1.25e3', 1250.0),
+    (b'-0.125', -0.125),
+    (b'+9.9E+37', 9.9e37),   # the scope's "no value"
+    (b'+8', 8),
+    (b'-3', -3),
+    (b'0', 0),
+]
+
+
+@pytest.mark.parametrize("reply, expected", FIELDS)
+def test_reply_fields(reply, expected):
+    fields = reply_fields(reply)
+    assert [bytes(f) for f in fields] == expected
+    assert all(isinstance(f, memoryview) for f in fields)
+
+
+@pytest.mark.parametrize("text, expected", NUMBERS)
+def test_parse_number(text, expected):
+    value = parse_number(memoryview(text))
+    assert value == expected
+    assert type(value) is type(expected)
+    assert value == float(text.decode())
+    assert parse_number(text) == value
+
+
+def test_compound_reply_numbers():
+    reply = b'+1.00000E-03;-2.50000E-04;+9.9E+37;+8\r\n> '
+    values = [parse_number(f) for f in reply_fields(reply)]
+    assert values == [1e-3, -2.5e-4, 9.9e37, 8]
+    assert values == [float(t) for t in reply[:-len(b'\r\n> ')].decode().split(';')]
+
+
+def test_parse_number_rejects_an_empty_field():
+    with pytest.raises(ValueError):
+        parse_number(reply_fields(b'1;;3\r\n> ')[1])
+
+
+def test_parse_enum_and_bool():
+    mode, empty, run, stop = reply_fields(b'MAIN;;1;0\r\n> ')
+    assert parse_enum(mode) == b'MAIN'
+    assert type(parse_enum(mode)) is bytes
+    assert parse_enum(empty) == b''
+    assert parse_bool(run) and not parse_bool(stop)
+    assert not parse_bool(empty)
+
+
+@pytest.mark.parametrize("text, base, exp", [
+    (b'+5.00000E+00', b'+5.00000', b'+00'),
+    (b'-2.0e-3', b'-2.0', b'-3'),
+    (b'+1', b'+1', b'+0'),
+])
+def test_split_exponent(text, base, exp):
+    b, e = split_exponent(memoryview(text))
+    assert (bytes(b), bytes(e)) == (base, exp)
+
+
+@pytest.mark.parametrize("num, is_integer, expected", [
+    (5, False, b'+5'),
+    (2.5, False, b'+2.5'),
+    (5 * 2 / 10, False, b'+1'),
+    (0.1 + 0.2, False, b'+0.3'),   # stepping drift is dropped
+    (-0.125, False, b'-0.125'),
+    (-3, True, b'-3'),
+    (-3.5, True, b'-4'),
+    (2.0, True, b'+2'),
+])
+def test_format_number(num, is_integer, expected):
+    assert format_number(num, is_integer) == expected
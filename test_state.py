@@ -0,0 +1,78 @@
+# Subsystem replies are parsed without a round trip to the scope, so the
+# parse times per header are parse times; what depends on them, the EXT
+# trigger range and the cursor position, is queried after parsing
+# knob steps keep the value they send, so the model matches the scope and
+# turning out and back lands on exactly 0
+
+import scope
+
+SETTINGS = b':MARK:MODE MAN;:MARK:X1P 2.5E-04s;:TRIG:EDGE:SOUR EXT;:EXT:RANG 8V\r\n'
+DEFAULTS = b':MARK:MODE OFF;:MARK:X1P 0s;:TRIG:EDGE:SOUR CHAN1;:EXT:RANG 5V\r\n'
+
+
+class NoTransport:
+
+    def __getattr__(self, name):
+        raise AssertionError("set_state asked the scope for " + name)
+
+
+def test_set_state_only_parses(panel, monkeypatch):
+    trigger = scope.App.Scope.Trigger
+    cursor = scope.App.Scope.Cursor
+    saved = trigger.source, trigger.source_range, cursor.mode
+    monkeypatch.setattr(scope.App, "Transport", NoTransport())
+    try:
+        trigger.set_state(scope.reply_fields(b'0;EDGE;AUTO;EXT;+1.00000E+00\r\n> '))
+        assert trigger.source == b'EXT'
+        cursor.set_state(scope.reply_fields(b'MAN;CHAN1;CHAN2\r\n> '))
+        assert cursor.mode == b'MAN'
+
+        trigger.set_state(scope.reply_fields(b'0;EDGE;AUTO;CHAN2;+0.00000E+00\r\n> '))
+        assert trigger.source_range == scope.App.Scope.Channel2.channel_range
+    finally:
+        trigger.source, trigger.source_range, cursor.mode = saved
+
+
+def test_get_state_queries_ext_range_and_cursor_position(panel):
+    state = scope.App.Scope
+    scope.send_cmd(SETTINGS)
+    try:
+        state.get_state()
+        assert state.Trigger.source == b'EXT'
+        assert state.Trigger.source_range == 8
+        assert state.Cursor.mode == b'MAN'
+        assert state.Cursor.cursor_position == 2.5e-4
+    finally:
+        scope.send_cmd(DEFAULTS)
+        state.get_state()
+    assert state.Trigger.source_range == state.Channel1.channel_range
+
+
+def knob_steps(cw, ccw, steps):
+    # turns out with steps, accelerated detents included, then back one at a time
+    for n in steps:
+        cw(n)
+    for n in range(sum(steps)):
+        ccw()
+
+
+def test_delay_out_and_back_is_zero(panel):
+    timebase = scope.App.Scope.Timebase
+    knob_steps(timebase.cw_delay, timebase.ccw_delay, [1] * 30)
+    assert timebase.position == 0
+    knob_steps(timebase.ccw_delay, timebase.cw_delay, [1, 3, 7, 2, 1, 11])
+    assert timebase.position == 0
+    assert scope.query_number(b':TIM:POS?\r\n') == 0
+
+
+def test_offset_model_matches_scope(panel):
+    channel = scope.App.Scope.Channel1
+    try:
+        for n in range(1, 30):
+            channel.cw_offset(n % 4 + 1)
+        assert scope.query_number(b':CHAN1:OFFS?\r\n') == channel.offset
+        knob_steps(channel.ccw_offset, channel.cw_offset, [1] * 17)
+        assert scope.query_number(b':CHAN1:OFFS?\r\n') == channel.offset
+    finally:
+        channel.zero_offset()
+    assert channel.offset == 0